@@ -161,13 +161,11 @@ async def get_active_shockwaves():
             if df.empty:
                 raise Exception("資料檔案為空")
             
-            # 4. 使用檢測器進行衝擊波分析
+            # 4. 使用檢測器進行衝擊波分析（整體穩定排序一次，各站點區塊已依時間排序）
             detected_shocks = []
-            stations = df['station'].unique()
+            sorted_df = df.sort_values(['station', 'hour', 'minute'], kind='mergesort', ignore_index=True)
             
-            for station in stations:
-                station_data = df[df['station'] == station].sort_values(['hour', 'minute'])
-                
+            for station, station_data in sorted_df.groupby('station', sort=False):
                 if len(station_data) >= 3:  # 至少需要3個資料點
                     try:
                         # 檢測該站點的衝擊波
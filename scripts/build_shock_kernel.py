@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Highway Traffic System - Shock Kernel AOT Build Script
+高速公路交通系統 - 震波掃描核心預先編譯腳本
+
+以 numba.pycc 將檢測器的震波點對掃描核心（_scan_pair_range，與 JIT 版本共用同一份實作）
+編譯為原生擴充模組，輸出至 src/detection/。修改掃描條件後需重新執行本腳本。
+FinalOptimizedShockDetector 會優先載入此模組，CLI 每次啟動不必再等待 JIT 編譯。
+未建置或載入失敗時，檢測器自動回退到 JIT / NumPy 版本。
+
+注意：numba.pycc 已被 numba 標記為棄用，將於後續版本移除；屆時本腳本無法建置，
+檢測器仍會回退到 JIT / NumPy 版本，檢測結果不受影響。
+
+使用方式:
+    python scripts/build_shock_kernel.py
+"""
+
+import os
+import sys
+
+try:
+    from numba.pycc import CC
+except ImportError:
+    print("❌ 需要 numba（且版本仍提供 numba.pycc）才能建置預編譯核心")
+    sys.exit(1)
+
+OUTPUT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src', 'detection')
+
+sys.path.insert(0, os.path.abspath(OUTPUT_DIR))
+from final_optimized_detector import _scan_pair_range  # noqa: E402
+
+cc = CC('_shock_kernel')
+cc.output_dir = os.path.abspath(OUTPUT_DIR)
+
+
+# scan(speed, time_of_day, start, end, smin, smax, ismin, gmax, indices, levels, offset) -> 命中數
+cc.export('scan', 'i8(f8[::1], i8[::1], i8, i8, f8[::1], f8[::1], f8[::1], f8[::1], i8[::1], i8[::1], i8)')(
+    _scan_pair_range
+)
+
+
+def main():
+    print("🔧 編譯震波掃描核心...")
+    cc.compile()
+    print(f"✅ 已輸出至 {cc.output_dir}")
+
+
+if __name__ == '__main__':
+    main()
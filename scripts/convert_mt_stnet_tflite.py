@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Highway Traffic System - MT-STNet TFLite INT8 Conversion Script
+高速公路交通系統 - MT-STNet 模型 INT8 TFLite 轉換腳本
+
+將匯出的 MT-STNet SavedModel 以代表性資料集做全整數量化，輸出 INT8 TFLite 模型至
+src/models/mt_stnet/weights/。MTSTNetRealtimePredictor 會優先載入此檔案，
+以 tf.lite.Interpreter 取代完整 TensorFlow 推論。
+
+代表性資料取自 data/Taiwan/train.csv，依訓練時相同方式正規化為 [1, 12, 62, 3] 的 float32 輸入。
+
+使用方式:
+    python scripts/convert_mt_stnet_tflite.py --saved-model path/to/saved_model
+"""
+
+import argparse
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+try:
+    import tensorflow as tf
+except ImportError:
+    print("❌ 需要 TensorFlow 才能轉換模型")
+    sys.exit(1)
+
+PROJECT_ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+TRAIN_FILE = os.path.join(PROJECT_ROOT, 'data', 'Taiwan', 'train.csv')
+OUTPUT_FILE = os.path.join(PROJECT_ROOT, 'src', 'models', 'mt_stnet', 'weights', 'mt_stnet_int8.tflite')
+
+INPUT_LENGTH = 12
+SITE_NUM = 62
+FEATURE_COLUMNS = ['flow', 'median_speed', 'avg_travel_time']
+
+
+def build_representative_dataset(train_file, num_samples=200, seed=0):
+    """從訓練資料抽樣時間視窗，產生代表性資料集產生器"""
+    df = pd.read_csv(train_file)
+    total_steps = len(df) // SITE_NUM
+
+    # 缺少特徵欄位時不可補零，否則量化範圍會以常數0校準
+    missing = [col for col in FEATURE_COLUMNS if col not in df.columns]
+    if missing:
+        raise ValueError(f"訓練資料缺少特徵欄位: {', '.join(missing)}")
+
+    # train.csv 以時間為主序排列，每個時間步包含 SITE_NUM 筆站點資料
+    features = np.empty((total_steps, SITE_NUM, len(FEATURE_COLUMNS)), dtype=np.float32)
+    for k, col in enumerate(FEATURE_COLUMNS):
+        features[:, :, k] = df[col].to_numpy(dtype=np.float32)[:total_steps * SITE_NUM].reshape(total_steps, SITE_NUM)
+
+    # 與預測器相同：只正規化流量
+    flow = features[:, :, 0]
+    features[:, :, 0] = (flow - flow.mean()) / flow.std()
+
+    rng = np.random.default_rng(seed)
+    starts = rng.integers(0, total_steps - INPUT_LENGTH, size=num_samples)
+
+    def representative_data_gen():
+        for start in starts:
+            yield [features[None, start:start + INPUT_LENGTH]]
+
+    return representative_data_gen
+
+
+def convert(saved_model_dir, output_file, num_samples):
+    """執行全整數量化轉換"""
+    converter = tf.lite.TFLiteConverter.from_saved_model(saved_model_dir)
+    converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    converter.representative_dataset = build_representative_dataset(TRAIN_FILE, num_samples)
+    converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+    converter.inference_input_type = tf.int8
+    converter.inference_output_type = tf.int8
+
+    tflite_model = converter.convert()
+
+    os.makedirs(os.path.dirname(output_file), exist_ok=True)
+    with open(output_file, 'wb') as f:
+        f.write(tflite_model)
+
+    return len(tflite_model)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='MT-STNet INT8 TFLite 轉換')
+    parser.add_argument('--saved-model', required=True, help='由 checkpoint 匯出的 SavedModel 目錄')
+    parser.add_argument('--output', default=OUTPUT_FILE, help='輸出的 .tflite 檔案路徑')
+    parser.add_argument('--samples', type=int, default=200, help='代表性資料樣本數')
+    args = parser.parse_args()
+
+    if not os.path.exists(TRAIN_FILE):
+        print(f"❌ 找不到訓練資料: {TRAIN_FILE}")
+        sys.exit(1)
+
+    print("🔧 轉換 MT-STNet 為 INT8 TFLite...")
+    size = convert(args.saved_model, args.output, args.samples)
+    print(f"✅ 已輸出至 {os.path.abspath(args.output)} ({size / 1024:.1f} KB)")
+
+
+if __name__ == '__main__':
+    main()
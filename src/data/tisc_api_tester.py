@@ -2,7 +2,6 @@
 # -*- coding: utf-8 -*-
 
 import os
-import time
 import requests
 import pandas as pd
 import numpy as np
@@ -58,12 +57,17 @@ class ProductionRealtimeSystem:
         self.max_file_age_hours = 24      # 保留24小時的檔案
         self.max_log_age_days = 1         # 保留7天的日誌
         
-        # 記憶體管理
+        # 寫檔參數
+        self.save_flush_every = 1         # 每N次收集合併寫入一個CSV（1 = 每次寫入，供即時讀取端使用）
+        self._pending_frames = []
+        
+        # 記憶體管理 (每站點一個DataFrame)
         self.data_buffer = {}
         self.buffer_max_points = 24       # 記憶體中保留2小時資料
         
         # 系統狀態
         self.is_running = False
+        self._stop = threading.Event()  # 可中斷的等待與網路呼叫
         self.collection_count = 0
         self.last_successful_collection = None
         
@@ -123,7 +127,12 @@ class ProductionRealtimeSystem:
     def _signal_handler(self, signum, frame):
         """信號處理器 - 優雅關閉"""
         self.logger.info(f"收到信號 {signum}，準備優雅關閉...")
+        self.stop()
+
+    def stop(self):
+        """停止監控並喚醒所有等待中的迴圈"""
         self.is_running = False
+        self._stop.set()
 
     def download_csv_data(self, url, retries=2, wait=1):
         """下載CSV資料"""
@@ -150,7 +159,8 @@ class ProductionRealtimeSystem:
                 
             except Exception as e:
                 if i < retries:
-                    time.sleep(wait)
+                    if self._stop.wait(wait):
+                        break
                 else:
                     self.logger.warning(f"下載失敗: {url} - {e}")
         
@@ -175,6 +185,9 @@ class ProductionRealtimeSystem:
         self.logger.info(f"開始搜尋最新可用資料，從 {current_adjusted.strftime('%H:%M')} 開始往前找...")
         
         for i, test_time in enumerate(search_times):
+            if self._stop.is_set():
+                break
+            
             test_url = self._build_test_url(test_time)
             
             try:
@@ -222,6 +235,9 @@ class ProductionRealtimeSystem:
             code_data = []
             
             for i in range(time_points_needed):
+                if self._stop.is_set():
+                    break
+                
                 point_time = target_time - timedelta(minutes=i*5)
                 point_data = self._fetch_single_timepoint(code, point_time)
                 
@@ -251,9 +267,10 @@ class ProductionRealtimeSystem:
         
         df = self.download_csv_data(url)
         if not df.empty:
-            df['download_time'] = point_time.replace(minute=minute_int, second=0, microsecond=0)
-            df['data_hour'] = int(hour_str)
-            df['data_minute'] = minute_int
+            # 每個檔案的時間為常數，以較小的dtype儲存以減少合併後的記憶體
+            df['download_time'] = pd.Timestamp(point_time.replace(minute=minute_int, second=0, microsecond=0))
+            df['data_hour'] = np.int8(int(hour_str))
+            df['data_minute'] = np.int8(minute_int)
         
         return df
 
@@ -269,6 +286,11 @@ class ProductionRealtimeSystem:
         
         processed_records = []
         
+        # 迴圈不變量：每次呼叫只計算一次
+        today_str = datetime.now().strftime('%Y/%m/%d')
+        target_gantries = pd.Index(self.target_gantries)
+        vtype_arr = np.fromiter(self.vehicle_types.keys(), dtype=np.int16)
+        
         # 處理M05A和M04A資料
         for data, data_type in [(m05a_data, 'M05A'), (m04a_data, 'M04A')]:
             if data.empty:
@@ -276,8 +298,8 @@ class ProductionRealtimeSystem:
             
             # 只保留目標門架
             target_data = data[
-                data['GantryFrom'].isin(self.target_gantries) | 
-                data['GantryTo'].isin(self.target_gantries)
+                data['GantryFrom'].isin(target_gantries) | 
+                data['GantryTo'].isin(target_gantries)
             ]
             
             if target_data.empty:
@@ -285,7 +307,7 @@ class ProductionRealtimeSystem:
             
             # 按門架和時間分組處理
             for gantry_col in ['GantryFrom', 'GantryTo']:
-                gantry_data = target_data[target_data[gantry_col].isin(self.target_gantries)]
+                gantry_data = target_data[target_data[gantry_col].isin(target_gantries)]
                 
                 for (gantry, hour, minute), group in gantry_data.groupby([gantry_col, 'data_hour', 'data_minute']):
                     
@@ -303,7 +325,7 @@ class ProductionRealtimeSystem:
                         
                         record = {
                             'station': gantry,
-                            'date': datetime.now().strftime('%Y/%m/%d'),
+                            'date': today_str,
                             'hour': hour,
                             'minute': minute,
                             'flow': total_weighted_flow,
@@ -313,7 +335,7 @@ class ProductionRealtimeSystem:
                         
                     else:  # M04A
                         valid_data = group[
-                            (group['VehicleType'].isin(self.vehicle_types)) &
+                            (group['VehicleType'].isin(vtype_arr)) &
                             (group['TravelTime'] > 0) & 
                             (group['VehicleCount'] > 0)
                         ]
@@ -325,7 +347,7 @@ class ProductionRealtimeSystem:
                             
                             record = {
                                 'station': gantry,
-                                'date': datetime.now().strftime('%Y/%m/%d'),
+                                'date': today_str,
                                 'hour': hour,
                                 'minute': minute,
                                 'flow': 0,
@@ -377,10 +399,27 @@ class ProductionRealtimeSystem:
             return 1.0
 
     def save_data(self, processed_data):
-        """保存處理後的資料"""
+        """保存處理後的資料（累積 save_flush_every 次後一次寫入）"""
         if processed_data.empty:
             return None
         
+        self._pending_frames.append(processed_data)
+        if len(self._pending_frames) < self.save_flush_every:
+            return None
+        
+        return self.flush_pending_data()
+
+    def flush_pending_data(self):
+        """將累積的資料合併寫入單一CSV檔案"""
+        if not self._pending_frames:
+            return None
+        
+        if len(self._pending_frames) == 1:
+            processed_data = self._pending_frames[0]
+        else:
+            processed_data = pd.concat(self._pending_frames, ignore_index=True)
+        self._pending_frames = []
+        
         # 使用資料的實際時間範圍作為檔案名稱
         if not processed_data.empty:
             min_hour = processed_data['hour'].min()
@@ -413,21 +452,16 @@ class ProductionRealtimeSystem:
             return
         
         current_time = datetime.now()
+        new_data = new_data.assign(buffer_timestamp=current_time)
         
-        for station in new_data['station'].unique():
-            if station not in self.data_buffer:
-                self.data_buffer[station] = []
-            
-            station_new_data = new_data[new_data['station'] == station]
-            for _, row in station_new_data.iterrows():
-                self.data_buffer[station].append({
-                    'timestamp': current_time,
-                    'data': row.to_dict()
-                })
+        # 每站點保留一個依到達順序排列的DataFrame，避免每次查詢時重建
+        for station, station_new_data in new_data.groupby('station', sort=False):
+            existing = self.data_buffer.get(station)
+            if existing is not None and not existing.empty:
+                station_new_data = pd.concat([existing, station_new_data], ignore_index=True)
             
-            # 限制緩衝大小
-            if len(self.data_buffer[station]) > self.buffer_max_points:
-                self.data_buffer[station] = self.data_buffer[station][-self.buffer_max_points:]
+            # 限制緩衝大小（保留最新到達的記錄；跨午夜時不可依時分截斷）
+            self.data_buffer[station] = station_new_data.tail(self.buffer_max_points).reset_index(drop=True)
 
     def cleanup_old_files(self):
         """清理舊檔案"""
@@ -509,6 +543,7 @@ class ProductionRealtimeSystem:
         self.logger.info(f"清理頻率: 每 {self.cleanup_frequency} 次收集")
         
         self.is_running = True
+        self._stop.clear()
         
         try:
             while self.is_running:
@@ -519,7 +554,8 @@ class ProductionRealtimeSystem:
                 # 檢查連續失敗次數
                 if self.consecutive_failures >= self.max_consecutive_failures:
                     self.logger.error(f"連續失敗 {self.consecutive_failures} 次，暫停10分鐘")
-                    time.sleep(600)  # 暫停10分鐘
+                    if self._stop.wait(600):  # 暫停10分鐘，收到停止信號時立即返回
+                        break
                     self.consecutive_failures = 0
                 
                 # 執行資料收集
@@ -541,28 +577,22 @@ class ProductionRealtimeSystem:
                 # 等待下次收集
                 if self.is_running:
                     self.logger.info(f"等待 {self.collection_interval} 分鐘...")
-                    time.sleep(self.collection_interval * 60)
+                    if self._stop.wait(self.collection_interval * 60):
+                        break
                     
         except KeyboardInterrupt:
             self.logger.info("收到中斷信號")
         finally:
+            self.flush_pending_data()
             self.logger.info("監控已停止")
             self.is_running = False
 
     def get_shock_detection_data(self, station, min_points=6):
         """為震波檢測提供資料"""
-        if station not in self.data_buffer:
-            return pd.DataFrame()
-        
-        buffer_records = []
-        for item in self.data_buffer[station]:
-            record = item['data'].copy()
-            record['buffer_timestamp'] = item['timestamp']
-            buffer_records.append(record)
+        station_data = self.data_buffer.get(station)
         
-        if len(buffer_records) >= min_points:
-            df = pd.DataFrame(buffer_records)
-            return df.sort_values(['hour', 'minute'])
+        if station_data is not None and len(station_data) >= min_points:
+            return station_data.sort_values(['hour', 'minute'], kind='mergesort')
         
         return pd.DataFrame()
 
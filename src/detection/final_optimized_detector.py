@@ -1,14 +1,182 @@
+import bisect
+from collections import Counter, OrderedDict
+from dataclasses import dataclass
 import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
 from datetime import datetime, timedelta
+from statistics import fmean
 import warnings
 warnings.filterwarnings('ignore')
 
+try:
+    from numba import njit, prange
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+
+# 預編譯核心（scripts/build_shock_kernel.py 產生），可避免CLI每次啟動的JIT編譯
+try:
+    if __package__:
+        from ._shock_kernel import scan as _aot_scan
+    else:
+        # 直接於 src/detection 以腳本執行時沒有上層套件，改由模組所在目錄（sys.path）載入
+        from _shock_kernel import scan as _aot_scan
+    AOT_KERNEL_AVAILABLE = True
+except ImportError:
+    AOT_KERNEL_AVAILABLE = False
+
+try:
+    import polars as pl
+    POLARS_AVAILABLE = True
+except ImportError:
+    POLARS_AVAILABLE = False
+
 # 設定中文字體
 plt.rcParams['font.sans-serif'] = ['Arial Unicode MS', 'SimHei', 'DejaVu Sans']
 plt.rcParams['axes.unicode_minus'] = False
 
+
+def _scan_shock_pairs_numpy(speed, time_of_day, smin, smax, ismin, gmax):
+    """以NumPy遮罩掃描相鄰點對，回傳 (點對索引, 等級索引)"""
+    speed_drop = speed[:-1] - speed[1:]
+    time_gap = np.abs(time_of_day[1:] - time_of_day[:-1])
+    initial_speed = speed[:-1]
+    
+    indices = []
+    levels = []
+    for level_idx in range(len(smin)):
+        mask = (
+            (time_gap <= gmax[level_idx]) &
+            (speed_drop >= smin[level_idx]) &
+            (speed_drop <= smax[level_idx]) &
+            (initial_speed >= ismin[level_idx])
+        )
+        hits = np.flatnonzero(mask)
+        indices.append(hits)
+        levels.append(np.full(len(hits), level_idx, dtype=np.int64))
+    
+    return np.concatenate(indices), np.concatenate(levels)
+
+
+def _scan_pair_range(speed, time_of_day, start, end, smin, smax, ismin, gmax, indices, levels, offset):
+    """掃描 [start, end) 區段內的相鄰點對與所有等級，命中寫入 indices/levels[offset:]，回傳命中數
+    
+    JIT 單站、JIT 平行批次與 scripts/build_shock_kernel.py 的預編譯模組共用此核心；
+    寫入的點對索引相對於 start
+    """
+    n_levels = smin.shape[0]
+    count = 0
+    
+    for i in range(end - start - 1):
+        speed_drop = speed[start + i] - speed[start + i + 1]
+        time_gap = abs(time_of_day[start + i + 1] - time_of_day[start + i])
+        
+        for level_idx in range(n_levels):
+            if (time_gap <= gmax[level_idx] and
+                    speed_drop >= smin[level_idx] and
+                    speed_drop <= smax[level_idx] and
+                    speed[start + i] >= ismin[level_idx]):
+                indices[offset + count] = i
+                levels[offset + count] = level_idx
+                count += 1
+    
+    return count
+
+
+if NUMBA_AVAILABLE:
+    # 編譯結果快取於 __pycache__，以套件（src.detection）或腳本方式匯入皆可重用
+    _scan_pair_range_jit = njit(cache=True)(_scan_pair_range)
+    
+    @njit(cache=True)
+    def _scan_shock_pairs_jit(speed, time_of_day, smin, smax, ismin, gmax):
+        """單次掃描所有相鄰點對與所有等級，回傳 (點對索引, 等級索引)"""
+        capacity = max(speed.shape[0] - 1, 0) * smin.shape[0]
+        indices = np.empty(capacity, dtype=np.int64)
+        levels = np.empty(capacity, dtype=np.int64)
+        count = _scan_pair_range_jit(speed, time_of_day, 0, speed.shape[0],
+                                     smin, smax, ismin, gmax, indices, levels, 0)
+        return indices[:count], levels[:count]
+    
+    @njit(parallel=True, cache=True)
+    def _scan_all_stations_jit(speed, time_of_day, bounds, smin, smax, ismin, gmax):
+        """各站點獨立，以prange平行掃描；回傳每站的 (站內點對索引, 等級索引, 命中數)
+        
+        每個站點寫入自己的區段（起點為 bounds[k] * 等級數），執行緒之間不共享寫入位置
+        """
+        n_levels = smin.shape[0]
+        n_stations = bounds.shape[0] - 1
+        indices = np.empty(speed.shape[0] * n_levels, dtype=np.int64)
+        levels = np.empty(speed.shape[0] * n_levels, dtype=np.int64)
+        counts = np.zeros(n_stations, dtype=np.int64)
+        
+        for k in prange(n_stations):
+            counts[k] = _scan_pair_range_jit(speed, time_of_day, bounds[k], bounds[k + 1],
+                                             smin, smax, ismin, gmax,
+                                             indices, levels, bounds[k] * n_levels)
+        
+        return indices, levels, counts
+    
+    _scan_shock_pairs = _scan_shock_pairs_jit
+else:
+    _scan_shock_pairs = _scan_shock_pairs_numpy
+
+
+def _scan_shock_pairs_aot(speed, time_of_day, smin, smax, ismin, gmax):
+    """呼叫預編譯核心，回傳 (點對索引, 等級索引)"""
+    capacity = max(len(speed) - 1, 0) * len(smin)
+    indices = np.empty(capacity, dtype=np.int64)
+    levels = np.empty(capacity, dtype=np.int64)
+    count = _aot_scan(speed, time_of_day, 0, len(speed), smin, smax, ismin, gmax, indices, levels, 0)
+    return indices[:count], levels[:count]
+
+
+if AOT_KERNEL_AVAILABLE:
+    _scan_shock_pairs = _scan_shock_pairs_aot
+
+@dataclass
+class StationArrays:
+    """單一站點的欄位陣列（struct-of-arrays），作為檢測器的輸入邊界型別"""
+    speed: np.ndarray
+    flow: np.ndarray
+    hour: np.ndarray
+    minute: np.ndarray
+    date: np.ndarray
+    # 與檢測標準無關的衍生欄位，由檢測器計算一次後重複使用
+    density: np.ndarray = None
+    time_of_day: np.ndarray = None
+    hhmm: np.ndarray = None
+
+    @classmethod
+    def from_dataframe(cls, df):
+        """每個欄位只做一次 to_numpy()；速度與流量保留 float64 原值"""
+        n = len(df)
+        return cls(
+            speed=df['median_speed'].to_numpy(dtype=np.float64),
+            flow=df['flow'].to_numpy(dtype=np.float64),
+            # 時分欄位可能為 int8，先轉 int64 再做 hour*60+minute 等運算以免溢位
+            hour=df['hour'].to_numpy(dtype=np.int64) if 'hour' in df else np.zeros(n, dtype=np.int64),
+            minute=df['minute'].to_numpy(dtype=np.int64) if 'minute' in df else np.zeros(n, dtype=np.int64),
+            date=df['date'].to_numpy() if 'date' in df else np.full(n, '', dtype=object)
+        )
+
+    def __len__(self):
+        return len(self.speed)
+
+    def slice(self, start, end):
+        """取出 [start, end) 區段（NumPy視圖，不複製）"""
+        return StationArrays(
+            speed=self.speed[start:end],
+            flow=self.flow[start:end],
+            hour=self.hour[start:end],
+            minute=self.minute[start:end],
+            date=self.date[start:end],
+            density=None if self.density is None else self.density[start:end],
+            time_of_day=None if self.time_of_day is None else self.time_of_day[start:end],
+            hhmm=None if self.hhmm is None else self.hhmm[start:end]
+        )
+
+
 class FinalOptimizedShockDetector:
     """
     最終優化版震波檢測器
@@ -53,106 +221,232 @@ class FinalOptimizedShockDetector:
                 'max_time_gap': 20          
             }
         }
+        
+        # 各等級門檻的平行陣列（索引與 self._levels 對應）
+        self.refresh_criteria()
+        
+        # 行程內LRU快取：相同站點、相同資料與相同標準時直接回傳先前結果
+        self.result_cache_size = 128
+        self._result_cache = OrderedDict()
 
-    # 🆕 新增方法：在 final_optimized_detector.py 最後加入
-    def _calculate_time_gap_minutes(self, data, idx1, idx2):
-        """計算兩個資料點之間的時間間隔（分鐘）"""
-        if idx1 >= len(data) or idx2 >= len(data):
-            return float('inf')
+    def _criteria_key(self):
+        """shock_criteria 目前內容的可雜湊表示"""
+        return tuple(
+            (level, tuple(sorted(criteria.items()))) for level, criteria in self.shock_criteria.items()
+        )
+    
+    def refresh_criteria(self):
+        """將 shock_criteria 轉為依等級索引的平行門檻陣列"""
+        criteria_list = list(self.shock_criteria.values())
+        self._levels = tuple(self.shock_criteria.keys())
+        self._smin = np.array([c['speed_drop_min'] for c in criteria_list], dtype=np.float64)
+        self._smax = np.array([c['speed_drop_max'] for c in criteria_list], dtype=np.float64)
+        self._ismin = np.array([c['initial_speed_min'] for c in criteria_list], dtype=np.float64)
+        self._gmax = np.array([c.get('max_time_gap', 10) for c in criteria_list], dtype=np.float64)
+        self._compiled_key = self._criteria_key()
+    
+    def _compile_criteria(self):
+        """取得門檻陣列；只有在 shock_criteria 被修改後才重建"""
+        criteria_key = self._criteria_key()
+        if criteria_key != self._compiled_key:
+            self.refresh_criteria()
+        
+        return (
+            self._compiled_key, self._levels,
+            self._smin, self._smax, self._ismin, self._gmax
+        )
+    
+    def _detect_gap_tolerant_shocks(self, arrays, compiled_criteria, hits=None):
+        """🆕 新增：容忍時間間隔的衝擊波檢測（所有等級單次掃描）
         
-        row1 = data.iloc[idx1]
-        row2 = data.iloc[idx2]
+        Args:
+            hits: 已由批次平行掃描取得的 (點對索引, 等級索引)，None 時在此掃描
+        """
+        speed, flow, density = arrays.speed, arrays.flow, arrays.density
+        time_of_day, hhmm = arrays.time_of_day, arrays.hhmm
+        _, levels, smin, smax, ismin, gmax = compiled_criteria
         
-        # 假設資料有hour和minute欄位，如果沒有需要從其他欄位解析
-        time1 = row1.get('hour', 0) * 60 + row1.get('minute', 0)
-        time2 = row2.get('hour', 0) * 60 + row2.get('minute', 0)
+        # 門檻比較一律在 float64 進行：float32 下 35.3-25.3 會恰好落在 10.0 門檻上而誤判命中
+        if hits is None:
+            scan_speed = np.ascontiguousarray(speed, dtype=np.float64)
+            hits = _scan_shock_pairs(scan_speed, time_of_day, smin, smax, ismin, gmax)
+        hit_indices, hit_levels = hits
+        
+        # 依等級順序輸出，與逐等級檢測的結果順序一致
+        order = np.lexsort((hit_indices, hit_levels))
+        
+        # 密度與波速整段向量化計算一次，命中點直接索引
+        wave_speeds = self._calculate_realistic_wave_speeds(density, speed)
         
-        return abs(time2 - time1)
-
-    def _detect_gap_tolerant_shocks(self, data, level, criteria):
-        """🆕 新增：容忍時間間隔的衝擊波檢測"""
         shocks = []
         
-        for i in range(len(data) - 1):
-            current = data.iloc[i]
-            next_point = data.iloc[i + 1]
+        for i, level_idx in zip(hit_indices[order].tolist(), hit_levels[order].tolist()):
+            time_gap = abs(int(time_of_day[i + 1]) - int(time_of_day[i]))
             
-            # 檢查時間間隔
-            time_gap = self._calculate_time_gap_minutes(data, i, i + 1)
+            # 計算其他指標（轉為Python float，方便JSON序列化）
+            initial_speed = float(speed[i])
+            final_speed = float(speed[i + 1])
+            initial_density = float(density[i])
+            final_density = float(density[i + 1])
+            density_change = final_density - initial_density
             
-            # 如果時間間隔在容忍範圍內
-            if time_gap <= criteria.get('max_time_gap', 10):
-                speed_drop = current['median_speed'] - next_point['median_speed']
-                
-                # 檢查是否符合衝擊波條件
-                if (speed_drop >= criteria['speed_drop_min'] and 
-                    speed_drop <= criteria['speed_drop_max'] and
-                    current['median_speed'] >= criteria['initial_speed_min']):
-                    
-                    # 計算其他指標
-                    initial_density = current['flow'] / max(current['median_speed'], 0.1)
-                    final_density = next_point['flow'] / max(next_point['median_speed'], 0.1)
-                    density_change = final_density - initial_density
-                    
-                    shock_event = {
-                        'level': level,
-                        'start_time': f"{current.get('hour', 0):02d}:{current.get('minute', 0):02d}",
-                        'end_time': f"{next_point.get('hour', 0):02d}:{next_point.get('minute', 0):02d}",
-                        'duration': time_gap,  # 實際時間間隔
-                        'speed_drop': speed_drop,
-                        'initial_speed': current['median_speed'],
-                        'final_speed': next_point['median_speed'],
-                        'initial_density': initial_density,
-                        'final_density': final_density,
-                        'density_increase': density_change,
-                        'max_flow': max(current['flow'], next_point['flow']),
-                        'min_flow': min(current['flow'], next_point['flow']),
-                        'start_idx': i,
-                        'end_idx': i + 1,
-                        'theoretical_wave_speed': self._calculate_realistic_wave_speed(
-                            initial_density, final_density, 
-                            current['median_speed'], next_point['median_speed']
-                        ),
-                        'time_gap': time_gap  # 🆕 記錄時間間隔
-                    }
-                    
-                    shocks.append(shock_event)
+            shock_event = {
+                'level': levels[level_idx],
+                'start_hhmm': int(hhmm[i]),
+                'end_hhmm': int(hhmm[i + 1]),
+                'duration': time_gap,  # 實際時間間隔
+                'speed_drop': initial_speed - final_speed,
+                'initial_speed': initial_speed,
+                'final_speed': final_speed,
+                'initial_density': initial_density,
+                'final_density': final_density,
+                'density_increase': density_change,
+                'max_flow': float(max(flow[i], flow[i + 1])),
+                'min_flow': float(min(flow[i], flow[i + 1])),
+                'start_idx': i,
+                'end_idx': i + 1,
+                'theoretical_wave_speed': float(wave_speeds[i]),
+                'time_gap': time_gap  # 🆕 記錄時間間隔
+            }
+            
+            shocks.append(shock_event)
         
         return shocks
     
     def calculate_density(self, flow, speed):
-        """計算密度"""
-        speed = np.where(speed <= 0.1, 0.1, speed)
-        return flow / speed
+        """計算密度（於速度副本上就地截斷與相除）"""
+        speed_arr = np.array(speed, dtype=np.float64)
+        np.maximum(speed_arr, 0.1, out=speed_arr)
+        return np.divide(np.asarray(flow, dtype=np.float64), speed_arr, out=speed_arr)
+    
+    def _prepare_arrays(self, station_data):
+        """將輸入轉為 StationArrays 並補上密度欄位"""
+        if isinstance(station_data, StationArrays):
+            arrays = station_data
+        else:
+            arrays = StationArrays.from_dataframe(station_data)
+        
+        if arrays.density is None:
+            arrays.density = self.calculate_density(arrays.flow, arrays.speed)
+        hour = arrays.hour.astype(np.int64, copy=False)
+        minute = arrays.minute.astype(np.int64, copy=False)
+        if arrays.time_of_day is None:
+            arrays.time_of_day = np.ascontiguousarray(hour * 60 + minute)
+        if arrays.hhmm is None:
+            arrays.hhmm = (hour * 100 + minute).astype(np.int16)  # 整數時間鍵，字串只在輸出時產生
+        return arrays
+    
+    def _result_cache_key(self, arrays, station_id, criteria_key):
+        """以站點代碼、資料內容雜湊與檢測標準組成快取鍵"""
+        # 以 float64 原值雜湊：float32 會讓只在低位數不同的資料共用同一筆快取結果
+        data_hash = hash((
+            np.ascontiguousarray(arrays.speed, dtype=np.float64).tobytes(),
+            np.ascontiguousarray(arrays.flow, dtype=np.float64).tobytes(),
+            arrays.time_of_day.tobytes()
+        ))
+        return (station_id, len(arrays), data_hash, criteria_key)
+    
+    def _detect_from_arrays(self, arrays, station_id=None, compiled_criteria=None, hits=None):
+        """對單一站點的欄位陣列執行檢測與去重（結果以LRU快取）"""
+        if compiled_criteria is None:
+            compiled_criteria = self._compile_criteria()
+        
+        key = self._result_cache_key(arrays, station_id, compiled_criteria[0])
+        cached = self._result_cache.get(key)
+        
+        if cached is None:
+            # 🆕 使用新的間隔容忍檢測方法（numba可用時以JIT核心掃描）
+            all_shocks = self._detect_gap_tolerant_shocks(arrays, compiled_criteria, hits)
+            
+            # 🔧 更寬鬆的去重邏輯
+            cached = self._remove_overlapping_shocks_relaxed(all_shocks)
+            
+            # 只為保留下來的事件格式化時間字串；整數時間鍵屬內部欄位，不隨結果輸出
+            for shock in cached:
+                shock['start_time'] = self._format_hhmm(shock.pop('start_hhmm'))
+                shock['end_time'] = self._format_hhmm(shock.pop('end_hhmm'))
+            self._result_cache[key] = cached
+            if len(self._result_cache) > self.result_cache_size:
+                self._result_cache.popitem(last=False)
+        else:
+            self._result_cache.move_to_end(key)
+        
+        # 呼叫端會在事件上附加欄位，回傳副本避免污染快取
+        return [dict(shock) for shock in cached]
     
     def detect_significant_shocks(self, station_data):
-        """檢測顯著震波事件 - 支援間隔資料"""
-        data = station_data.copy().reset_index(drop=True)
-        data['density'] = self.calculate_density(data['flow'], data['median_speed'])
+        """檢測顯著震波事件 - 支援間隔資料
+        
+        Args:
+            station_data: 單一站點的 DataFrame 或 StationArrays（已依時間排序）
+        """
+        arrays = self._prepare_arrays(station_data)
+        
+        station_id = None
+        if not isinstance(station_data, StationArrays) and 'station' in station_data and len(station_data) > 0:
+            station_id = station_data['station'].iat[0]
+        
+        filtered_shocks = self._detect_from_arrays(arrays, station_id)
+        
+        return self._format_shock_output(filtered_shocks, len(arrays))
+    
+    def detect_shocks_by_station(self, df):
+        """批次檢測所有站點：只排序一次，再依站點邊界切片送入掃描核心
+        
+        Returns:
+            dict: {站點代碼: 震波事件列表}
+        """
+        if df.empty:
+            return {}
+        
+        sort_cols = [col for col in ['station', 'date', 'hour', 'minute'] if col in df.columns]
+        data = df.sort_values(sort_cols, kind='mergesort')
+        
+        stations = data['station'].to_numpy()
+        arrays = self._prepare_arrays(data)
+        
+        # 站點邊界：排序後相鄰站點代碼不同之處
+        bounds = np.r_[0, np.flatnonzero(stations[1:] != stations[:-1]) + 1, len(stations)]
         
-        # 🔧 進一步減少平滑化，保留真實變化
-        data['speed_smooth'] = data['median_speed'].rolling(window=2, center=False, min_periods=1).mean()
-        data['density_smooth'] = data['density'].rolling(window=2, center=False, min_periods=1).mean()
+        # 檢測標準在迴圈外解析一次
+        compiled_criteria = self._compile_criteria()
         
-        # 🔧 填充NaN值
-        data['speed_smooth'].fillna(data['median_speed'], inplace=True)
-        data['density_smooth'].fillna(data['density'], inplace=True)
+        # numba可用時，所有站點的點對掃描一次平行完成
+        station_hits = self._scan_all_stations(arrays, bounds, compiled_criteria)
         
-        all_shocks = []
+        results = {}
+        for k, (start, end) in enumerate(zip(bounds[:-1].tolist(), bounds[1:].tolist())):
+            results[stations[start]] = self._detect_from_arrays(
+                arrays.slice(start, end), stations[start], compiled_criteria,
+                station_hits[k] if station_hits is not None else None
+            )
         
-        # 🆕 使用新的間隔容忍檢測方法
-        for level, criteria in self.shock_criteria.items():
-            # 使用新的檢測方法
-            shocks = self._detect_gap_tolerant_shocks(data, level, criteria)
-            all_shocks.extend(shocks)
+        return results
+    
+    def _scan_all_stations(self, arrays, bounds, compiled_criteria):
+        """以平行核心掃描所有站點，回傳每站的 (點對索引, 等級索引)
+        
+        numba不可用，或已載入預編譯核心（避免觸發JIT編譯）時回傳 None，改由逐站掃描
+        """
+        if not NUMBA_AVAILABLE or AOT_KERNEL_AVAILABLE:
+            return None
         
-        # 🔧 更寬鬆的去重邏輯
-        filtered_shocks = self._remove_overlapping_shocks_relaxed(all_shocks)
+        _, _, smin, smax, ismin, gmax = compiled_criteria
+        speed = np.ascontiguousarray(arrays.speed, dtype=np.float64)
+        bounds = np.ascontiguousarray(bounds, dtype=np.int64)
+        
+        indices, levels, counts = _scan_all_stations_jit(
+            speed, arrays.time_of_day, bounds, smin, smax, ismin, gmax
+        )
         
-        return self._format_shock_output(filtered_shocks, data)
+        offsets = bounds[:-1] * len(smin)
+        return [
+            (indices[offset:offset + count], levels[offset:offset + count])
+            for offset, count in zip(offsets.tolist(), counts.tolist())
+        ]
 
     def _remove_overlapping_shocks_relaxed(self, shocks):
-        """🆕 更寬鬆的去重方法"""
+        """🆕 更寬鬆的去重方法（排序後以區間二分搜尋檢查重疊）"""
         if not shocks:
             return []
         
@@ -160,33 +454,38 @@ class FinalOptimizedShockDetector:
         sorted_shocks = sorted(shocks, key=lambda x: x['speed_drop'], reverse=True)
         
         filtered = []
-        used_times = set()
+        # 已保留事件的 [start_idx, end_idx] 區間，互不重疊且依起點排序
+        kept_starts = []
+        kept_ends = []
         
         for shock in sorted_shocks:
-            time_key = f"{shock['start_time']}-{shock['end_time']}"
+            start, end = shock['start_idx'], shock['end_idx']
+            pos = bisect.bisect_left(kept_starts, start)
             
-            # 檢查是否與已有的衝擊波時間重疊
-            overlap = False
-            for used_time in used_times:
-                if self._times_overlap(time_key, used_time):
-                    overlap = True
-                    break
+            # 檢查是否與已有的衝擊波時間重疊（只需比對左右相鄰區間）
+            if pos > 0 and self._intervals_overlap(start, end, kept_starts[pos - 1], kept_ends[pos - 1]):
+                continue
+            if pos < len(kept_starts) and self._intervals_overlap(start, end, kept_starts[pos], kept_ends[pos]):
+                continue
             
-            if not overlap:
-                filtered.append(shock)
-                used_times.add(time_key)
+            kept_starts.insert(pos, start)
+            kept_ends.insert(pos, end)
+            filtered.append(shock)
         
         return filtered
 
-    def _times_overlap(self, time1, time2):
-        """檢查兩個時間段是否重疊"""
-        # 簡單的字符串比較，您可以根據需要改進
-        return time1 == time2
+    def _intervals_overlap(self, start1, end1, start2, end2):
+        """檢查兩個時間段是否重疊（以資料點位置表示，跨日亦正確）"""
+        return start1 < end2 and start2 < end1
 
-    def _format_shock_output(self, shocks, data):
+    def _format_hhmm(self, hhmm):
+        """將 hour*100+minute 整數鍵格式化為 HH:MM"""
+        return f"{hhmm // 100:02d}:{hhmm % 100:02d}"
+
+    def _format_shock_output(self, shocks, n_points):
         """格式化輸出結果"""
         if not shocks:
-            print(f"未檢測到衝擊波 - 共分析 {len(data)} 個資料點")
+            print(f"未檢測到衝擊波 - 共分析 {n_points} 個資料點")
             return []
         
         print(f"🚨 檢測到 {len(shocks)} 個衝擊波:")
@@ -199,175 +498,6 @@ class FinalOptimizedShockDetector:
         
         return shocks
     
-    def _detect_strict_shocks(self, data, level, criteria):
-        """嚴格震波檢測"""
-        shocks = []
-        i = 0
-        
-        while i < len(data) - criteria['duration_min'] * 2:
-            # 更嚴格的觸發條件
-            if self._is_significant_shock_start(data, i, criteria):
-                
-                shock_analysis = self._analyze_shock_strictly(data, i, criteria)
-                
-                if shock_analysis['is_valid']:
-                    # 額外驗證：檢查震波是否符合物理特性
-                    if self._validate_shock_physics(shock_analysis):
-                        shock_event = {
-                            'level': level,
-                            'start_time': self._format_time(data.iloc[shock_analysis['start_idx']]),
-                            'end_time': self._format_time(data.iloc[shock_analysis['end_idx']]),
-                            'duration': shock_analysis['duration'] * 5,
-                            'speed_drop': shock_analysis['speed_drop'],
-                            'initial_speed': shock_analysis['initial_speed'],
-                            'final_speed': shock_analysis['final_speed'],
-                            'initial_density': shock_analysis['initial_density'],
-                            'final_density': shock_analysis['final_density'],
-                            'density_increase': shock_analysis['density_increase'],
-                            'avg_flow': shock_analysis['avg_flow'],
-                            'start_idx': shock_analysis['start_idx'],
-                            'end_idx': shock_analysis['end_idx'],
-                            'wave_speed': shock_analysis['wave_speed'],
-                            'shock_strength': shock_analysis['shock_strength']
-                        }
-                        
-                        shocks.append(shock_event)
-                        i = shock_analysis['end_idx'] + 5  # 跳過更多點避免重複
-                    else:
-                        i += 1
-                else:
-                    i += 1
-            else:
-                i += 1
-        
-        return shocks
-    
-    def _is_significant_shock_start(self, data, idx, criteria):
-        """檢查是否為顯著震波起始點 - 適應真實資料特性"""
-        if idx >= len(data) - 1:
-            return False
-        
-        current = data.iloc[idx]
-        
-        # 放寬基本條件：初始速度要求
-        if current['median_speed'] < criteria['initial_speed_min']:
-            return False
-        
-        # 🔧 簡化檢查：只需要下一個點有明顯速度下降即可
-        if idx + 1 < len(data):
-            next_point = data.iloc[idx + 1]
-            speed_drop = current['median_speed'] - next_point['median_speed']
-            
-            # 檢查是否有足夠的速度下降
-            if speed_drop >= criteria['speed_drop_min']:
-                return True
-        
-        # 如果有更多資料點，檢查接下來的趨勢
-        if idx + 2 < len(data):
-            next_points = data.iloc[idx:idx+3]
-            
-            # 檢查總體速度下降
-            total_drop = next_points.iloc[0]['median_speed'] - next_points.iloc[-1]['median_speed']
-            if total_drop >= criteria['speed_drop_min']:
-                return True
-        
-        return False
-    
-    def _analyze_shock_strictly(self, data, start_idx, criteria):
-        """嚴格分析震波"""
-        initial_speed = data.iloc[start_idx]['median_speed']
-        initial_density = data.iloc[start_idx]['density']
-        
-        best_shock = {'is_valid': False}
-        
-        # 限制分析範圍（最多40分鐘）
-        max_duration = min(8, len(data) - start_idx - 1)
-        
-        for duration in range(criteria['duration_min'], max_duration + 1):
-            end_idx = start_idx + duration
-            
-            if end_idx >= len(data):
-                break
-            
-            analysis = self._analyze_shock_window(data, start_idx, end_idx, criteria)
-            
-            if analysis['meets_strict_criteria']:
-                best_shock = analysis
-                best_shock['is_valid'] = True
-                # 繼續尋找最佳持續時間
-        
-        return best_shock
-    
-    def _analyze_shock_window(self, data, start_idx, end_idx, criteria):
-        """分析震波窗口"""
-        window_data = data.iloc[start_idx:end_idx+1]
-        
-        initial_speed = window_data.iloc[0]['median_speed']
-        final_speed = window_data.iloc[-1]['median_speed']
-        initial_density = window_data.iloc[0]['density']
-        final_density = window_data.iloc[-1]['density']
-        
-        speed_drop = initial_speed - final_speed
-        density_increase = final_density - initial_density
-        duration = end_idx - start_idx
-        
-        # 嚴格條件檢查
-        meets_criteria = (
-            speed_drop >= criteria['speed_drop_min'] and
-            speed_drop <= criteria['speed_drop_max'] and
-            density_increase >= criteria['density_increase_min'] and
-            duration >= criteria['duration_min'] and
-            initial_speed >= criteria['initial_speed_min'] and
-            final_speed > 10 and  # 最終速度不能太低
-            self._check_monotonic_trend(window_data)  # 檢查趨勢的一致性
-        )
-        
-        # 計算實際波速（參考文獻公式）
-        wave_speed = self._calculate_realistic_wave_speed(
-            initial_density, final_density, initial_speed, final_speed
-        )
-        
-        return {
-            'meets_strict_criteria': meets_criteria,
-            'start_idx': start_idx,
-            'end_idx': end_idx,
-            'duration': duration,
-            'speed_drop': speed_drop,
-            'initial_speed': initial_speed,
-            'final_speed': final_speed,
-            'initial_density': initial_density,
-            'final_density': final_density,
-            'density_increase': density_increase,
-            'avg_flow': window_data['flow'].mean(),
-            'wave_speed': wave_speed,
-            'shock_strength': speed_drop / initial_speed * 100  # 相對強度
-        }
-    
-    def _check_monotonic_trend(self, window_data):
-        """檢查震波的單調性 - 放寬條件適應真實資料"""
-        speeds = window_data['median_speed'].values
-        
-        if len(speeds) < 2:
-            return True  # 資料點太少時直接通過
-        
-        # 檢查是否有明顯的速度下降
-        speed_drop = speeds[0] - speeds[-1]
-        
-        # 如果總體下降超過10 km/h，就認為符合震波特徵
-        if speed_drop >= 10:
-            return True
-            
-        # 計算下降趨勢的一致性 - 放寬到40%
-        decreasing_count = 0
-        total_pairs = len(speeds) - 1
-        
-        for i in range(total_pairs):
-            if speeds[i] >= speeds[i+1]:
-                decreasing_count += 1
-        
-        # 降低到40%的點對顯示下降趨勢即可
-        return decreasing_count / total_pairs >= 0.4
-    
     def _calculate_realistic_wave_speed(self, rho_i, rho_f, u_i, u_f):
         """計算符合文獻的波速"""
         if abs(rho_f - rho_i) < 0.1:
@@ -383,74 +513,60 @@ class FinalOptimizedShockDetector:
         # 限制在合理範圍內（根據文獻）
         return max(-15, min(15, raw_speed))
     
-    def _validate_shock_physics(self, shock_analysis):
-        """驗證震波的物理合理性"""
-        # 檢查波速是否在合理範圍內
-        if abs(shock_analysis['wave_speed']) > 20:
-            return False
-        
-        # 檢查密度-速度關係
-        density_ratio = shock_analysis['final_density'] / shock_analysis['initial_density']
-        speed_ratio = shock_analysis['final_speed'] / shock_analysis['initial_speed']
-        
-        # 密度增加時速度應該下降
-        if density_ratio > 1.2 and speed_ratio > 0.95:
-            return False
-        
-        return True
-    
-    def _strict_filtering(self, shocks):
-        """嚴格過濾重複事件"""
-        if not shocks:
-            return []
-        
-        # 按時間排序
-        shocks = sorted(shocks, key=lambda x: x['start_idx'])
-        
-        filtered = []
-        severity_order = {'mild': 1, 'moderate': 2, 'severe': 3}
-        
-        for current in shocks:
-            # 檢查是否與已有事件時間太近
-            too_close = False
-            for existing in filtered:
-                time_gap = abs(current['start_idx'] - existing['end_idx'])
-                if time_gap < 6:  # 至少間隔30分鐘
-                    too_close = True
-                    break
-            
-            if not too_close:
-                filtered.append(current)
-        
-        return filtered
-    
-    def _format_time(self, row):
-        """格式化時間"""
-        return f"{row['date']} {row['hour']:02d}:{row['minute']:02d}"
+    def _calculate_realistic_wave_speeds(self, density, speed):
+        """向量化計算所有相鄰點對的波速（與 _calculate_realistic_wave_speed 相同規則）"""
+        rho_i, rho_f = density[:-1], density[1:]
+        flow_i = rho_i * speed[:-1]
+        flow_f = rho_f * speed[1:]
+        density_change = rho_f - rho_i
+        
+        with np.errstate(divide='ignore', invalid='ignore'):
+            raw_speed = (flow_f - flow_i) / density_change
+        
+        wave_speeds = np.clip(raw_speed, -15, 15)
+        wave_speeds[np.abs(density_change) < 0.1] = 0
+        return wave_speeds
     
     def calculate_final_statistics(self, shocks):
         """計算最終統計"""
         if not shocks:
             return {}
         
-        df = pd.DataFrame(shocks)
+        durations = [s['duration'] for s in shocks]
+        wave_speeds = [s['wave_speed'] for s in shocks]
         
         return {
             'total_events': len(shocks),
-            'by_level': df['level'].value_counts().to_dict(),
-            'avg_duration': df['duration'].mean(),
-            'avg_speed_drop': df['speed_drop'].mean(),
-            'avg_density_increase': df['density_increase'].mean(),
-            'avg_wave_speed': df['wave_speed'].mean(),
-            'avg_shock_strength': df['shock_strength'].mean(),
-            'wave_speed_range': (df['wave_speed'].min(), df['wave_speed'].max()),
-            'duration_range': (df['duration'].min(), df['duration'].max())
+            'by_level': dict(Counter(s['level'] for s in shocks).most_common()),
+            'avg_duration': fmean(durations),
+            'avg_speed_drop': fmean(s['speed_drop'] for s in shocks),
+            'avg_density_increase': fmean(s['density_increase'] for s in shocks),
+            'avg_wave_speed': fmean(wave_speeds),
+            'avg_shock_strength': fmean(s['shock_strength'] for s in shocks),
+            'wave_speed_range': (min(wave_speeds), max(wave_speeds)),
+            'duration_range': (min(durations), max(durations))
         }
 
+def load_detection_data(file_path):
+    """載入檢測用資料：polars可用時以多執行緒讀取並排序，否則使用pandas"""
+    columns = ['station', 'date', 'hour', 'minute', 'flow', 'median_speed']
+    
+    if POLARS_AVAILABLE:
+        frame = (
+            pl.scan_csv(file_path)
+            .select(columns)
+            .sort(['station', 'date', 'hour', 'minute'])
+            .collect()
+        )
+        # 數值欄位直接以NumPy陣列交給pandas，不需經過pyarrow
+        return pd.DataFrame({col: frame[col].to_numpy() for col in columns})
+    
+    return pd.read_csv(file_path, usecols=columns)
+
 def main():
     # 載入資料
     file_path = '../../data/Taiwan/train_enhanced_full.csv'
-    df = pd.read_csv(file_path)
+    df = load_detection_data(file_path)
     
     # 初始化最終優化檢測器
     detector = FinalOptimizedShockDetector()
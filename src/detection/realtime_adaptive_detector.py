@@ -1,13 +1,29 @@
+from collections import Counter
 import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
 from datetime import datetime, timedelta
-import warnings
-warnings.filterwarnings('ignore')
 
-# 設定中文字體
-plt.rcParams['font.sans-serif'] = ['Arial Unicode MS', 'SimHei', 'DejaVu Sans']
-plt.rcParams['axes.unicode_minus'] = False
+# 震波等級的嚴重程度排序
+SEVERITY_RANK = {'mild': 1, 'moderate': 2, 'severe': 3}
+
+# 候選震波事件的結構化陣列欄位（level 為 shock_criteria 中的等級索引），只在輸出時轉為字典
+SHOCK_DTYPE = np.dtype([
+    ('level', 'u1'),
+    ('level_rank', 'u1'),
+    ('start_idx', 'i4'),
+    ('end_idx', 'i4'),
+    ('speed_drop', 'f8'),
+    ('initial_speed', 'f8'),
+    ('final_speed', 'f8'),
+    ('initial_density', 'f8'),
+    ('final_density', 'f8'),
+    ('density_increase', 'f8'),
+    ('duration', 'i4'),
+    ('wave_speed', 'f8'),
+    ('max_flow', 'f8'),
+    ('min_flow', 'f8'),
+    ('time_gap', 'i4')
+])
 
 class RealtimeAdaptiveShockDetector:
     """
@@ -54,28 +70,19 @@ class RealtimeAdaptiveShockDetector:
             }
         }
 
-    def _calculate_time_gap_minutes(self, data, idx1, idx2):
-        """計算兩個資料點之間的時間間隔（分鐘）"""
-        if idx1 >= len(data) or idx2 >= len(data):
-            return float('inf')
-        
-        row1 = data.iloc[idx1]
-        row2 = data.iloc[idx2]
-        
-        # 計算時間差（分鐘）
-        time1 = row1['hour'] * 60 + row1['minute']
-        time2 = row2['hour'] * 60 + row2['minute']
-        
-        # 處理跨日情況
-        time_diff = time2 - time1
-        if time_diff < 0:
-            time_diff += 24 * 60  # 加一天
-        
-        return time_diff
+    def _calculate_time_gap_minutes(self, tmin_from, tmin_to):
+        """計算資料點之間的時間間隔（分鐘），可直接傳入 tmin 陣列"""
+        # 處理跨日情況（負值加一天）
+        return np.mod(tmin_to - tmin_from, 24 * 60)
 
-    def _parse_time_from_data(self, row):
-        """從資料行解析時間"""
-        return f"{row['hour']:02d}:{row['minute']:02d}"
+    def _format_times(self, data, idx):
+        """以向量化字串運算格式化多個資料點的時間（HH:MM）"""
+        if len(idx) == 0:
+            return []
+        
+        hours = np.char.zfill(data['hour'].to_numpy()[idx].astype(str), 2)
+        minutes = np.char.zfill(data['minute'].to_numpy()[idx].astype(str), 2)
+        return np.char.add(np.char.add(hours, ':'), minutes).tolist()
 
     def detect_realtime_shocks(self, station_data):
         """檢測即時震波事件 - 適應真實資料間隔"""
@@ -83,144 +90,209 @@ class RealtimeAdaptiveShockDetector:
         data['density'] = self.calculate_density(data['flow'], data['median_speed'])
         
         # 🔧 更輕度的平滑化（3點移動平均，而非7點）
-        data['speed_smooth'] = data['median_speed'].rolling(window=3, center=True, min_periods=1).mean()
-        data['density_smooth'] = data['density'].rolling(window=3, center=True, min_periods=1).mean()
+        data['speed_smooth'] = self._smooth(data['median_speed'].to_numpy(), 3)
+        data['density_smooth'] = self._smooth(data['density'].to_numpy(), 3)
         
-        all_shocks = []
+        density = data['density'].to_numpy()
+        tmin = data['hour'].to_numpy(dtype=np.int32) * 60 + data['minute'].to_numpy(dtype=np.int32)
+        level_names = tuple(self.shock_criteria)
         
-        for level, criteria in self.shock_criteria.items():
-            shocks = self._detect_gap_tolerant_shocks(data, level, criteria)
-            all_shocks.extend(shocks)
+        records = self._detect_gap_tolerant_shocks(data, density, tmin, level_names)
         
         # 輕度過濾，保留更多事件
-        filtered_shocks = self._light_filtering(all_shocks)
+        kept = self._light_filtering(records)
         
-        return filtered_shocks
+        return self._records_to_shocks(data, records[kept], level_names)
 
-    def _detect_gap_tolerant_shocks(self, data, level, criteria):
-        """容忍時間間隔的衝擊波檢測"""
+    def _smooth(self, values, window=3):
+        """置中移動平均（均勻核卷積）；邊界除以實際涵蓋的點數，等同 rolling(center=True, min_periods=1)"""
+        values = np.asarray(values, dtype=np.float32)
+        n = len(values)
+        if n == 0:
+            return values
+        
+        pad = (window - 1) // 2
+        kernel = np.ones(window, dtype=np.float32)
+        sums = np.convolve(values, kernel, mode='full')[pad:pad + n]
+        counts = np.convolve(np.ones(n, dtype=np.float32), kernel, mode='full')[pad:pad + n]
+        return sums / counts
+
+    def _detect_gap_tolerant_shocks(self, data, density, tmin, level_names):
+        """容忍時間間隔的衝擊波檢測（所有等級單次掃描，每個點對只取符合的最高等級）
+        
+        Args:
+            density: 已由 calculate_density 算好的密度陣列
+            tmin: 一天中的分鐘數 hour*60+minute
+            level_names: shock_criteria 的等級名稱（記錄中的 level 為其索引）
+        
+        Returns:
+            SHOCK_DTYPE 結構化陣列
+        """
+        speed = data['median_speed'].to_numpy(dtype=np.float64)
+        flow = data['flow'].to_numpy(dtype=np.float64)
+        
+        # 時間間隔（分鐘），跨日以加一天處理
+        time_gap = self._calculate_time_gap_minutes(tmin[:-1], tmin[1:])
+        
+        speed_drop = speed[:-1] - speed[1:]
+        initial_density = density[:-1]
+        final_density = density[1:]
+        density_change = final_density - initial_density
+        
+        masks = []
+        for level in level_names:
+            criteria = self.shock_criteria[level]
+            # 🔧 放寬密度增加要求
+            masks.append(
+                (time_gap <= criteria.get('max_time_gap', 15)) &
+                (speed_drop >= criteria['speed_drop_min']) &
+                (speed_drop <= criteria['speed_drop_max']) &
+                (speed[:-1] >= criteria['initial_speed_min']) &
+                ((density_change >= criteria['density_increase_min']) | (speed_drop >= 30))
+            )
+        
+        # 依嚴重程度由高到低選出每個點對符合的等級（過濾時較嚴重者本來就會取代較輕者）
+        level_ranks = np.array([SEVERITY_RANK[level] for level in level_names])
+        by_severity = np.argsort(-level_ranks, kind='stable').tolist()
+        pair_level = np.select([masks[k] for k in by_severity], by_severity, default=-1)
+        
+        # 只為符合條件的點對填入事件欄位
+        idx = np.flatnonzero(pair_level >= 0)
+        records = np.empty(len(idx), dtype=SHOCK_DTYPE)
+        records['level'] = pair_level[idx]
+        records['level_rank'] = level_ranks[pair_level[idx]]
+        records['start_idx'] = idx
+        records['end_idx'] = idx + 1
+        records['speed_drop'] = speed_drop[idx]
+        records['initial_speed'] = speed[idx]
+        records['final_speed'] = speed[idx + 1]
+        records['initial_density'] = initial_density[idx]
+        records['final_density'] = final_density[idx]
+        records['density_increase'] = density_change[idx]
+        records['duration'] = time_gap[idx]  # 實際時間間隔
+        records['wave_speed'] = self._calculate_realistic_wave_speeds(
+            initial_density[idx], final_density[idx], speed[idx], speed[idx + 1]
+        )
+        records['max_flow'] = np.maximum(flow[idx], flow[idx + 1])
+        records['min_flow'] = np.minimum(flow[idx], flow[idx + 1])
+        records['time_gap'] = time_gap[idx]
+        
+        return records
+    
+    def _records_to_shocks(self, data, records, level_names):
+        """將保留下來的結構化事件轉為輸出用字典"""
+        station = data['station'].iat[0] if 'station' in data.columns and len(data) > 0 else 'Unknown'
+        columns = {name: records[name].tolist() for name in SHOCK_DTYPE.names}
+        
+        # 時間字串只為保留下來的事件產生
+        start_times = self._format_times(data, records['start_idx'])
+        end_times = self._format_times(data, records['end_idx'])
+        
         shocks = []
         
-        for i in range(len(data) - 1):
-            current = data.iloc[i]
-            next_point = data.iloc[i + 1]
-            
-            # 檢查時間間隔
-            time_gap = self._calculate_time_gap_minutes(data, i, i + 1)
-            
-            # 如果時間間隔在容忍範圍內
-            if time_gap <= criteria.get('max_time_gap', 15):
-                speed_drop = current['median_speed'] - next_point['median_speed']
-                
-                # 檢查是否符合衝擊波條件
-                if (speed_drop >= criteria['speed_drop_min'] and 
-                    speed_drop <= criteria['speed_drop_max'] and
-                    current['median_speed'] >= criteria['initial_speed_min']):
-                    
-                    # 計算其他指標
-                    initial_density = current['flow'] / max(current['median_speed'], 0.1)
-                    final_density = next_point['flow'] / max(next_point['median_speed'], 0.1)
-                    density_change = final_density - initial_density
-                    
-                    # 🔧 放寬密度增加要求
-                    if density_change >= criteria['density_increase_min'] or speed_drop >= 30:
-                        shock_event = {
-                            'level': level,
-                            'start_time': self._parse_time_from_data(current),
-                            'end_time': self._parse_time_from_data(next_point),
-                            'duration': time_gap,  # 實際時間間隔
-                            'speed_drop': speed_drop,
-                            'initial_speed': current['median_speed'],
-                            'final_speed': next_point['median_speed'],
-                            'initial_density': initial_density,
-                            'final_density': final_density,
-                            'density_increase': density_change,
-                            'max_flow': max(current['flow'], next_point['flow']),
-                            'min_flow': min(current['flow'], next_point['flow']),
-                            'start_idx': i,
-                            'end_idx': i + 1,
-                            'theoretical_wave_speed': self._calculate_realistic_wave_speed(
-                                initial_density, final_density, 
-                                current['median_speed'], next_point['median_speed']
-                            ),
-                            'time_gap': time_gap,
-                            'station': current.get('station', 'Unknown')
-                        }
-                        
-                        shocks.append(shock_event)
+        for k in range(len(records)):
+            start_idx = columns['start_idx'][k]
+            end_idx = columns['end_idx'][k]
+            shocks.append({
+                'level': level_names[columns['level'][k]],
+                'level_rank': columns['level_rank'][k],
+                'start_time': start_times[k],
+                'end_time': end_times[k],
+                'duration': columns['duration'][k],
+                'speed_drop': columns['speed_drop'][k],
+                'initial_speed': columns['initial_speed'][k],
+                'final_speed': columns['final_speed'][k],
+                'initial_density': columns['initial_density'][k],
+                'final_density': columns['final_density'][k],
+                'density_increase': columns['density_increase'][k],
+                'max_flow': columns['max_flow'][k],
+                'min_flow': columns['min_flow'][k],
+                'start_idx': start_idx,
+                'end_idx': end_idx,
+                'theoretical_wave_speed': columns['wave_speed'][k],
+                'time_gap': columns['time_gap'][k],
+                'station': station
+            })
         
         return shocks
     
     def calculate_density(self, flow, speed):
-        """計算密度"""
-        speed = np.where(speed <= 0.1, 0.1, speed)
-        return flow / speed
+        """計算密度（float64，於速度副本上就地截斷與相除）"""
+        speed_arr = np.array(speed, dtype=np.float64)
+        np.maximum(speed_arr, 0.1, out=speed_arr)
+        return np.divide(np.asarray(flow, dtype=np.float64), speed_arr, out=speed_arr)
     
-    def _calculate_realistic_wave_speed(self, rho_i, rho_f, u_i, u_f):
-        """計算符合文獻的波速"""
-        if abs(rho_f - rho_i) < 0.1:
-            return 0
-        
+    def _calculate_realistic_wave_speeds(self, rho_i, rho_f, u_i, u_f):
+        """向量化計算符合文獻的波速"""
         # 使用簡化的Rankine-Hugoniot條件
         flow_i = rho_i * u_i
         flow_f = rho_f * u_f
+        density_change = rho_f - rho_i
         
-        raw_speed = (flow_f - flow_i) / (rho_f - rho_i)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            raw_speed = np.where(np.abs(density_change) < 0.1, 0.0, (flow_f - flow_i) / density_change)
         
         # 限制在合理範圍內（根據文獻）
-        return max(-20, min(20, raw_speed))
+        return np.clip(raw_speed, -20, 20)
     
-    def _light_filtering(self, shocks):
-        """輕度過濾重複事件"""
-        if not shocks:
-            return []
+    def _light_filtering(self, records):
+        """輕度過濾重複事件（單一站點，記住最後保留的事件，單次掃描）
+        
+        Returns:
+            保留事件在 records 中的索引（依保留順序）
+        """
+        if len(records) == 0:
+            return np.empty(0, dtype=np.int64)
         
         # 按時間排序
-        shocks = sorted(shocks, key=lambda x: x['start_idx'])
+        order = np.argsort(records['start_idx'], kind='stable').tolist()
+        
+        ranks = records['level_rank'].tolist()
+        starts = records['start_idx'].tolist()
+        ends = records['end_idx'].tolist()
         
         filtered = []
-        severity_order = {'mild': 1, 'moderate': 2, 'severe': 3}
-        
-        for current in shocks:
-            # 檢查是否與已有事件時間太近（同一站點）
-            too_close = False
-            for existing in filtered:
-                if (current.get('station') == existing.get('station') and
-                    abs(current['start_idx'] - existing['end_idx']) < 2):  # 只需間隔2個點（10分鐘）
+        
+        for current in order:
+            # 已保留事件彼此至少相隔2個點，只有最後一個可能與目前事件太近
+            if filtered:
+                existing = filtered[-1]
+                if abs(starts[current] - ends[existing]) < 2:  # 只需間隔2個點（10分鐘）
                     # 保留更嚴重的事件
-                    if severity_order[current['level']] > severity_order[existing['level']]:
-                        filtered.remove(existing)
-                        break
-                    else:
-                        too_close = True
-                        break
+                    if ranks[current] <= ranks[existing]:
+                        continue
+                    filtered.pop()
             
-            if not too_close:
-                filtered.append(current)
+            filtered.append(current)
         
-        return filtered
+        return np.array(filtered, dtype=np.int64)
     
     def calculate_final_statistics(self, shocks):
         """計算最終統計"""
         if not shocks:
             return {}
         
-        df = pd.DataFrame(shocks)
+        n = len(shocks)
+        level_counts = Counter(s['level'] for s in shocks)
+        durations = np.fromiter((s['duration'] for s in shocks), dtype=np.int32, count=n)
+        speed_drops = np.fromiter((s['speed_drop'] for s in shocks), dtype=np.float32, count=n)
+        density_increases = np.fromiter((s['density_increase'] for s in shocks), dtype=np.float32, count=n)
+        wave_speeds = np.fromiter((s['theoretical_wave_speed'] for s in shocks), dtype=np.float32, count=n)
         
         return {
-            'total_events': len(shocks),
-            'by_level': df['level'].value_counts().to_dict(),
-            'by_station': df['station'].value_counts().to_dict() if 'station' in df.columns else {},
-            'avg_duration': df['duration'].mean(),
-            'avg_speed_drop': df['speed_drop'].mean(),
-            'avg_density_increase': df['density_increase'].mean(),
-            'avg_wave_speed': df['theoretical_wave_speed'].mean(),
-            'max_speed_drop': df['speed_drop'].max(),
-            'min_speed_drop': df['speed_drop'].min(),
-            'duration_range': (df['duration'].min(), df['duration'].max()),
-            'severe_events': len(df[df['level'] == 'severe']),
-            'moderate_events': len(df[df['level'] == 'moderate']),
-            'mild_events': len(df[df['level'] == 'mild'])
+            'total_events': n,
+            'by_level': dict(level_counts.most_common()),
+            'by_station': dict(Counter(s['station'] for s in shocks if 'station' in s).most_common()),
+            'avg_duration': float(durations.mean()),
+            'avg_speed_drop': float(speed_drops.mean()),
+            'avg_density_increase': float(density_increases.mean()),
+            'avg_wave_speed': float(wave_speeds.mean()),
+            'max_speed_drop': float(speed_drops.max()),
+            'min_speed_drop': float(speed_drops.min()),
+            'duration_range': (int(durations.min()), int(durations.max())),
+            'severe_events': level_counts['severe'],
+            'moderate_events': level_counts['moderate'],
+            'mild_events': level_counts['mild']
         }
 
 def test_realtime_detector():
@@ -230,17 +302,16 @@ def test_realtime_detector():
     
     realtime_dir = '../../data/realtime_data'
     latest_file = None
-    latest_time = 0
     
-    # 找到最新的檔案
+    # 找到最新的檔案（單次目錄掃描，修改時間取自 DirEntry）
     if os.path.exists(realtime_dir):
-        for filename in os.listdir(realtime_dir):
-            if filename.startswith('realtime_shock_data_') and filename.endswith('.csv'):
-                filepath = os.path.join(realtime_dir, filename)
-                mtime = os.path.getmtime(filepath)
-                if mtime > latest_time:
-                    latest_time = mtime
-                    latest_file = filepath
+        with os.scandir(realtime_dir) as entries:
+            candidates = [
+                entry for entry in entries
+                if entry.name.startswith('realtime_shock_data_') and entry.name.endswith('.csv')
+            ]
+        latest = max(candidates, key=lambda entry: entry.stat().st_mtime, default=None)
+        latest_file = latest.path if latest else None
     
     if not latest_file:
         print("❌ 找不到即時資料檔案，使用測試資料")
@@ -258,7 +329,19 @@ def test_realtime_detector():
         print("📊 使用測試資料驗證您發現的衝擊波")
     else:
         print(f"📊 載入最新即時資料: {os.path.basename(latest_file)}")
-        df = pd.read_csv(latest_file)
+        # 只讀取檢測需要的欄位，數值欄位使用較窄的型別
+        df = pd.read_csv(
+            latest_file,
+            usecols=['station', 'date', 'hour', 'minute', 'flow', 'median_speed'],
+            dtype={
+                'station': 'category',
+                'flow': np.float32,
+                'median_speed': np.float32,
+                'hour': np.int8,
+                'minute': np.int8
+            },
+            memory_map=True
+        )
     
     # 初始化檢測器
     detector = RealtimeAdaptiveShockDetector()
@@ -270,14 +353,15 @@ def test_realtime_detector():
               f"時間間隔 ≤{criteria['max_time_gap']} 分鐘, "
               f"初始速度 ≥{criteria['initial_speed_min']} km/h")
     
-    # 測試所有站點
+    # 測試所有站點：站點代碼轉為類別，排序一次後以 groupby 切成連續區塊
     all_shocks = []
-    stations = df['station'].unique()
+    df['station'] = df['station'].astype('category')
+    df = df.sort_values(['station', 'hour', 'minute'], kind='mergesort', ignore_index=True)
+    grouped = df.groupby('station', sort=False, observed=True)
     
-    print(f"\n🔍 檢測 {len(stations)} 個站點...")
+    print(f"\n🔍 檢測 {grouped.ngroups} 個站點...")
     
-    for station in stations:
-        station_data = df[df['station'] == station].sort_values(['hour', 'minute'])
+    for station, station_data in grouped:
         if len(station_data) < 2:
             continue
             
@@ -1,13 +1,69 @@
+from dataclasses import dataclass
 import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
+from numpy.lib.stride_tricks import sliding_window_view
 from datetime import datetime, timedelta
 import warnings
 warnings.filterwarnings('ignore')
 
-# 設定中文字體
-plt.rcParams['font.sans-serif'] = ['Arial Unicode MS', 'SimHei', 'DejaVu Sans']
-plt.rcParams['axes.unicode_minus'] = False
+try:
+    from numba import njit
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+
+# 震波等級的嚴重程度排序
+SEVERITY_RANK = {'mild': 1, 'moderate': 2, 'severe': 3}
+
+
+@dataclass
+class DetectionArrays:
+    """單一站點檢測所需欄位的NumPy陣列，每站只取出一次"""
+    speed: np.ndarray
+    density: np.ndarray
+    flow: np.ndarray
+
+
+if NUMBA_AVAILABLE:
+    @njit
+    def _scan_strict_shocks_jit(speed, density, drop_min, drop_max, dinc_min, dur_min, max_dur):
+        """嚴格震波掃描核心：回傳 (起點, 終點) 陣列；接受震波後從終點之後繼續"""
+        n = speed.shape[0]
+        hits = np.empty((n, 2), dtype=np.int64)
+        count = 0
+        i = 0
+        
+        while i < n - dur_min:
+            # 觸發條件：速度夠高、速度下降且密度上升
+            triggered = (i < n - 1 and
+                         speed[i] >= 20 and
+                         speed[i] - speed[i + 1] >= drop_min * 0.3 and
+                         density[i + 1] - density[i] > 0 and
+                         speed[i] > speed[i + 1])
+            
+            best_end = -1
+            if triggered:
+                for duration in range(dur_min, min(max_dur, n - i - 1)):
+                    end = i + duration
+                    speed_drop = speed[i] - speed[end]
+                    density_increase = density[end] - density[i]
+                    if (speed_drop >= drop_min and speed_drop <= drop_max and
+                            density_increase >= dinc_min and
+                            speed[i] > speed[end] and density[end] > density[i]):
+                        best_end = end
+                    elif best_end >= 0:
+                        break
+            
+            if best_end >= 0:
+                hits[count, 0] = i
+                hits[count, 1] = best_end
+                count += 1
+                i = best_end + 1
+            else:
+                i += 1
+        
+        return hits[:count]
+
 
 class RefinedTrafficShockWaveDetector:
     """
@@ -47,9 +103,10 @@ class RefinedTrafficShockWaveDetector:
         }
     
     def calculate_density(self, flow, speed):
-        """計算交通密度"""
-        speed = np.where(speed <= 0.1, 0.1, speed)
-        return flow / speed
+        """計算交通密度（float64，於速度副本上就地截斷與相除）"""
+        speed_arr = np.array(speed, dtype=np.float64)
+        np.maximum(speed_arr, 0.1, out=speed_arr)
+        return np.divide(np.asarray(flow, dtype=np.float64), speed_arr, out=speed_arr)
     
     def detect_congestion_shocks(self, station_data):
         """
@@ -60,141 +117,175 @@ class RefinedTrafficShockWaveDetector:
         data['density'] = self.calculate_density(data['flow'], data['median_speed'])
         
         # 計算5點移動平均以減少噪聲
-        data['speed_smooth'] = data['median_speed'].rolling(window=5, center=True).mean()
-        data['density_smooth'] = data['density'].rolling(window=5, center=True).mean()
+        data['speed_smooth'] = self._smooth(data['median_speed'].to_numpy(), 5)
+        data['density_smooth'] = self._smooth(data['density'].to_numpy(), 5)
+        
+        arrs = self._prepare_arrays(data)
         
         all_shocks = []
         
         # 對每個震波等級進行檢測
         for level, criteria in self.shock_criteria.items():
-            shocks = self._detect_shocks_strict(data, level, criteria)
+            shocks = self._detect_shocks_strict(arrs, level, criteria)
             all_shocks.extend(shocks)
         
         # 排序並去除重疊
         all_shocks = sorted(all_shocks, key=lambda x: x['start_idx'])
         filtered_shocks = self._remove_overlapping_events(all_shocks)
         
+        # 只為保留下來的事件產生時間字串
+        self._materialize_times(data, filtered_shocks)
+        
         return filtered_shocks
     
-    def _detect_shocks_strict(self, data, level, criteria):
+    def _smooth(self, values, window=5):
+        """置中移動平均；視窗不完整的邊界為 NaN（等同 rolling(center=True)）"""
+        values = np.asarray(values, dtype=np.float64)
+        n = len(values)
+        pad = (window - 1) // 2
+        smooth = np.full(n, np.nan)
+        
+        if n >= window:
+            smooth[pad:n - pad] = sliding_window_view(values, window).mean(axis=-1)
+        
+        return smooth
+    
+    def _prepare_arrays(self, data):
+        """取出檢測用欄位陣列（data 需已含 density 欄位）"""
+        return DetectionArrays(
+            speed=data['median_speed'].to_numpy(),
+            density=data['density'].to_numpy(),
+            flow=data['flow'].to_numpy()
+        )
+    
+    def _detect_shocks_strict(self, arrs, level, criteria):
         """嚴格的震波檢測邏輯"""
         shocks = []
+        
+        for start_idx, end_idx in self._scan_strict_shocks(arrs, criteria):
+            shock_analysis = self._analyze_shock_window(arrs, start_idx, end_idx)
+            
+            shock_event = {
+                'level': level,
+                'level_rank': SEVERITY_RANK[level],
+                'duration': shock_analysis['duration'] * 5,
+                'speed_drop': shock_analysis['speed_drop'],
+                'initial_speed': shock_analysis['initial_speed'],
+                'final_speed': shock_analysis['final_speed'],
+                'initial_density': shock_analysis['initial_density'],
+                'final_density': shock_analysis['final_density'],
+                'density_increase': shock_analysis['density_increase'],
+                'max_flow': shock_analysis['max_flow'],
+                'min_flow': shock_analysis['min_flow'],
+                'start_idx': start_idx,
+                'end_idx': end_idx,
+                'theoretical_wave_speed': shock_analysis['wave_speed']
+            }
+            
+            shocks.append(shock_event)
+        
+        return shocks
+    
+    def _scan_strict_shocks(self, arrs, criteria):
+        """找出所有震波的 (起點, 終點)；numba可用時以JIT核心掃描"""
+        if NUMBA_AVAILABLE:
+            hits = _scan_strict_shocks_jit(
+                np.ascontiguousarray(arrs.speed, dtype=np.float64),
+                np.ascontiguousarray(arrs.density),
+                float(criteria['speed_drop_min']),
+                float(criteria['speed_drop_max']),
+                float(criteria['density_increase_min']),
+                int(criteria['duration_min']),
+                20  # 最多分析100分鐘
+            )
+            return [tuple(hit) for hit in hits.tolist()]
+        
+        hits = []
         i = 0
         
-        while i < len(data) - criteria['duration_min']:
-            # 檢查是否符合震波起始條件
-            if self._is_shock_trigger(data, i, criteria):
-                
-                # 分析震波發展
-                shock_analysis = self._analyze_shock_development(data, i, criteria)
-                
-                if shock_analysis['is_valid_shock']:
-                    shock_event = {
-                        'level': level,
-                        'start_time': self._format_time(data.iloc[shock_analysis['start_idx']]),
-                        'end_time': self._format_time(data.iloc[shock_analysis['end_idx']]),
-                        'duration': shock_analysis['duration'] * 5,
-                        'speed_drop': shock_analysis['speed_drop'],
-                        'initial_speed': shock_analysis['initial_speed'],
-                        'final_speed': shock_analysis['final_speed'],
-                        'initial_density': shock_analysis['initial_density'],
-                        'final_density': shock_analysis['final_density'],
-                        'density_increase': shock_analysis['density_increase'],
-                        'max_flow': shock_analysis['max_flow'],
-                        'min_flow': shock_analysis['min_flow'],
-                        'start_idx': shock_analysis['start_idx'],
-                        'end_idx': shock_analysis['end_idx'],
-                        'theoretical_wave_speed': shock_analysis['wave_speed']
-                    }
-                    
-                    shocks.append(shock_event)
-                    i = shock_analysis['end_idx'] + 1
-                else:
-                    i += 1
+        while i < len(arrs.speed) - criteria['duration_min']:
+            # 檢查是否符合震波起始條件，再分析震波發展
+            end_idx = self._find_shock_end(arrs, i, criteria) if self._is_shock_trigger(arrs, i, criteria) else None
+            
+            if end_idx is not None:
+                hits.append((i, end_idx))
+                i = end_idx + 1
             else:
                 i += 1
         
-        return shocks
+        return hits
     
-    def _is_shock_trigger(self, data, idx, criteria):
+    def _is_shock_trigger(self, arrs, idx, criteria):
         """檢查震波觸發條件"""
-        if idx >= len(data) - 1:
+        speed = arrs.speed
+        if idx >= len(speed) - 1:
             return False
         
-        current = data.iloc[idx]
-        next_point = data.iloc[idx + 1]
+        current_speed = speed[idx]
+        next_speed = speed[idx + 1]
         
         # 基本條件：速度必須足夠高才可能有震波
-        if current['median_speed'] < 20:
+        if current_speed < 20:
             return False
         
         # 檢查速度下降
-        speed_drop = current['median_speed'] - next_point['median_speed']
+        speed_drop = current_speed - next_speed
         
         # 檢查密度上升
-        density_increase = next_point['density'] - current['density']
+        density_increase = arrs.density[idx + 1] - arrs.density[idx]
         
         # 震波條件：速度下降 + 密度上升
         return (speed_drop >= criteria['speed_drop_min'] * 0.3 and  # 初始檢測較寬鬆
                 density_increase > 0 and
-                current['median_speed'] > next_point['median_speed'])
+                current_speed > next_speed)
     
-    def _analyze_shock_development(self, data, start_idx, criteria):
-        """分析震波發展過程"""
-        initial_speed = data.iloc[start_idx]['median_speed']
-        initial_density = data.iloc[start_idx]['density']
-        
-        max_duration = min(20, len(data) - start_idx - 1)  # 最多分析100分鐘
-        
-        best_shock = {
-            'is_valid_shock': False,
-            'start_idx': start_idx,
-            'end_idx': start_idx,
-            'duration': 0
-        }
+    def _find_shock_end(self, arrs, start_idx, criteria):
+        """分析震波發展過程（所有持續時間一次以陣列計算），回傳震波終點或 None"""
+        speed, density = arrs.speed, arrs.density
         
-        for duration in range(criteria['duration_min'], max_duration):
-            end_idx = start_idx + duration
-            
-            if end_idx >= len(data):
-                break
-            
-            # 分析這段期間的變化
-            analysis = self._analyze_period(data, start_idx, end_idx, criteria)
-            
-            if analysis['meets_criteria']:
-                best_shock = analysis
-                best_shock['is_valid_shock'] = True
-                # 繼續尋找更長的震波
-            elif best_shock['is_valid_shock']:
-                # 如果已經找到有效震波，且當前不滿足條件，則結束
-                break
-        
-        return best_shock
-    
-    def _analyze_period(self, data, start_idx, end_idx, criteria):
-        """分析特定時間段"""
-        period_data = data.iloc[start_idx:end_idx+1]
+        max_duration = min(20, len(speed) - start_idx - 1)  # 最多分析100分鐘
         
-        initial_speed = period_data.iloc[0]['median_speed']
-        final_speed = period_data.iloc[-1]['median_speed']
-        initial_density = period_data.iloc[0]['density']
-        final_density = period_data.iloc[-1]['density']
+        durations = np.arange(criteria['duration_min'], max_duration)
+        if len(durations) == 0:
+            return None
+        
+        end_range = start_idx + durations
+        initial_speed = speed[start_idx]
+        initial_density = density[start_idx]
+        final_speed = speed[end_range]
+        final_density = density[end_range]
         
         speed_drop = initial_speed - final_speed
         density_increase = final_density - initial_density
-        duration = end_idx - start_idx
         
         # 嚴格檢查是否符合震波條件
         meets_criteria = (
-            speed_drop >= criteria['speed_drop_min'] and
-            speed_drop <= criteria['speed_drop_max'] and
-            density_increase >= criteria['density_increase_min'] and
-            duration >= criteria['duration_min'] and
-            initial_speed > final_speed and  # 確保是真正的速度下降
-            final_density > initial_density  # 確保是真正的密度上升
+            (speed_drop >= criteria['speed_drop_min']) &
+            (speed_drop <= criteria['speed_drop_max']) &
+            (density_increase >= criteria['density_increase_min']) &
+            (durations >= criteria['duration_min']) &
+            (initial_speed > final_speed) &  # 確保是真正的速度下降
+            (final_density > initial_density)  # 確保是真正的密度上升
         )
         
+        if not meets_criteria.any():
+            return None
+        
+        # 從第一個有效長度起持續延長，遇到第一個不符合的長度即結束
+        first = int(np.argmax(meets_criteria))
+        rest = meets_criteria[first:]
+        k = first + (int(np.argmin(rest)) - 1 if not rest.all() else len(rest) - 1)
+        
+        return int(end_range[k])
+    
+    def _analyze_shock_window(self, arrs, start_idx, end_idx):
+        """計算震波區段的指標"""
+        initial_speed = arrs.speed[start_idx]
+        final_speed = arrs.speed[end_idx]
+        initial_density = arrs.density[start_idx]
+        final_density = arrs.density[end_idx]
+        period_flow = arrs.flow[start_idx:end_idx + 1]
+        
         # 計算理論震波速度
         wave_speed = 0
         if abs(final_density - initial_density) > 0.1:
@@ -203,50 +294,71 @@ class RefinedTrafficShockWaveDetector:
             wave_speed = (flow_final - flow_initial) / (final_density - initial_density)
         
         return {
-            'meets_criteria': meets_criteria,
-            'start_idx': start_idx,
-            'end_idx': end_idx,
-            'duration': duration,
-            'speed_drop': speed_drop,
+            'duration': end_idx - start_idx,
+            'speed_drop': initial_speed - final_speed,
             'initial_speed': initial_speed,
             'final_speed': final_speed,
             'initial_density': initial_density,
             'final_density': final_density,
-            'density_increase': density_increase,
-            'max_flow': period_data['flow'].max(),
-            'min_flow': period_data['flow'].min(),
+            'density_increase': final_density - initial_density,
+            'max_flow': period_flow.max(),
+            'min_flow': period_flow.min(),
             'wave_speed': wave_speed
         }
     
-    def _format_time(self, row):
-        """格式化時間"""
-        return f"{row['date']} {row['hour']:02d}:{row['minute']:02d}"
+    def _format_times(self, data, idx):
+        """以向量化字串運算格式化多個資料點的時間（日期 HH:MM）"""
+        if len(idx) == 0:
+            return []
+        
+        hours = np.char.zfill(data['hour'].to_numpy()[idx].astype(str), 2)
+        minutes = np.char.zfill(data['minute'].to_numpy()[idx].astype(str), 2)
+        dates = data['date'].to_numpy()[idx].astype(str)
+        return np.char.add(np.char.add(np.char.add(dates, ' '), np.char.add(hours, ':')), minutes).tolist()
+    
+    def _materialize_times(self, data, shocks):
+        """為事件補上 start_time / end_time（延後到過濾完成後才產生）"""
+        if not shocks:
+            return shocks
+        
+        n = len(shocks)
+        idx = np.fromiter(
+            (shock[key] for key in ('start_idx', 'end_idx') for shock in shocks),
+            dtype=np.int64, count=2 * n
+        )
+        labels = self._format_times(data, idx)
+        
+        for shock, start_time, end_time in zip(shocks, labels[:n], labels[n:]):
+            shock['start_time'] = start_time
+            shock['end_time'] = end_time
+        
+        return shocks
     
     def _remove_overlapping_events(self, shocks):
-        """去除重疊事件，保留更嚴重的"""
+        """去除重疊事件，保留更嚴重的（事件已依 start_idx 排序，單次掃描）"""
         if not shocks:
             return []
         
-        severity_order = {'mild': 1, 'moderate': 2, 'severe': 3}
-        filtered = []
-        
-        for current in shocks:
-            # 檢查是否與已有事件重疊
-            overlapped = False
-            for i, existing in enumerate(filtered):
-                if (current['start_idx'] <= existing['end_idx'] and 
-                    current['end_idx'] >= existing['start_idx']):
-                    
-                    # 有重疊，保留更嚴重的事件
-                    if severity_order[current['level']] > severity_order[existing['level']]:
-                        filtered[i] = current
-                    overlapped = True
-                    break
+        starts = np.fromiter((shock['start_idx'] for shock in shocks), dtype=np.int64, count=len(shocks)).tolist()
+        ends = np.fromiter((shock['end_idx'] for shock in shocks), dtype=np.int64, count=len(shocks)).tolist()
+        ranks = [shock['level_rank'] for shock in shocks]
+        
+        slots = []  # 保留事件在 shocks 中的索引，依保留順序
+        first_open = 0  # 在此之前的保留事件都已在目前起點之前結束
+        
+        for i in range(len(shocks)):
+            # 起點遞增：已結束的保留事件之後不可能再重疊
+            while first_open < len(slots) and ends[slots[first_open]] < starts[i]:
+                first_open += 1
             
-            if not overlapped:
-                filtered.append(current)
+            if first_open < len(slots):
+                # 有重疊，保留更嚴重的事件
+                if ranks[i] > ranks[slots[first_open]]:
+                    slots[first_open] = i
+            else:
+                slots.append(i)
         
-        return filtered
+        return [shocks[i] for i in slots]
     
     def calculate_statistics(self, shocks):
         """計算統計數據"""
@@ -268,6 +380,15 @@ class RefinedTrafficShockWaveDetector:
     
     def visualize_refined_results(self, station_data, station_name, shocks):
         """精修版視覺化"""
+        # matplotlib 只在繪圖時載入，檢測本身不需要
+        import matplotlib.pyplot as plt
+        
+        # 設定中文字體（只設定一次）
+        if not getattr(plt, '_cjk_set', False):
+            plt.rcParams['font.sans-serif'] = ['Arial Unicode MS', 'SimHei', 'DejaVu Sans']
+            plt.rcParams['axes.unicode_minus'] = False
+            plt._cjk_set = True
+        
         fig, axes = plt.subplots(3, 2, figsize=(18, 12))
         
         data = station_data.copy().reset_index(drop=True)
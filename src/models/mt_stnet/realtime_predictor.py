@@ -5,22 +5,158 @@ import os
 import sys
 import numpy as np
 import pandas as pd
-import tensorflow as tf
 from datetime import datetime, timedelta
 import logging
 from pathlib import Path
 import json
+import pickle
 from typing import Dict, List, Optional, Tuple
+import asyncio
 import threading
 import time
+import queue
 from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+
+try:
+    from numba import njit
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
 
 # 添加專案路徑
 current_dir = Path(__file__).parent
 project_root = current_dir.parent.parent.parent
 sys.path.append(str(project_root))
 
-from src.data.tdx_tisc_mix_system import OptimizedIntegratedDataCollectionSystem
+# TensorFlow 與資料收集系統導入成本高，延遲到載入模型 / 初始化收集器時才導入
+_tf = None
+
+
+def _import_tensorflow():
+    """延遲導入 TensorFlow，只在第一次載入模型時付出導入成本"""
+    global _tf
+    if _tf is None:
+        import tensorflow as tf
+        _tf = tf
+    return _tf
+
+
+def _simple_prediction_numpy(recent_flows, time_factor):
+    """以最近兩個時間點 [2, stations] 的流量做趨勢外推，再乘上時間因子"""
+    trend = recent_flows[-1] - recent_flows[-2]
+    return ((recent_flows[-1] + trend * np.float32(0.5)) * np.float32(time_factor)).astype(np.float32, copy=False)
+
+
+def _estimate_speed_numpy(flow):
+    """簡化的流量-速度關係模型（逐站點向量化）"""
+    return np.where(
+        flow <= 0, np.float32(90),  # 自由流速度
+        np.where(
+            flow <= 1000, 90 - (flow / 1000) * 20,  # 線性下降
+            np.where(
+                flow <= 2000, 70 - ((flow - 1000) / 1000) * 30,
+                np.maximum(20, 40 - ((flow - 2000) / 1000) * 15)  # 擁塞狀態
+            )
+        )
+    ).astype(np.float32, copy=False)
+
+
+if NUMBA_AVAILABLE:
+    @njit(fastmath=True)
+    def _simple_prediction_kernel(recent_flows, time_factor):
+        """趨勢外推核心：recent_flows 為 [2, stations]"""
+        n = recent_flows.shape[1]
+        out = np.empty(n, dtype=np.float32)
+        for j in range(n):
+            last = recent_flows[1, j]
+            out[j] = (last + (last - recent_flows[0, j]) * 0.5) * time_factor
+        return out
+
+    @njit(fastmath=True)
+    def _estimate_speed_kernel(flow):
+        """流量-速度分段模型核心"""
+        n = flow.shape[0]
+        out = np.empty(n, dtype=np.float32)
+        for j in range(n):
+            f = flow[j]
+            if f <= 0:
+                out[j] = 90.0
+            elif f <= 1000:
+                out[j] = 90 - (f / 1000) * 20
+            elif f <= 2000:
+                out[j] = 70 - ((f - 1000) / 1000) * 30
+            else:
+                out[j] = max(20.0, 40 - ((f - 2000) / 1000) * 15)
+        return out
+else:
+    _simple_prediction_kernel = _simple_prediction_numpy
+    _estimate_speed_kernel = _estimate_speed_numpy
+
+class BatchingQueue:
+    """
+    動態批次佇列
+
+    收到第一個請求後，在緩衝時間窗內繼續收集後續請求（最多 max_batch_size 個），
+    再以一次 batch_fn 呼叫處理整批，結果依序回填到各請求的 Future。
+    """
+
+    def __init__(self, batch_fn, max_batch_size=8, buffering_window=0.05):
+        self.batch_fn = batch_fn
+        self.max_batch_size = max_batch_size
+        self.buffering_window = buffering_window  # 秒
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._worker, daemon=True)
+        self._thread.start()
+
+    def submit(self, *args) -> Future:
+        """加入一個請求，回傳可等待結果的 Future"""
+        future = Future()
+        self._queue.put((args, future))
+        return future
+
+    def close(self):
+        """處理完已排入的請求後停止工作線程"""
+        self._queue.put(None)
+        self._thread.join(timeout=5)
+
+    def _worker(self):
+        running = True
+        while running:
+            item = self._queue.get()
+            if item is None:
+                break
+            
+            # 在時間窗內收集更多請求
+            items = [item]
+            deadline = time.monotonic() + self.buffering_window
+            while len(items) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is None:
+                    running = False
+                    break
+                items.append(item)
+            
+            try:
+                results = self.batch_fn([args for args, _ in items])
+                for (_, future), result in zip(items, results):
+                    future.set_result(result)
+            except Exception as e:
+                for _, future in items:
+                    future.set_exception(e)
+
 
 class MTSTNetRealtimePredictor:
     """
@@ -67,28 +203,57 @@ class MTSTNetRealtimePredictor:
         # 站點映射
         self.station_mapping = self._load_station_mapping()
         self.target_stations = list(self.station_mapping.keys())
+        self.station_index = {station: i for i, station in enumerate(self.target_stations)}
+        
+        # 站點屬性依 target_stations 順序展開為平行列表，預測時以索引存取
+        self.station_names = [info['name'] for info in self.station_mapping.values()]
+        self.station_highways = [info['highway'] for info in self.station_mapping.values()]
+        self.station_directions = [info['direction'] for info in self.station_mapping.values()]
+        
+        # 預先配置的模型輸入緩衝區（每個線程一份，避免並發請求互相覆寫）
+        self._input_buffers = threading.local()
         
-        # 資料緩存
-        self.data_cache = deque(maxlen=120)  # 保存2小時資料
+        # 預測結果緩存
         self.prediction_cache = deque(maxlen=50)  # 保存預測結果
         
         # 模型相關
         self.model = None
+        self.interpreter = None
+        self._infer = None
         self.is_model_loaded = False
         self.normalization_params = {'mean': 0, 'std': 1}
+        self._refresh_normalization()
         
         # 資料收集系統
         self.data_collector = None
         
+        # 預先編譯數值核心，避免第一次預測時等待JIT
+        if NUMBA_AVAILABLE:
+            self._warmup_kernels()
+        
         # 執行狀態
         self.is_running = False
         self.prediction_thread = None
+        self.prediction_task = None
+        self._loop = None
+        self.batching_queue = None
+        self._batching_lock = threading.Lock()
+        
+        # I/O 工作（取得即時資料、寫出預測檔）交由背景線程，不阻塞預測流程
+        self._io_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix='mt_stnet_io')
         self.last_prediction_time = None
+        self._last_input = None  # (輸入雜湊, 對應的預測結果)
         
         self.logger.info("🚀 MT-STNet 即時預測系統初始化完成")
         self.logger.info(f"📊 目標站點數: {len(self.target_stations)}")
         self.logger.info(f"⏱️ 預測間隔: {self.prediction_interval} 分鐘")
 
+    def _warmup_kernels(self):
+        """以假資料呼叫一次 numba 核心，將編譯成本移出預測流程"""
+        dummy_input = np.zeros((1, self.model_params['input_length'], self.model_params['site_num'], 3), dtype=np.float32)
+        _simple_prediction_kernel(np.ascontiguousarray(dummy_input[0, -2:, :, 0]), 1.0)
+        _estimate_speed_kernel(np.zeros(self.model_params['site_num'], dtype=np.float32))
+
     def _setup_logging(self):
         """設定日誌系統"""
         log_dir = self.data_dir / "logs"
@@ -107,24 +272,40 @@ class MTSTNetRealtimePredictor:
         self.logger = logging.getLogger('MTSTNetPredictor')
 
     def _load_station_mapping(self):
-        """載入站點映射"""
+        """載入站點映射（Etag.csv 解析結果以檔案修改時間為鍵快取成 pickle）"""
         station_mapping = {}
         
         # 從Etag.csv載入站點資訊
         etag_file = self.data_dir / 'Taiwan' / 'Etag.csv'
+        cache_file = etag_file.with_name('.etag_mapping.pkl')
         try:
             if etag_file.exists():
+                if cache_file.exists() and cache_file.stat().st_mtime >= etag_file.stat().st_mtime:
+                    with open(cache_file, 'rb') as f:
+                        station_mapping = pickle.load(f)
+                    self.logger.info(f"✅ 載入 {len(station_mapping)} 個站點映射（快取）")
+                    return station_mapping
+                
                 df = pd.read_csv(etag_file, encoding='utf-8')
-                for idx, row in df.iterrows():
-                    if pd.notna(row['編號']):
-                        station_id = str(row['編號']).replace('-', '').replace('.', '')
-                        station_name = row.get('名稱', f'站點_{station_id}')
-                        station_mapping[station_id] = {
-                            'name': station_name,
-                            'index': idx,
-                            'highway': row.get('國道', ''),
-                            'direction': row.get('方向', '')
-                        }
+                df = df[df['編號'].notna()]
+                station_ids = df['編號'].astype(str).str.replace('-', '', regex=False).str.replace('.', '', regex=False)
+                names = df['名稱'] if '名稱' in df.columns else '站點_' + station_ids
+                highways = df['國道'] if '國道' in df.columns else [''] * len(df)
+                directions = df['方向'] if '方向' in df.columns else [''] * len(df)
+                
+                for station_id, idx, name, highway, direction in zip(station_ids, df.index, names, highways, directions):
+                    station_mapping[station_id] = {
+                        'name': name,
+                        'index': idx,
+                        'highway': highway,
+                        'direction': direction
+                    }
+                
+                try:
+                    with open(cache_file, 'wb') as f:
+                        pickle.dump(station_mapping, f, protocol=pickle.HIGHEST_PROTOCOL)
+                except OSError as e:
+                    self.logger.warning(f"⚠️ 無法寫入站點映射快取: {e}")
                 
                 self.logger.info(f"✅ 載入 {len(station_mapping)} 個站點映射")
             else:
@@ -156,6 +337,14 @@ class MTSTNetRealtimePredictor:
             if model_path and os.path.exists(model_path):
                 self.logger.info(f"📥 找到模型檔案: {model_path}")
                 
+                # INT8 TFLite 模型直接以 Interpreter 載入
+                if str(model_path).endswith('.tflite'):
+                    return self._load_tflite_model(model_path)
+                
+                # SavedModel 目錄
+                if os.path.isdir(model_path) and os.path.exists(os.path.join(model_path, "saved_model.pb")):
+                    return self._load_keras_model(model_path)
+                
                 # 檢查是否為TensorFlow checkpoint目錄
                 if os.path.isdir(model_path):
                     checkpoint_file = os.path.join(model_path, "checkpoint")
@@ -181,6 +370,10 @@ class MTSTNetRealtimePredictor:
                     else:
                         self.logger.warning("⚠️ checkpoint檔案不存在")
                         return False
+                elif str(model_path).endswith(('.h5', '.pb')):
+                    # Keras / SavedModel 格式（.pb 代表其所在目錄為 SavedModel）
+                    keras_path = model_path if str(model_path).endswith('.h5') else os.path.dirname(model_path)
+                    return self._load_keras_model(keras_path)
                 else:
                     # 其他格式的模型檔案
                     self.logger.info("📄 檢測到其他格式模型檔案")
@@ -199,6 +392,13 @@ class MTSTNetRealtimePredictor:
     def _find_latest_model(self):
         """尋找最新的模型檔案"""
         try:
+            # 優先使用轉換後的 INT8 TFLite 模型
+            tflite_files = list(self.weights_dir.glob("*.tflite")) if self.weights_dir.exists() else []
+            if tflite_files:
+                latest_file = max(tflite_files, key=lambda x: x.stat().st_mtime)
+                self.logger.info(f"📁 找到TFLite模型: {latest_file}")
+                return str(latest_file)
+            
             # 檢查TensorFlow checkpoint檔案
             checkpoint_dir = self.weights_dir / "MT_STNet-7"
             if checkpoint_dir.exists():
@@ -228,6 +428,115 @@ class MTSTNetRealtimePredictor:
             self.logger.error(f"❌ 尋找模型檔案失敗: {e}")
             return None
 
+    def _load_tflite_model(self, model_path):
+        """載入 INT8 TFLite 模型（由 scripts/convert_mt_stnet_tflite.py 產生）"""
+        try:
+            tf = _import_tensorflow()
+            self.interpreter = tf.lite.Interpreter(model_path=str(model_path))
+            self.interpreter.allocate_tensors()
+            self._tflite_input = self.interpreter.get_input_details()[0]
+            self._tflite_output = self.interpreter.get_output_details()[0]
+            
+            self.model = self.interpreter
+            self.is_model_loaded = True
+            self.logger.info(f"✅ TFLite模型載入完成，輸入: {self._tflite_input['shape']} {self._tflite_input['dtype'].__name__}")
+            
+            # 載入正規化參數
+            self._load_normalization_params()
+            return True
+            
+        except Exception as e:
+            self.logger.warning(f"⚠️ TFLite模型載入失敗: {e}")
+            self.interpreter = None
+            self.model = None
+            self.is_model_loaded = False
+            return False
+
+    def _load_keras_model(self, model_path):
+        """載入 Keras / SavedModel 模型，並以 XLA 編譯推論函式"""
+        try:
+            tf = _import_tensorflow()
+            self.model = tf.keras.models.load_model(str(model_path), compile=False)
+            
+            # 將前向傳播包成 XLA 編譯的 tf.function，融合注意力與時空區塊的運算
+            site_num = self.model_params['site_num']
+            xla_forward = tf.function(lambda x: self.model(x, training=False), jit_compile=True)
+            
+            def infer(input_data):
+                # 站點數固定為 site_num，避免不同站點數觸發重新編譯
+                model_input = np.zeros(input_data.shape[:2] + (site_num,) + input_data.shape[3:], dtype=np.float32)
+                n_stations = min(input_data.shape[2], site_num)
+                model_input[:, :, :n_stations] = input_data[:, :, :n_stations]
+                return xla_forward(tf.constant(model_input)).numpy()
+            
+            # 以預期輸入形狀暖機，先付出 XLA 編譯成本
+            infer(np.zeros((1, self.model_params['input_length'], site_num, 3), dtype=np.float32))
+            
+            self._infer = infer
+            self.is_model_loaded = True
+            self.logger.info("✅ 模型載入完成（XLA 編譯）")
+            
+            # 載入正規化參數
+            self._load_normalization_params()
+            return True
+            
+        except Exception as e:
+            self.logger.warning(f"⚠️ Keras模型載入失敗: {e}")
+            self.model = None
+            self._infer = None
+            self.is_model_loaded = False
+            return False
+
+    def _tflite_predict(self, input_data: np.ndarray) -> np.ndarray:
+        """以 TFLite Interpreter 推論，量化輸入並將輸出反量化回 float32"""
+        input_detail = self._tflite_input
+        output_detail = self._tflite_output
+        
+        # 批次大小不同時調整輸入張量形狀
+        if input_data.shape[0] != input_detail['shape'][0]:
+            resized_shape = input_detail['shape'].copy()
+            resized_shape[0] = input_data.shape[0]
+            self.interpreter.resize_tensor_input(input_detail['index'], resized_shape)
+            self.interpreter.allocate_tensors()
+            self._tflite_input = input_detail = self.interpreter.get_input_details()[0]
+            self._tflite_output = output_detail = self.interpreter.get_output_details()[0]
+        
+        # 模型以固定站點數編譯，不足的站點補0
+        expected_shape = input_detail['shape']
+        model_input = np.zeros(expected_shape, dtype=np.float32)
+        n_stations = min(input_data.shape[2], expected_shape[2])
+        model_input[:, :, :n_stations] = input_data[:, :, :n_stations]
+        
+        # 量化: q = x / scale + zero_point
+        scale, zero_point = input_detail['quantization']
+        if input_detail['dtype'] == np.int8 and scale:
+            info = np.iinfo(np.int8)
+            model_input = np.clip(np.round(model_input / scale + zero_point), info.min, info.max)
+        self.interpreter.set_tensor(input_detail['index'], model_input.astype(input_detail['dtype']))
+        self.interpreter.invoke()
+        output = self.interpreter.get_tensor(output_detail['index'])
+        
+        # 反量化: x = (q - zero_point) * scale
+        scale, zero_point = output_detail['quantization']
+        if output_detail['dtype'] == np.int8 and scale:
+            output = (output.astype(np.float32) - zero_point) * scale
+        
+        return output
+
+    def _get_input_buffer(self) -> np.ndarray:
+        """取得本線程的 [1, timesteps, stations, features] 輸入緩衝區，重複使用不再每次配置"""
+        buf = getattr(self._input_buffers, 'buf', None)
+        if buf is None:
+            n_stations = max(self.model_params['site_num'], len(self.target_stations))
+            buf = np.zeros((1, self.model_params['input_length'], n_stations, 3), dtype=np.float32)
+            self._input_buffers.buf = buf
+        return buf
+
+    def _refresh_normalization(self):
+        """依正規化參數預先計算 float32 平均值與標準差倒數"""
+        self._norm_mean = np.float32(self.normalization_params['mean'])
+        self._inv_std = np.float32(1.0 / self.normalization_params['std'])
+
     def _load_normalization_params(self):
         """載入資料正規化參數"""
         try:
@@ -247,10 +556,14 @@ class MTSTNetRealtimePredictor:
         except Exception as e:
             self.logger.error(f"❌ 載入正規化參數失敗: {e}")
             self.normalization_params = {'mean': 1000, 'std': 500}
+        
+        self._refresh_normalization()
 
     def initialize_data_collector(self):
         """初始化資料收集系統"""
         try:
+            from src.data.tdx_tisc_mix_system import OptimizedIntegratedDataCollectionSystem
+            
             # 使用絕對路徑
             data_path = str(self.data_dir)
             self.data_collector = OptimizedIntegratedDataCollectionSystem(base_dir=data_path)
@@ -295,71 +608,57 @@ class MTSTNetRealtimePredictor:
             return pd.DataFrame()
 
     def preprocess_data_for_prediction(self, data: pd.DataFrame) -> Optional[np.ndarray]:
-        """預處理資料用於預測"""
+        """預處理資料用於預測
+        
+        回傳的輸入陣列是本線程輸入緩衝區的視圖，同一線程下次呼叫時會被覆寫
+        """
         try:
             if data.empty:
                 return None
             
             # 確保有足夠的時間步長
             required_timesteps = self.model_params['input_length']
+            feature_columns = ['flow', 'median_speed', 'avg_travel_time']
             
-            # 按站點和時間排序
-            data = data.sort_values(['station', 'timestamp'])
+            # 以站點索引取代逐站篩選，只保留需要的欄位後按站點和時間排序一次
+            slots = data['station'].map(self.station_index)
+            present_columns = [col for col in feature_columns if col in data.columns]
+            data = data.loc[slots.notna(), ['timestamp'] + present_columns].assign(_slot=slots)
+            data = data.sort_values(['_slot', 'timestamp'], kind='mergesort')
             
-            # 建立時間序列矩陣
-            station_sequences = {}
+            # 每個站點的資料筆數（判斷資料是否足夠與往前填充時使用）
+            counts = np.bincount(data['_slot'].to_numpy(dtype=np.int64), minlength=len(self.target_stations))
             
-            for station in self.target_stations:
-                station_data = data[data['station'] == station].copy()
-                
-                if len(station_data) >= self.min_data_points:
-                    # 取最近的資料點
-                    recent_data = station_data.tail(required_timesteps)
-                    
-                    # 提取特徵（流量、速度、旅行時間）
-                    features = []
-                    for _, row in recent_data.iterrows():
-                        feature_vector = [
-                            row.get('flow', 0),
-                            row.get('median_speed', 0),
-                            row.get('avg_travel_time', 0)
-                        ]
-                        features.append(feature_vector)
-                    
-                    # 如果資料不足，用最後一個值填充
-                    while len(features) < required_timesteps:
-                        if features:
-                            features.insert(0, features[0])
-                        else:
-                            features.append([0, 0, 0])
-                    
-                    station_sequences[station] = np.array(features[-required_timesteps:])
-            
-            if not station_sequences:
+            selected = np.flatnonzero(counts >= self.min_data_points)
+            if len(selected) == 0:
                 self.logger.warning("⚠️ 無足夠資料進行預測")
                 return None
             
-            # 組合成批次格式 [batch_size, timesteps, stations, features]
-            batch_data = []
-            station_list = []
+            station_list = [self.target_stations[i] for i in selected]
             
-            for station, sequence in station_sequences.items():
-                batch_data.append(sequence)
-                station_list.append(station)
+            # 提取特徵（流量、速度、旅行時間），缺少的欄位以0代替
+            values = np.column_stack([
+                data[col].to_numpy(dtype=np.float32) if col in present_columns else np.zeros(len(data), dtype=np.float32)
+                for col in feature_columns
+            ])
             
-            if batch_data:
-                # 轉換為numpy陣列並正規化
-                batch_array = np.array(batch_data)  # [stations, timesteps, features]
-                batch_array = np.transpose(batch_array, (1, 0, 2))  # [timesteps, stations, features]
-                batch_array = np.expand_dims(batch_array, axis=0)  # [1, timesteps, stations, features]
-                
-                # 正規化流量資料
-                batch_array[:, :, :, 0] = (batch_array[:, :, :, 0] - self.normalization_params['mean']) / self.normalization_params['std']
-                
-                self.logger.info(f"📊 預處理完成: {batch_array.shape}")
-                return batch_array, station_list
+            # 排序後各站資料連續存放，每站最近 required_timesteps 筆即其區段尾端；
+            # 時間步 t 對應的列位置在資料不足時夾到最早一筆，等同用最早的值往前填充
+            ends = np.cumsum(counts)[selected]
+            window_start = ends - np.minimum(counts[selected], required_timesteps)
+            rows = np.maximum(ends[None, :] - required_timesteps + np.arange(required_timesteps)[:, None], window_start[None, :])
             
-            return None
+            # 一次取值直接寫入重複使用的輸入緩衝區 [batch_size, timesteps, stations, features]
+            batch_array = self._get_input_buffer()[:, :, :len(selected)]
+            np.take(values, rows, axis=0, out=batch_array[0])
+            
+            # 正規化流量資料（原地運算，不產生暫存陣列）
+            flow_slice = batch_array[..., 0]
+            np.subtract(flow_slice, self._norm_mean, out=flow_slice)
+            np.multiply(flow_slice, self._inv_std, out=flow_slice)
+            
+            self.logger.info(f"📊 預處理完成: {batch_array.shape}")
+            return batch_array, station_list
             
         except Exception as e:
             self.logger.error(f"❌ 資料預處理失敗: {e}")
@@ -368,116 +667,158 @@ class MTSTNetRealtimePredictor:
     def predict_traffic(self, input_data: np.ndarray, station_list: List[str]) -> Dict:
         """執行交通預測"""
         try:
+            # 每次預測只讀取一次時鐘，時間相關因子由此傳入
             current_time = datetime.now()
             
-            if self.is_model_loaded and self.model is not None:
-                # 使用真實模型預測
-                predictions = self.model.predict(input_data)
-                self.logger.info("🤖 使用MT-STNet模型預測")
-            else:
-                # 使用簡化預測邏輯
-                predictions = self._simple_prediction(input_data, station_list)
-                self.logger.info("📊 使用簡化預測邏輯")
-            
-            # 處理預測結果
-            prediction_results = []
-            
-            for i, station in enumerate(station_list):
-                station_info = self.station_mapping.get(station, {})
-                
-                # 計算預測值（這裡需要根據實際模型輸出調整）
-                if isinstance(predictions, np.ndarray) and len(predictions.shape) >= 2:
-                    if i < predictions.shape[1]:
-                        predicted_flow = float(predictions[0, i, 0] if len(predictions.shape) > 2 else predictions[0, i])
-                    else:
-                        predicted_flow = 0
-                else:
-                    predicted_flow = predictions.get(station, 0)
-                
-                # 反正規化
-                if isinstance(predicted_flow, (int, float)):
-                    predicted_flow = predicted_flow * self.normalization_params['std'] + self.normalization_params['mean']
-                    predicted_flow = max(0, predicted_flow)  # 確保非負值
-                
-                # 估算速度（基於流量的簡化模型）
-                predicted_speed = self._estimate_speed_from_flow(predicted_flow)
-                
-                # 計算信心度
-                confidence = self._calculate_confidence(station, predicted_flow)
-                
-                prediction_result = {
-                    'station_id': station,
-                    'location_name': station_info.get('name', f'站點_{station}'),
-                    'predicted_flow': round(predicted_flow, 1),
-                    'predicted_speed': round(predicted_speed, 1),
-                    'confidence': round(confidence, 3),
-                    'time_horizon': self.model_params['output_length'] * 5,  # 分鐘
-                    'timestamp': current_time.isoformat(),
-                    'highway': station_info.get('highway', ''),
-                    'direction': station_info.get('direction', '')
-                }
-                
-                prediction_results.append(prediction_result)
-            
-            # 組合最終結果
-            result = {
-                'predictions': prediction_results,
-                'model_version': 'MT-STNet-v1.0',
-                'prediction_time': current_time.isoformat(),
-                'time_horizon_minutes': self.model_params['output_length'] * 5,
-                'total_stations': len(prediction_results),
-                'data_source': 'REALTIME'
-            }
-            
-            # 快取預測結果
-            self.prediction_cache.append(result)
+            predictions = self._run_model(input_data, station_list, current_time.hour)
+            result = self._build_prediction_result(predictions, station_list, current_time)
             
-            self.logger.info(f"✅ 預測完成: {len(prediction_results)} 個站點")
+            self.logger.info(f"✅ 預測完成: {result['total_stations']} 個站點")
             return result
             
         except Exception as e:
             self.logger.error(f"❌ 預測失敗: {e}")
             return {'predictions': [], 'error': str(e)}
 
-    def _simple_prediction(self, input_data: np.ndarray, station_list: List[str]) -> Dict:
-        """簡化預測邏輯（當模型未載入時使用）"""
-        predictions = {}
+    def _predict_batch(self, requests: List[Tuple[np.ndarray, List[str]]]) -> List[Dict]:
+        """批次預測：將多個請求的輸入沿 batch 維度合併，只呼叫模型一次"""
+        if len(requests) == 1 or not self.is_model_loaded:
+            return [self.predict_traffic(input_data, station_list) for input_data, station_list in requests]
         
         try:
-            # 基於歷史趨勢的簡單預測
-            for i, station in enumerate(station_list):
-                if i < input_data.shape[2]:  # 確保索引有效
-                    # 取最近幾個時間點的流量
-                    recent_flows = input_data[0, -3:, i, 0]  # 最近3個時間點的流量
-                    
-                    if len(recent_flows) > 0:
-                        # 計算趨勢
-                        if len(recent_flows) >= 2:
-                            trend = recent_flows[-1] - recent_flows[-2]
-                        else:
-                            trend = 0
-                        
-                        # 預測下一個時間點（加上趨勢和一些隨機性）
-                        base_prediction = recent_flows[-1] + trend * 0.5
-                        
-                        # 添加時間因子（考慮交通模式）
-                        current_hour = datetime.now().hour
-                        time_factor = self._get_time_factor(current_hour)
-                        
-                        predicted_flow = base_prediction * time_factor
-                        predictions[station] = float(predicted_flow)
-                    else:
-                        predictions[station] = 0
-                else:
-                    predictions[station] = 0
+            current_time = datetime.now()
+            
+            # 各請求的站點數可能不同，以最多站點數補0對齊
+            n_stations = max(input_data.shape[2] for input_data, _ in requests)
+            batch = np.zeros((len(requests), self.model_params['input_length'], n_stations, 3), dtype=np.float32)
+            for b, (input_data, _) in enumerate(requests):
+                batch[b, :, :input_data.shape[2]] = input_data[0]
+            
+            predictions = self._run_model(batch, None, current_time.hour)
+            results = [
+                self._build_prediction_result(predictions[b:b + 1], station_list, current_time)
+                for b, (_, station_list) in enumerate(requests)
+            ]
+            
+            self.logger.info(f"✅ 批次預測完成: {len(requests)} 個請求")
+            return results
             
         except Exception as e:
-            self.logger.error(f"❌ 簡化預測失敗: {e}")
-            for station in station_list:
-                predictions[station] = 0
+            self.logger.error(f"❌ 批次預測失敗: {e}")
+            return [{'predictions': [], 'error': str(e)} for _ in requests]
+
+    def submit_prediction(self, input_data: np.ndarray, station_list: List[str]) -> Future:
+        """將預測請求送入批次佇列，短時間內的並發請求會合併為一次模型呼叫"""
+        with self._batching_lock:
+            if self.batching_queue is None:
+                self.batching_queue = BatchingQueue(self._predict_batch, max_batch_size=8, buffering_window=0.05)
+        # 預處理結果是執行緒共用輸入緩衝的視圖，排隊期間可能被同一執行緒的下次預處理覆寫，先複製
+        input_data = np.array(input_data, dtype=np.float32, copy=True)
+        return self.batching_queue.submit(input_data, list(station_list))
+
+    def _get_io_pool(self) -> ThreadPoolExecutor:
+        """取得背景 I/O 執行緒池；停止持續預測後關閉，下次使用時重建"""
+        with self._batching_lock:
+            if self._io_pool is None:
+                self._io_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix='mt_stnet_io')
+            return self._io_pool
+
+    def _run_model(self, input_data: np.ndarray, station_list: Optional[List[str]], current_hour: int):
+        """執行模型推論；模型未載入時使用簡化預測"""
+        if self.is_model_loaded and self.interpreter is not None:
+            # 使用 INT8 TFLite 模型預測
+            predictions = self._tflite_predict(input_data)
+            self.logger.info("🤖 使用MT-STNet TFLite模型預測")
+        elif self.is_model_loaded and self.model is not None:
+            # 使用真實模型預測（已載入時走 XLA 編譯的推論函式）
+            predictions = self._infer(input_data) if self._infer is not None else self.model.predict(input_data)
+            self.logger.info("🤖 使用MT-STNet模型預測")
+        else:
+            # 使用簡化預測邏輯
+            predictions = self._simple_prediction(input_data, station_list, self._get_time_factor(current_hour))
+            self.logger.info("📊 使用簡化預測邏輯")
         
         return predictions
 
+    def _build_prediction_result(self, predictions, station_list: List[str], current_time: datetime) -> Dict:
+        """將模型輸出轉為各站點預測結果並快取"""
+        current_hour = current_time.hour
+        
+        # 取出各站點預測值（這裡需要根據實際模型輸出調整），超出輸出範圍的站點為0
+        predicted_flow = np.zeros(len(station_list), dtype=np.float32)
+        if isinstance(predictions, np.ndarray) and len(predictions.shape) >= 2:
+            station_outputs = predictions[0, :, 0] if len(predictions.shape) > 2 else predictions[0]
+            n_outputs = min(len(station_list), len(station_outputs))
+            predicted_flow[:n_outputs] = station_outputs[:n_outputs]
+        else:
+            predicted_flow[:] = [predictions.get(station, 0) for station in station_list]
+        
+        # 反正規化，並確保非負值
+        predicted_flow *= np.float32(self.normalization_params['std'])
+        predicted_flow += self._norm_mean
+        np.maximum(predicted_flow, 0, out=predicted_flow)
+        
+        # 站點在 target_stations 中的位置，非目標站點為 -1
+        station_idx = [self.station_index.get(station, -1) for station in station_list]
+        
+        # 估算速度（基於流量的簡化模型）與信心度
+        predicted_speed = self._estimate_speed_from_flow(predicted_flow)
+        confidence = self._calculate_confidence(np.array(station_idx, dtype=np.int64), predicted_flow, current_hour)
+        
+        # 處理預測結果
+        timestamp = current_time.isoformat()
+        time_horizon = self.model_params['output_length'] * 5  # 分鐘
+        prediction_results = [
+            {
+                'station_id': station,
+                'location_name': self.station_names[idx] if idx >= 0 else f'站點_{station}',
+                'predicted_flow': round(flow, 1),
+                'predicted_speed': round(speed, 1),
+                'confidence': round(conf, 3),
+                'time_horizon': time_horizon,
+                'timestamp': timestamp,
+                'highway': self.station_highways[idx] if idx >= 0 else '',
+                'direction': self.station_directions[idx] if idx >= 0 else ''
+            }
+            for station, idx, flow, speed, conf in zip(
+                station_list,
+                station_idx,
+                predicted_flow.tolist(),
+                predicted_speed.tolist(),
+                confidence.tolist()
+            )
+        ]
+        
+        # 組合最終結果
+        result = {
+            'predictions': prediction_results,
+            'model_version': 'MT-STNet-v1.0',
+            'prediction_time': current_time.isoformat(),
+            'time_horizon_minutes': self.model_params['output_length'] * 5,
+            'total_stations': len(prediction_results),
+            'data_source': 'REALTIME'
+        }
+        
+        # 快取預測結果
+        self.prediction_cache.append(result)
+        
+        return result
+
+    def _simple_prediction(self, input_data: np.ndarray, station_list: List[str], time_factor: float) -> np.ndarray:
+        """簡化預測邏輯（當模型未載入時使用），回傳 [1, stations] 的預測流量"""
+        try:
+            # 基於歷史趨勢的簡單預測：最近兩個時間點的流量，形狀 [2, stations]
+            recent_flows = np.ascontiguousarray(input_data[0, -2:, :len(station_list), 0], dtype=np.float32)
+            
+            # 預測下一個時間點（加上趨勢），再乘上時間因子（考慮交通模式）
+            predictions = _simple_prediction_kernel(recent_flows, float(time_factor))
+            
+            return predictions[None, :]
+            
+        except Exception as e:
+            self.logger.error(f"❌ 簡化預測失敗: {e}")
+            return np.zeros((1, len(station_list)), dtype=np.float32)
+
     def _get_time_factor(self, hour: int) -> float:
         """根據時間取得交通流量因子"""
         # 簡化的時間因子（基於一般交通模式）
@@ -490,36 +831,25 @@ class MTSTNetRealtimePredictor:
         else:  # 其他時間
             return 1.0
 
-    def _estimate_speed_from_flow(self, flow: float) -> float:
-        """根據流量估算速度"""
-        # 簡化的流量-速度關係模型
-        if flow <= 0:
-            return 90  # 自由流速度
-        elif flow <= 1000:
-            return 90 - (flow / 1000) * 20  # 線性下降
-        elif flow <= 2000:
-            return 70 - ((flow - 1000) / 1000) * 30
-        else:
-            return max(20, 40 - ((flow - 2000) / 1000) * 15)  # 擁塞狀態
+    def _estimate_speed_from_flow(self, flow: np.ndarray) -> np.ndarray:
+        """根據流量估算速度（逐站點向量化）"""
+        return _estimate_speed_kernel(np.ascontiguousarray(flow, dtype=np.float32))
 
-    def _calculate_confidence(self, station: str, predicted_flow: float) -> float:
-        """計算預測信心度"""
-        base_confidence = 0.75
+    def _calculate_confidence(self, station_idx: np.ndarray, predicted_flow: np.ndarray, current_hour: int) -> np.ndarray:
+        """計算各站點預測信心度（station_idx 為站點在 target_stations 中的位置，-1 表示非目標站點）"""
+        base_confidence = np.full(len(station_idx), 0.75, dtype=np.float32)
         
         # 根據資料品質調整
-        if predicted_flow > 0:
-            base_confidence += 0.1
+        base_confidence += np.where(predicted_flow > 0, 0.1, 0.0)
         
-        # 根據站點重要性調整
-        if station in self.target_stations[:20]:  # 前20個重要站點
-            base_confidence += 0.05
+        # 根據站點重要性調整（前20個重要站點）
+        base_confidence += np.where((station_idx >= 0) & (station_idx < 20), 0.05, 0.0)
         
         # 根據時間調整（白天信心度較高）
-        current_hour = datetime.now().hour
         if 6 <= current_hour <= 22:
             base_confidence += 0.05
         
-        return min(0.95, max(0.5, base_confidence))
+        return np.clip(base_confidence, 0.5, 0.95)
 
     def save_predictions(self, predictions: Dict) -> str:
         """保存預測結果"""
@@ -528,8 +858,14 @@ class MTSTNetRealtimePredictor:
             filename = f"mt_stnet_predictions_{current_time.strftime('%Y%m%d_%H%M')}.json"
             filepath = self.output_dir / filename
             
-            with open(filepath, 'w', encoding='utf-8') as f:
-                json.dump(predictions, f, ensure_ascii=False, indent=2)
+            if ORJSON_AVAILABLE:
+                # orjson 直接輸出 UTF-8 位元組，序列化速度較標準庫快數倍
+                filepath.write_bytes(orjson.dumps(
+                    predictions, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+                ))
+            else:
+                with open(filepath, 'w', encoding='utf-8') as f:
+                    json.dump(predictions, f, ensure_ascii=False, indent=2)
             
             self.logger.info(f"💾 預測結果已保存: {filepath}")
             return str(filepath)
@@ -545,13 +881,14 @@ class MTSTNetRealtimePredictor:
         else:
             return {'predictions': [], 'message': '暫無預測資料'}
 
-    def run_single_prediction(self) -> Dict:
-        """執行單次預測"""
+    def run_single_prediction(self, realtime_data: Optional[pd.DataFrame] = None) -> Dict:
+        """執行單次預測；realtime_data 可傳入預先取得的即時資料"""
         try:
             self.logger.info("🔮 開始執行單次預測...")
             
             # 取得即時資料
-            realtime_data = self.get_realtime_data()
+            if realtime_data is None:
+                realtime_data = self.get_realtime_data()
             if realtime_data.empty:
                 return {'predictions': [], 'error': '無可用的即時資料'}
             
@@ -562,12 +899,25 @@ class MTSTNetRealtimePredictor:
             
             input_data, station_list = processed_result
             
-            # 執行預測
+            # 輸入與上次相同（上游資料未更新）時，直接沿用上次結果，只更新時間戳記
+            current_time = datetime.now()
+            input_hash = hash((input_data.tobytes(), tuple(station_list), current_time.hour))
+            last_input = self._last_input
+            if last_input is not None and last_input[0] == input_hash:
+                self.logger.info("♻️ 即時資料未更新，沿用上次預測結果")
+                predictions = self._refresh_cached_prediction(last_input[1], current_time)
+                # 與實際推論相同：加入快取並於背景保存，讓 get_latest_predictions 與輸出檔維持最新時間戳記
+                self.prediction_cache.append(predictions)
+                self._get_io_pool().submit(self.save_predictions, predictions)
+                return predictions
+            
+            # 執行預測（單一呼叫端，直接推論；批次佇列只用於 submit_prediction 的並發請求）
             predictions = self.predict_traffic(input_data, station_list)
             
-            # 保存結果
+            # 保存結果（背景寫檔，不等待完成）
             if predictions.get('predictions'):
-                self.save_predictions(predictions)
+                self._last_input = (input_hash, predictions)
+                self._get_io_pool().submit(self.save_predictions, predictions)
             
             return predictions
             
@@ -575,49 +925,102 @@ class MTSTNetRealtimePredictor:
             self.logger.error(f"❌ 單次預測失敗: {e}")
             return {'predictions': [], 'error': str(e)}
 
+    async def _run_loop(self):
+        """持續預測的事件迴圈：等待改用 asyncio.sleep，阻塞的資料取得與預測交給執行緒池"""
+        loop = asyncio.get_running_loop()
+        prefetch = None
+        while self.is_running:
+            try:
+                # 檢查是否需要執行預測
+                current_time = datetime.now()
+                seconds_until_due = 0 if self.last_prediction_time is None else (
+                    self.prediction_interval * 60 - (current_time - self.last_prediction_time).total_seconds())
+                
+                if seconds_until_due <= 0:
+                    
+                    self.logger.info(f"⏰ 執行定時預測 - {current_time.strftime('%H:%M:%S')}")
+                    
+                    # 執行預測（使用預先取得的資料）
+                    realtime_data = await prefetch if prefetch is not None else None
+                    prefetch = None
+                    result = await loop.run_in_executor(None, self.run_single_prediction, realtime_data)
+                    
+                    if result.get('predictions'):
+                        self.last_prediction_time = current_time
+                        self.logger.info(f"✅ 預測完成: {len(result['predictions'])} 個站點")
+                    else:
+                        self.logger.warning("⚠️ 預測無結果")
+                
+                elif prefetch is None and seconds_until_due <= 30:
+                    # 下次檢查時即到期，先在背景取得即時資料
+                    prefetch = loop.run_in_executor(self._get_io_pool(), self.get_realtime_data)
+                
+                # 等待30秒後再檢查
+                await asyncio.sleep(30)
+                
+            except Exception as e:
+                self.logger.error(f"❌ 預測循環錯誤: {e}")
+                prefetch = None
+                await asyncio.sleep(60)  # 錯誤時等待更長時間
+
+    def _run_event_loop(self):
+        """在背景線程執行持續預測的事件迴圈（同步呼叫 start_continuous_prediction 時使用）"""
+        asyncio.set_event_loop(self._loop)
+        try:
+            self._loop.run_until_complete(self.prediction_task)
+        except asyncio.CancelledError:
+            pass
+        finally:
+            self._loop.close()
+
+    def _refresh_cached_prediction(self, cached: Dict, current_time: datetime) -> Dict:
+        """複製快取的預測結果並更新時間戳記"""
+        timestamp = current_time.isoformat()
+        result = dict(cached)
+        result['prediction_time'] = timestamp
+        result['predictions'] = [dict(prediction, timestamp=timestamp) for prediction in cached['predictions']]
+        return result
+
     def start_continuous_prediction(self):
         """啟動持續預測"""
         self.logger.info("🚀 啟動MT-STNet持續預測模式")
         self.is_running = True
         
-        def prediction_loop():
-            while self.is_running:
-                try:
-                    # 檢查是否需要執行預測
-                    current_time = datetime.now()
-                    
-                    if (self.last_prediction_time is None or 
-                        (current_time - self.last_prediction_time).total_seconds() >= self.prediction_interval * 60):
-                        
-                        self.logger.info(f"⏰ 執行定時預測 - {current_time.strftime('%H:%M:%S')}")
-                        
-                        # 執行預測
-                        result = self.run_single_prediction()
-                        
-                        if result.get('predictions'):
-                            self.last_prediction_time = current_time
-                            self.logger.info(f"✅ 預測完成: {len(result['predictions'])} 個站點")
-                        else:
-                            self.logger.warning("⚠️ 預測無結果")
-                    
-                    # 等待30秒後再檢查
-                    time.sleep(30)
-                    
-                except Exception as e:
-                    self.logger.error(f"❌ 預測循環錯誤: {e}")
-                    time.sleep(60)  # 錯誤時等待更長時間
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            loop = None
         
-        # 啟動預測線程
-        self.prediction_thread = threading.Thread(target=prediction_loop, daemon=True)
-        self.prediction_thread.start()
+        if loop is not None:
+            # 已在事件迴圈中（例如 API 服務），直接建立任務
+            self._loop = loop
+            self.prediction_task = loop.create_task(self._run_loop())
+        else:
+            # 同步呼叫時，以單一背景線程執行事件迴圈
+            self._loop = asyncio.new_event_loop()
+            self.prediction_task = self._loop.create_task(self._run_loop())
+            self.prediction_thread = threading.Thread(target=self._run_event_loop, daemon=True)
+            self.prediction_thread.start()
         
         self.logger.info(f"✅ 持續預測已啟動，間隔: {self.prediction_interval} 分鐘")
 
     def stop_continuous_prediction(self):
         """停止持續預測"""
         self.is_running = False
+        if self.prediction_task is not None and not self.prediction_task.done() and not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(self.prediction_task.cancel)
         if self.prediction_thread and self.prediction_thread.is_alive():
             self.prediction_thread.join(timeout=5)
+        self.prediction_task = None
+        
+        # 關閉批次佇列工作線程與 I/O 執行緒池（等待已排入的寫檔完成）
+        with self._batching_lock:
+            batching_queue, self.batching_queue = self.batching_queue, None
+            io_pool, self._io_pool = self._io_pool, None
+        if batching_queue is not None:
+            batching_queue.close()
+        if io_pool is not None:
+            io_pool.shutdown(wait=True)
         self.logger.info("🛑 持續預測已停止")
 
     def get_system_status(self) -> Dict:
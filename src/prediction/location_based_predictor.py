@@ -9,12 +9,189 @@ import requests
 import time
 import logging
 import sqlite3
+import threading
+import asyncio
+import atexit
+from collections import OrderedDict
+from dataclasses import dataclass
+from concurrent.futures import Future, ThreadPoolExecutor
 from datetime import datetime, timedelta
 from math import radians, sin, cos, sqrt, atan2
 from typing import Dict, List, Tuple, Optional
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import warnings
 warnings.filterwarnings('ignore')
 
+try:
+    import aiohttp
+    AIOHTTP_AVAILABLE = True
+except ImportError:
+    AIOHTTP_AVAILABLE = False
+
+try:
+    from cachetools import TTLCache
+    CACHETOOLS_AVAILABLE = True
+except ImportError:
+    CACHETOOLS_AVAILABLE = False
+
+try:
+    from scipy.spatial import cKDTree
+    SCIPY_AVAILABLE = True
+except ImportError:
+    SCIPY_AVAILABLE = False
+
+try:
+    from numba import njit
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+
+EARTH_RADIUS_KM = 6371  # 地球半徑（公里）
+GEOCODE_URL = "https://maps.googleapis.com/maps/api/geocode/json"
+GEOCODE_CACHE_SIZE = 10000       # 地理編碼快取上限（筆）
+GEOCODE_CACHE_TTL = 86400        # 地理編碼快取有效期（秒）
+REVERSE_GEOCODE_DECIMALS = 4     # 座標轉地址快取鍵的小數位數（約11公尺網格）
+PREDICTION_FLUSH_ROWS = 50       # 預測記錄累積筆數達此值即寫入資料庫
+PREDICTION_FLUSH_INTERVAL = 0.5  # 預測記錄最長暫存時間（秒）
+
+
+class _SimpleTTLCache:
+    """未安裝 cachetools 時使用的簡易 TTL 快取（容量滿時淘汰最舊項目；非執行緒安全，由呼叫端加鎖）"""
+    
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+    
+    def __contains__(self, key):
+        item = self._data.get(key)
+        if item is None:
+            return False
+        if item[1] < time.monotonic():
+            del self._data[key]
+            return False
+        return True
+    
+    def __getitem__(self, key):
+        if key not in self:
+            raise KeyError(key)
+        return self._data[key][0]
+    
+    def __setitem__(self, key, value):
+        self._data.pop(key, None)
+        while len(self._data) >= self.maxsize:
+            self._data.popitem(last=False)
+        self._data[key] = (value, time.monotonic() + self.ttl)
+    
+    def __len__(self):
+        return len(self._data)
+
+
+# 衝擊波/預警等級序數（不分大小寫；檢測器的 mild 與預警系統的 MINOR 同級）
+_LEVEL_RANK = {'INFO': 0, 'MILD': 1, 'MINOR': 1, 'MODERATE': 2, 'SEVERE': 3, 'CRITICAL': 4}
+_SEVERE_RANK = _LEVEL_RANK['SEVERE']
+
+_EPOCH = datetime(1970, 1, 1)
+
+
+@dataclass(frozen=True)
+class Station:
+    """站點位置記錄（固定欄位，以 __slots__ 儲存，不帶每筆物件的 __dict__）"""
+    __slots__ = ('id', 'code', 'original_code', 'direction', 'start_ic', 'end_ic',
+                 'latitude', 'longitude', 'readable_name')
+    id: int
+    code: str
+    original_code: str
+    direction: str
+    start_ic: str
+    end_ic: str
+    latitude: float
+    longitude: float
+    readable_name: str
+
+    def to_dict(self) -> Dict:
+        """轉為回傳結果用的字典（欄位順序與宣告順序相同）"""
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+def _level_rank(level) -> int:
+    """等級字串轉序數，未知等級視為 0"""
+    return _LEVEL_RANK.get(level.upper(), 0) if isinstance(level, str) else 0
+
+
+def _wall_clock_seconds(moment: datetime) -> float:
+    """naive 時間（本地牆上時鐘）換算為自 1970-01-01 起的秒數，相減結果與 datetime 相減一致"""
+    return (moment - _EPOCH).total_seconds()
+
+
+def _parse_arrival_column(values: pd.Series) -> Dict[str, float]:
+    """將預計到達時間欄位一次向量化解析，回傳 {原字串: 牆上時鐘秒數}；無法解析者略過"""
+    strings = values.dropna().astype(str).unique()
+    parsed = pd.to_datetime(pd.Series(strings), errors='coerce', format='ISO8601')
+    valid = parsed.notna().to_numpy()
+    seconds = parsed[valid].to_numpy(dtype='datetime64[ns]').astype(np.int64) / 1e9
+    return dict(zip(strings[valid], seconds.tolist()))
+
+
+def _haversine_km_python(lat1, lng1, lat2, lng2):
+    """兩點間Haversine距離（公里），輸入為經緯度（度）"""
+    lat1, lng1, lat2, lng2 = radians(lat1), radians(lng1), radians(lat2), radians(lng2)
+    a = sin((lat2 - lat1) / 2) ** 2 + cos(lat1) * cos(lat2) * sin((lng2 - lng1) / 2) ** 2
+    return EARTH_RADIUS_KM * 2 * atan2(sqrt(a), sqrt(1 - a))
+
+
+def _haversine_batch_numpy(lat1, lng1, st_lat, st_lng, st_cos_lat):
+    """單點到多個站點的Haversine距離（公里）；座標皆為弧度，st_cos_lat 為預先計算的站點緯度餘弦"""
+    a = np.sin((st_lat - lat1) / 2) ** 2 + cos(lat1) * st_cos_lat * np.sin((st_lng - lng1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+if NUMBA_AVAILABLE:
+    _haversine_km = njit(fastmath=True)(_haversine_km_python)
+
+    @njit(fastmath=True)
+    def _haversine_batch_kernel(lat1, lng1, st_lat, st_lng, st_cos_lat):
+        """單點到多個站點距離的逐元素核心"""
+        n = st_lat.shape[0]
+        out = np.empty(n, dtype=np.float64)
+        cos_lat1 = cos(lat1)
+        for j in range(n):
+            a = sin((st_lat[j] - lat1) / 2) ** 2 + cos_lat1 * st_cos_lat[j] * sin((st_lng[j] - lng1) / 2) ** 2
+            out[j] = 2 * EARTH_RADIUS_KM * np.arcsin(sqrt(min(a, 1.0)))
+        return out
+else:
+    _haversine_km = _haversine_km_python
+    _haversine_batch_kernel = _haversine_batch_numpy
+
+# 國道與行車方向位元旗標：受影響範圍以位元 OR 累積，判斷時只需整數比較
+HIGHWAY_BITS = {'01F': 1, '03F': 2}
+DIRECTION_BITS = {'N': 1, 'S': 2}
+
+ROUTE_RISK_JIT_MIN = 8  # 預測筆數少於此值時直接以 Python 迴圈計算，省去呼叫編譯核心的開銷
+
+
+def _route_risk_python(strengths, confidences, level_ranks, severe_rank):
+    """路線風險彙總：回傳 (最大風險分數, 平均風險分數, 嚴重路段數)，風險分數 = 強度 × 信心度"""
+    n = strengths.shape[0]
+    max_risk = -np.inf
+    total = 0.0
+    severe_count = 0
+    for i in range(n):
+        risk = strengths[i] * confidences[i]
+        total += risk
+        if risk > max_risk:
+            max_risk = risk
+        if level_ranks[i] >= severe_rank:
+            severe_count += 1
+    return max_risk, total / n, severe_count
+
+
+if NUMBA_AVAILABLE:
+    _route_risk_kernel = njit(fastmath=True)(_route_risk_python)
+else:
+    _route_risk_kernel = _route_risk_python
+
 # 導入現有的系統
 from .realtime_shock_predictor import RealtimeShockPredictor
 from ..systems.shock_warning_system import ShockWarningSystem
@@ -31,6 +208,9 @@ class LocationBasedShockPredictor:
     5. 基於位置的智能預警
     """
     
+    # 起終點預測與地理編碼皆以 I/O 為主，共用執行緒池並行處理
+    _executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix='location_predictor')
+    
     def __init__(self, data_dir: str, google_api_key: str, config: Dict = None):
         """初始化基於位置的預測系統"""
         
@@ -61,16 +241,33 @@ class LocationBasedShockPredictor:
         self.shock_predictor = RealtimeShockPredictor(data_dir)
         self.warning_system = ShockWarningSystem(data_dir)
         
+        # Google Maps API 共用連線池（重用 TCP/TLS 連線，暫時性錯誤自動重試）
+        self.http_session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=8, pool_maxsize=32,
+                              max_retries=Retry(total=2, backoff_factor=0.2))
+        self.http_session.mount('https://', adapter)
+        
         # 初始化資料庫
         self._init_location_database()
         
         # 載入站點資訊
         self.station_locations = self._load_station_locations()
+        self._build_station_arrays()
+        
+        # 預先編譯距離核心，避免第一次查詢時等待JIT
+        if NUMBA_AVAILABLE:
+            self._warmup_kernels()
         
         # 快取
         self.location_cache = {}
-        self.geocoding_cache = {}
+        self.geocoding_cache = (TTLCache if CACHETOOLS_AVAILABLE else _SimpleTTLCache)(
+            maxsize=GEOCODE_CACHE_SIZE, ttl=GEOCODE_CACHE_TTL
+        )
+        self._geocode_lock = threading.Lock()
+        self._geocode_inflight = {}  # 進行中的地理編碼請求：快取鍵 → Future
         self.route_cache = {}
+        self._predictions_cache = (None, [], {})  # ((檔案路徑, 修改時間), 預測記錄, 目標站點 → 記錄位置)
+        self._arrival_seconds = {}  # 目前預測檔中預計到達時間字串 → 牆上時鐘秒數
         
         self.logger.info("📍 基於位置的衝擊波預測系統初始化完成")
         self.logger.info(f"🗺️ Google Maps API: {'已配置' if google_api_key else '未配置'}")
@@ -95,8 +292,24 @@ class LocationBasedShockPredictor:
         """初始化位置資料庫"""
         self.db_path = os.path.join(self.location_dir, "locations.db")
         
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
+        # 保持單一長連線（自動提交），以鎖序列化跨執行緒存取；WAL 讓寫入不阻塞讀取
+        self._db_lock = threading.Lock()
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False, isolation_level=None)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute('PRAGMA temp_store=MEMORY')
+        self._conn.execute('PRAGMA cache_size=-20000')
+        self._conn.execute('PRAGMA busy_timeout=5000')
+        
+        # 位置預測記錄先暫存於記憶體，批次寫入；程式結束時寫入剩餘記錄
+        self._pred_buffer = []
+        self._pred_buffer_lock = threading.Lock()
+        self._last_pred_flush = time.monotonic()
+        self._pred_flush_timer = None
+        atexit.register(self.flush_pending_writes)
+        
+        with self._db_lock:
+            cursor = self._conn.cursor()
             
             # 用戶位置表
             cursor.execute('''
@@ -144,7 +357,31 @@ class LocationBasedShockPredictor:
                 )
             ''')
             
-            conn.commit()
+            # 最新位置查詢用的複合索引
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_user_locations_user_time
+                ON user_locations(user_id, update_time DESC)
+            ''')
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_location_predictions_user_time
+                ON location_predictions(user_id, created_time DESC)
+            ''')
+            
+            # 位置空間索引（R-tree），SQLite 未編入 R-tree 模組時退回一般範圍查詢
+            try:
+                cursor.execute('''
+                    CREATE VIRTUAL TABLE IF NOT EXISTS user_locations_rtree
+                    USING rtree(id, min_lat, max_lat, min_lng, max_lng)
+                ''')
+                # 補上建立索引前已存在的位置記錄
+                cursor.execute('''
+                    INSERT INTO user_locations_rtree
+                    SELECT id, latitude, latitude, longitude, longitude FROM user_locations
+                    WHERE id > (SELECT COALESCE(MAX(id), 0) FROM user_locations_rtree)
+                ''')
+                self._rtree_available = True
+            except sqlite3.OperationalError:
+                self._rtree_available = False
 
     def _load_station_locations(self):
         """載入站點位置資訊"""
@@ -172,10 +409,11 @@ class LocationBasedShockPredictor:
             return {}
 
         try:
-            df = pd.read_csv(etag_file, encoding='utf-8')
+            df = self._read_station_table(etag_file)
             
+            # 逐列迭代改用純字典避免每列建立 Series
             stations = {}
-            for _, row in df.iterrows():
+            for row in df.to_dict('records'):
                 station_code = row['編號']
                 if pd.isna(station_code):
                     continue
@@ -183,17 +421,17 @@ class LocationBasedShockPredictor:
                 # 轉換為標準格式
                 clean_code = station_code.replace('-', '').replace('.', '')
                 
-                stations[clean_code] = {
-                    'id': row['ID'],
-                    'code': clean_code,
-                    'original_code': station_code,
-                    'direction': row['方向'],
-                    'start_ic': row['交流道(起)'],
-                    'end_ic': row['交流道(迄)'],
-                    'latitude': float(row['緯度(北緯)']),
-                    'longitude': float(row['經度(東經)']),
-                    'readable_name': f"{row['交流道(起)']} → {row['交流道(迄)']} ({row['方向']}向)"
-                }
+                stations[clean_code] = Station(
+                    id=row['ID'],
+                    code=clean_code,
+                    original_code=station_code,
+                    direction=row['方向'],
+                    start_ic=row['交流道(起)'],
+                    end_ic=row['交流道(迄)'],
+                    latitude=row['緯度(北緯)'],
+                    longitude=row['經度(東經)'],
+                    readable_name=f"{row['交流道(起)']} → {row['交流道(迄)']} ({row['方向']}向)"
+                )
             
             self.logger.info(f"✅ 載入 {len(stations)} 個站點位置")
             return stations
@@ -202,38 +440,131 @@ class LocationBasedShockPredictor:
             self.logger.error(f"❌ 載入站點位置失敗: {e}")
             return {}
 
+    def _read_station_table(self, etag_file: str) -> pd.DataFrame:
+        """讀取站點表（經緯度欄位已轉為浮點數），解析結果以檔案修改時間為鍵快取成 pickle"""
+        cache_file = os.path.join(os.path.dirname(etag_file), '.etag_stations.pkl')
+        try:
+            if os.path.exists(cache_file) and os.path.getmtime(cache_file) >= os.path.getmtime(etag_file):
+                return pd.read_pickle(cache_file)
+        except Exception as e:
+            self.logger.warning(f"⚠️ 站點位置快取無法讀取，重新解析: {e}")
+        
+        df = pd.read_csv(etag_file, encoding='utf-8')
+        
+        # 經緯度整欄轉為浮點數
+        coord_columns = ['緯度(北緯)', '經度(東經)']
+        df[coord_columns] = df[coord_columns].astype(np.float64)
+        
+        try:
+            df.to_pickle(cache_file)
+        except OSError as e:
+            self.logger.warning(f"⚠️ 無法寫入站點位置快取: {e}")
+        
+        return df
+
+    def _build_station_arrays(self):
+        """將站點座標展開為平行陣列（弧度與緯度餘弦預先計算），供向量化距離計算使用"""
+        self._stations = list(self.station_locations.values())
+        self._st_codes = list(self.station_locations.keys())
+        self._st_lat = np.radians(np.array([s.latitude for s in self._stations], dtype=np.float64))
+        self._st_lng = np.radians(np.array([s.longitude for s in self._stations], dtype=np.float64))
+        self._st_cos_lat = np.cos(self._st_lat)
+        
+        # 以單位球面三維座標建立KD-tree：弦長與大圓距離單調對應，範圍查詢不需近似
+        self._kdtree = None
+        if SCIPY_AVAILABLE and self._stations:
+            self._kdtree = cKDTree(np.column_stack([
+                self._st_cos_lat * np.cos(self._st_lng),
+                self._st_cos_lat * np.sin(self._st_lng),
+                np.sin(self._st_lat)
+            ]))
+
+    def _warmup_kernels(self):
+        """以小型輸入觸發 numba 編譯"""
+        _haversine_km(25.0, 121.5, 24.0, 121.0)
+        dummy = np.zeros(1, dtype=np.float64)
+        _haversine_batch_kernel(0.0, 0.0, dummy, dummy, dummy + 1.0)
+        _route_risk_kernel(dummy, dummy, np.zeros(1, dtype=np.int8), _SEVERE_RANK)
+
+    def _distances_to_stations(self, latitude: float, longitude: float, idx: Optional[np.ndarray] = None) -> np.ndarray:
+        """以Haversine公式一次計算指定座標到站點（全部或 idx 指定者）的距離（公里）"""
+        st_lat, st_lng, st_cos_lat = self._st_lat, self._st_lng, self._st_cos_lat
+        if idx is not None:
+            st_lat, st_lng, st_cos_lat = st_lat[idx], st_lng[idx], st_cos_lat[idx]
+        
+        return _haversine_batch_kernel(radians(latitude), radians(longitude), st_lat, st_lng, st_cos_lat)
+
+    def _stations_within(self, latitude: float, longitude: float, max_distance_km: float) -> Tuple[np.ndarray, np.ndarray]:
+        """回傳搜尋範圍內的站點索引（依站點順序）與其距離"""
+        if self._kdtree is not None:
+            # 範圍換算為單位球面上的弦長，略為放寬以涵蓋浮點誤差，最終以Haversine精確過濾
+            lat1, lng1 = radians(latitude), radians(longitude)
+            point = (cos(lat1) * cos(lng1), cos(lat1) * sin(lng1), sin(lat1))
+            chord = 2 * sin(min(max_distance_km / (2 * EARTH_RADIUS_KM), np.pi / 2))
+            idx = np.array(sorted(self._kdtree.query_ball_point(point, chord * (1 + 1e-9) + 1e-12)), dtype=np.intp)
+            distances = self._distances_to_stations(latitude, longitude, idx)
+        else:
+            idx = np.arange(len(self._stations))
+            distances = self._distances_to_stations(latitude, longitude)
+        
+        in_range = distances <= max_distance_km
+        return idx[in_range], distances[in_range]
+
     def calculate_distance(self, lat1: float, lng1: float, lat2: float, lng2: float) -> float:
         """計算兩點間距離（公里）"""
         # 使用Haversine公式
-        R = 6371  # 地球半徑（公里）
-        
-        lat1, lng1, lat2, lng2 = map(radians, [lat1, lng1, lat2, lng2])
-        dlat = lat2 - lat1
-        dlng = lng2 - lng1
+        return _haversine_km(float(lat1), float(lng1), float(lat2), float(lng2))
+
+    def _geocode_once(self, cache_key: tuple, fetch):
+        """共用快取與請求合併：同一快取鍵同時只發出一次API請求，其餘呼叫等待同一結果
+        
+        fetch 回傳 None 代表失敗，不寫入快取
+        """
+        with self._geocode_lock:
+            if cache_key in self.geocoding_cache:
+                return self.geocoding_cache[cache_key]
+            
+            future = self._geocode_inflight.get(cache_key)
+            is_owner = future is None
+            if is_owner:
+                future = Future()
+                self._geocode_inflight[cache_key] = future
         
-        a = sin(dlat/2)**2 + cos(lat1) * cos(lat2) * sin(dlng/2)**2
-        c = 2 * atan2(sqrt(a), sqrt(1-a))
+        if not is_owner:
+            return future.result()
         
-        return R * c
+        try:
+            result = fetch()
+            if result is not None:
+                with self._geocode_lock:
+                    self.geocoding_cache[cache_key] = result
+            future.set_result(result)
+            return result
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._geocode_lock:
+                self._geocode_inflight.pop(cache_key, None)
 
     def geocode_address(self, address: str) -> Optional[Tuple[float, float]]:
         """地址轉座標"""
-        if address in self.geocoding_cache:
-            return self.geocoding_cache[address]
-        
         if not self.google_api_key:
             self.logger.warning("Google API Key未設定，無法進行地址轉座標")
             return None
         
+        return self._geocode_once(('address', address), lambda: self._request_geocode(address))
+
+    def _request_geocode(self, address: str) -> Optional[Tuple[float, float]]:
+        """呼叫 Geocoding API 將地址轉為座標"""
         try:
-            url = "https://maps.googleapis.com/maps/api/geocode/json"
             params = {
                 'address': address,
                 'key': self.google_api_key,
                 'region': 'tw'  # 台灣區域偏好
             }
             
-            response = requests.get(url, params=params, timeout=10)
+            response = self.http_session.get(GEOCODE_URL, params=params, timeout=10)
             response.raise_for_status()
             
             data = response.json()
@@ -242,9 +573,6 @@ class LocationBasedShockPredictor:
                 location = data['results'][0]['geometry']['location']
                 coordinates = (location['lat'], location['lng'])
                 
-                # 快取結果
-                self.geocoding_cache[address] = coordinates
-                
                 self.logger.info(f"📍 地址轉座標成功: {address} → {coordinates}")
                 return coordinates
             else:
@@ -257,62 +585,183 @@ class LocationBasedShockPredictor:
 
     def reverse_geocode(self, latitude: float, longitude: float) -> Optional[str]:
         """座標轉地址"""
-        cache_key = f"{latitude:.6f},{longitude:.6f}"
-        if cache_key in self.geocoding_cache:
-            return self.geocoding_cache[cache_key]
-        
+        fallback = f"位置: {latitude:.6f}, {longitude:.6f}"
         if not self.google_api_key:
-            return f"位置: {latitude:.6f}, {longitude:.6f}"
+            return fallback
+        
+        cache_key = self._reverse_geocode_key(latitude, longitude)
+        address = self._geocode_once(cache_key, lambda: self._request_reverse_geocode(latitude, longitude))
+        
+        return address if address is not None else fallback
+
+    def _reverse_geocode_key(self, latitude: float, longitude: float) -> tuple:
+        """座標轉地址的快取鍵：座標量化為約11公尺網格，GPS 連續回報的微小飄移可共用同一筆快取"""
+        return ('latlng', round(latitude, REVERSE_GEOCODE_DECIMALS), round(longitude, REVERSE_GEOCODE_DECIMALS))
+
+    def reverse_geocode_many(self, coords: List[Tuple[float, float]]) -> List[Optional[str]]:
+        """批次座標轉地址（同步介面），適用於大量用戶位置匯入等批次工作"""
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return asyncio.run(self._reverse_geocode_many(coords))
+        
+        # 呼叫端已在事件迴圈中，改在背景執行緒執行，避免巢狀事件迴圈
+        return self._executor.submit(asyncio.run, self._reverse_geocode_many(coords)).result()
+
+    async def _reverse_geocode_many(self, coords: List[Tuple[float, float]]) -> List[Optional[str]]:
+        """批次座標轉地址：先查快取，只對未命中者以有限並行數發出請求"""
+        results = [None] * len(coords)
+        misses = {}  # 快取鍵 → (代表座標, 結果位置列表)
+        
+        with self._geocode_lock:
+            for i, (latitude, longitude) in enumerate(coords):
+                cache_key = self._reverse_geocode_key(latitude, longitude)
+                if cache_key in self.geocoding_cache:
+                    results[i] = self.geocoding_cache[cache_key]
+                else:
+                    misses.setdefault(cache_key, ((latitude, longitude), []))[1].append(i)
         
+        if misses and self.google_api_key:
+            if AIOHTTP_AVAILABLE:
+                semaphore = asyncio.Semaphore(8)
+                connector = aiohttp.TCPConnector(limit=16)
+                timeout = aiohttp.ClientTimeout(total=10)
+                
+                async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+                    async def fetch(latitude, longitude):
+                        async with semaphore:
+                            return await self._request_reverse_geocode_async(session, latitude, longitude)
+                    
+                    addresses = await asyncio.gather(*(fetch(*point) for point, _ in misses.values()))
+            else:
+                # 未安裝 aiohttp 時以獨立執行緒池並行同步請求；不可用共用的 _executor，
+                # 否則事件迴圈內呼叫時外層已佔用其工作線程，並發呼叫會互相等待而死結
+                loop = asyncio.get_running_loop()
+                with ThreadPoolExecutor(max_workers=8, thread_name_prefix='reverse_geocode') as pool:
+                    addresses = await asyncio.gather(*(
+                        loop.run_in_executor(pool, self._request_reverse_geocode, *point)
+                        for point, _ in misses.values()
+                    ))
+            
+            with self._geocode_lock:
+                for (cache_key, (_, positions)), address in zip(misses.items(), addresses):
+                    if address is None:
+                        continue
+                    self.geocoding_cache[cache_key] = address
+                    for i in positions:
+                        results[i] = address
+        
+        return [
+            address if address is not None else f"位置: {latitude:.6f}, {longitude:.6f}"
+            for address, (latitude, longitude) in zip(results, coords)
+        ]
+
+    async def _request_reverse_geocode_async(self, session, latitude: float, longitude: float) -> Optional[str]:
+        """以 aiohttp 呼叫 Geocoding API 將座標轉為地址"""
+        try:
+            params = {
+                'latlng': f"{latitude},{longitude}",
+                'key': self.google_api_key,
+                'language': 'zh-TW'
+            }
+            
+            async with session.get(GEOCODE_URL, params=params) as response:
+                response.raise_for_status()
+                data = await response.json()
+            
+            if data['status'] == 'OK' and data['results']:
+                return data['results'][0]['formatted_address']
+            else:
+                return None
+                
+        except Exception as e:
+            self.logger.error(f"❌ 座標轉地址錯誤: {e}")
+            return None
+
+    def _request_reverse_geocode(self, latitude: float, longitude: float) -> Optional[str]:
+        """呼叫 Geocoding API 將座標轉為地址"""
         try:
-            url = "https://maps.googleapis.com/maps/api/geocode/json"
             params = {
                 'latlng': f"{latitude},{longitude}",
                 'key': self.google_api_key,
                 'language': 'zh-TW'
             }
             
-            response = requests.get(url, params=params, timeout=10)
+            response = self.http_session.get(GEOCODE_URL, params=params, timeout=10)
             response.raise_for_status()
             
             data = response.json()
             
             if data['status'] == 'OK' and data['results']:
-                address = data['results'][0]['formatted_address']
-                
-                # 快取結果
-                self.geocoding_cache[cache_key] = address
-                
-                return address
+                return data['results'][0]['formatted_address']
             else:
-                return f"位置: {latitude:.6f}, {longitude:.6f}"
+                return None
                 
         except Exception as e:
             self.logger.error(f"❌ 座標轉地址錯誤: {e}")
-            return f"位置: {latitude:.6f}, {longitude:.6f}"
+            return None
+
+    def _get_latest_prediction_rows(self) -> Tuple[List[Dict], Dict[str, List[int]]]:
+        """取得最新預測記錄與「目標站點 → 記錄位置」索引；摘要檔案（路徑與修改時間）未變時直接重用"""
+        latest_file = self.shock_predictor.get_latest_prediction_file()
+        if latest_file is None:
+            return [], {}
+        
+        try:
+            key = (latest_file, os.path.getmtime(latest_file))
+        except OSError:
+            return [], {}
+        
+        cached_key, records, rows_by_target = self._predictions_cache
+        if cached_key == key:
+            return records, rows_by_target
+        
+        try:
+            df = pd.read_csv(latest_file, encoding='utf-8')
+        except Exception:
+            return [], {}
+        
+        # 每個預測檔只轉換一次為記錄字典並建立索引，之後每次查詢只取附近站點的記錄
+        records = df.to_dict('records')
+        rows_by_target = {}
+        if 'target_station' in df.columns:
+            for i, target_station in enumerate(df['target_station'].tolist()):
+                rows_by_target.setdefault(target_station, []).append(i)
+        
+        if 'predicted_arrival' in df.columns:
+            self._arrival_seconds = _parse_arrival_column(df['predicted_arrival'])
+        self._predictions_cache = (key, records, rows_by_target)
+        return records, rows_by_target
+
+    def _arrival_seconds_of(self, arrival: str) -> float:
+        """預計到達時間的牆上時鐘秒數：優先使用載入預測檔時的批次解析結果"""
+        seconds = self._arrival_seconds.get(arrival)
+        if seconds is None:
+            seconds = _wall_clock_seconds(datetime.fromisoformat(arrival))
+        return seconds
+
+    def _nearest_station_indices(self, latitude: float, longitude: float, max_count: int) -> Tuple[np.ndarray, np.ndarray]:
+        """回傳最近站點的索引與距離（由近到遠），只在陣列上運算不建立字典"""
+        candidates, distances = self._stations_within(latitude, longitude, self.config['max_distance_km'])
+        
+        # 候選過多時先以 partition 取出前 max_count 近的距離門檻（保留同距離者）
+        if len(candidates) > max_count > 0:
+            kth = np.partition(distances, max_count - 1)[max_count - 1]
+            keep = distances <= kth
+            candidates, distances = candidates[keep], distances[keep]
+        
+        # 按距離排序（同距離維持站點順序）
+        order = np.argsort(distances, kind='stable')[:max_count]
+        return candidates[order], distances[order]
 
     def find_nearest_stations(self, latitude: float, longitude: float, max_count: int = 5) -> List[Dict]:
         """找到最近的站點"""
         if not self.station_locations:
             return []
         
-        distances = []
-        
-        for station_code, station_info in self.station_locations.items():
-            distance = self.calculate_distance(
-                latitude, longitude,
-                station_info['latitude'], station_info['longitude']
-            )
-            
-            if distance <= self.config['max_distance_km']:
-                station_with_distance = station_info.copy()
-                station_with_distance['distance_km'] = distance
-                distances.append(station_with_distance)
-        
-        # 按距離排序
-        distances.sort(key=lambda x: x['distance_km'])
+        idx, distances = self._nearest_station_indices(latitude, longitude, max_count)
         
-        return distances[:max_count]
+        return [{**self._stations[i].to_dict(), 'distance_km': float(d)} for i, d in zip(idx, distances)]
 
     def update_user_location(self, user_id: str, latitude: float, longitude: float, source: str = 'gps') -> bool:
         """更新用戶位置"""
@@ -320,9 +769,8 @@ class LocationBasedShockPredictor:
             # 獲取地址
             address = self.reverse_geocode(latitude, longitude)
             
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
-                cursor.execute('''
+            with self._db_lock:
+                cursor = self._conn.execute('''
                     INSERT INTO user_locations 
                     (user_id, latitude, longitude, address, update_time, source)
                     VALUES (?, ?, ?, ?, ?, ?)
@@ -334,7 +782,12 @@ class LocationBasedShockPredictor:
                     datetime.now().isoformat(),
                     source
                 ))
-                conn.commit()
+                
+                if self._rtree_available:
+                    self._conn.execute(
+                        'INSERT INTO user_locations_rtree VALUES (?, ?, ?, ?, ?)',
+                        (cursor.lastrowid, latitude, latitude, longitude, longitude)
+                    )
             
             # 更新快取
             self.location_cache[user_id] = {
@@ -362,36 +815,87 @@ class LocationBasedShockPredictor:
         
         # 從資料庫載入
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
-                cursor.execute('''
+            with self._db_lock:
+                row = self._conn.execute('''
                     SELECT latitude, longitude, address, update_time, source
                     FROM user_locations 
                     WHERE user_id = ? 
                     ORDER BY update_time DESC 
                     LIMIT 1
-                ''', (user_id,))
-                
-                row = cursor.fetchone()
-                if row:
-                    location = {
-                        'latitude': row[0],
-                        'longitude': row[1],
-                        'address': row[2],
-                        'update_time': datetime.fromisoformat(row[3]),
-                        'source': row[4]
-                    }
-                    
-                    # 更新快取
-                    self.location_cache[user_id] = location
-                    return location
+                ''', (user_id,)).fetchone()
+            
+            if row:
+                location = {
+                    'latitude': row[0],
+                    'longitude': row[1],
+                    'address': row[2],
+                    'update_time': datetime.fromisoformat(row[3]),
+                    'source': row[4]
+                }
                 
-                return None
+                # 更新快取
+                self.location_cache[user_id] = location
+                return location
+            
+            return None
                 
         except Exception as e:
             self.logger.error(f"❌ 獲取用戶位置失敗: {e}")
             return None
 
+    def find_nearby_users(self, latitude: float, longitude: float, radius_km: float = None) -> List[Dict]:
+        """找出最新位置位於指定範圍內的用戶（先以經緯度外框篩選，再以Haversine精確過濾）"""
+        radius_km = radius_km if radius_km is not None else self.config['max_distance_km']
+        
+        # 半徑換算為經緯度外框（度）
+        angular = radius_km / EARTH_RADIUS_KM
+        dlat = np.degrees(angular)
+        cos_lat = cos(radians(latitude))
+        dlng = 180.0 if angular >= np.pi / 2 or cos_lat < 1e-9 else np.degrees(np.arcsin(min(1.0, sin(angular) / cos_lat)))
+        box = (latitude - dlat, latitude + dlat, longitude - dlng, longitude + dlng)
+        
+        latest_only = '''
+            u.update_time = (SELECT MAX(update_time) FROM user_locations WHERE user_id = u.user_id)
+        '''
+        if self._rtree_available:
+            query = f'''
+                SELECT u.user_id, u.latitude, u.longitude, u.address, u.update_time
+                FROM user_locations_rtree r JOIN user_locations u ON u.id = r.id
+                WHERE r.max_lat >= ? AND r.min_lat <= ? AND r.max_lng >= ? AND r.min_lng <= ?
+                  AND {latest_only}
+            '''
+            params = (box[0], box[1], box[2], box[3])
+        else:
+            query = f'''
+                SELECT u.user_id, u.latitude, u.longitude, u.address, u.update_time
+                FROM user_locations u
+                WHERE u.latitude BETWEEN ? AND ? AND u.longitude BETWEEN ? AND ?
+                  AND {latest_only}
+            '''
+            params = box
+        
+        try:
+            with self._db_lock:
+                rows = self._conn.execute(query, params).fetchall()
+        except Exception as e:
+            self.logger.error(f"❌ 查詢附近用戶失敗: {e}")
+            return []
+        
+        nearby = {}
+        for user_id, lat, lng, address, update_time in rows:
+            distance = self.calculate_distance(latitude, longitude, lat, lng)
+            if distance <= radius_km and user_id not in nearby:
+                nearby[user_id] = {
+                    'user_id': user_id,
+                    'latitude': lat,
+                    'longitude': lng,
+                    'address': address,
+                    'update_time': update_time,
+                    'distance_km': distance
+                }
+        
+        return sorted(nearby.values(), key=lambda u: u['distance_km'])
+
     def predict_for_user_location(self, user_id: str, include_route_analysis: bool = True) -> Dict:
         """為用戶位置進行衝擊波預測"""
         # 獲取用戶位置
@@ -407,12 +911,13 @@ class LocationBasedShockPredictor:
             user_location['latitude'], 
             user_location['longitude'],
             user_id=user_id,
-            include_route_analysis=include_route_analysis
+            include_route_analysis=include_route_analysis,
+            address=user_location.get('address')
         )
 
     def predict_for_coordinates(self, latitude: float, longitude: float, user_id: str = None, 
-                              include_route_analysis: bool = True) -> Dict:
-        """為指定座標進行衝擊波預測"""
+                              include_route_analysis: bool = True, address: Optional[str] = None) -> Dict:
+        """為指定座標進行衝擊波預測（已知地址時可由 address 傳入，省去座標轉地址查詢）"""
         try:
             # 1. 找到最近的站點
             nearest_stations = self.find_nearest_stations(latitude, longitude)
@@ -425,20 +930,18 @@ class LocationBasedShockPredictor:
                 }
             
             # 2. 獲取最新的衝擊波預測
-            latest_predictions = self.shock_predictor.get_latest_predictions()
+            prediction_records, rows_by_target = self._get_latest_prediction_rows()
             
-            # 3. 過濾與用戶位置相關的預測
-            relevant_predictions = []
-            for _, prediction in latest_predictions.iterrows():
-                target_station = prediction['target_station']
-                
-                # 檢查目標站點是否在用戶附近
-                for station in nearest_stations:
-                    if station['code'] == target_station:
-                        pred_dict = prediction.to_dict()
-                        pred_dict['station_info'] = station
-                        relevant_predictions.append(pred_dict)
-                        break
+            # 3. 過濾與用戶位置相關的預測（由目標站點索引直接取出附近站點的記錄，維持預測檔原順序）
+            station_by_code = {}
+            for station in nearest_stations:
+                station_by_code.setdefault(station['code'], station)
+            
+            positions = sorted(i for code in station_by_code for i in rows_by_target.get(code, ()))
+            relevant_predictions = [
+                {**prediction_records[i], 'station_info': station_by_code[prediction_records[i]['target_station']]}
+                for i in positions
+            ]
             
             # 4. 計算風險等級
             risk_assessment = self._assess_location_risk(nearest_stations, relevant_predictions)
@@ -456,7 +959,7 @@ class LocationBasedShockPredictor:
                 'user_location': {
                     'latitude': latitude,
                     'longitude': longitude,
-                    'address': self.reverse_geocode(latitude, longitude)
+                    'address': address if address is not None else self.reverse_geocode(latitude, longitude)
                 },
                 'nearest_stations': nearest_stations,
                 'relevant_predictions': relevant_predictions,
@@ -492,38 +995,35 @@ class LocationBasedShockPredictor:
                 'summary': '目前附近路段無衝擊波預警'
             }
         
-        # 計算風險分數
-        risk_scores = []
-        warning_levels = []
+        # 計算風險分數（各因子以陣列一次計算）
+        count = len(predictions)
+        distances = np.fromiter((p['station_info']['distance_km'] for p in predictions), dtype=np.float64, count=count)
+        strengths = np.fromiter((p.get('shock_strength', 0) for p in predictions), dtype=np.float64, count=count)
+        confidences = np.fromiter((p.get('confidence', 0) for p in predictions), dtype=np.float64, count=count)
+        arrival_seconds = np.fromiter(
+            (self._arrival_seconds_of(p['predicted_arrival']) for p in predictions),
+            dtype=np.float64, count=count
+        )
         
-        for prediction in predictions:
-            # 基於距離的風險衰減
-            distance = prediction['station_info']['distance_km']
-            distance_factor = max(0.1, 1 - (distance / 20))  # 20公里外風險降到10%
-            
-            # 基於衝擊波強度的風險
-            strength = prediction.get('shock_strength', 0)
-            strength_score = min(100, strength) / 100
-            
-            # 基於信心度的調整
-            confidence = prediction.get('confidence', 0)
-            confidence_factor = confidence
-            
-            # 基於預計到達時間的緊急度
-            arrival_time = datetime.fromisoformat(prediction['predicted_arrival'])
-            time_to_arrival = (arrival_time - datetime.now()).total_seconds() / 3600  # 小時
-            urgency_factor = max(0.2, 1 - (time_to_arrival / 2))  # 2小時後緊急度降到20%
-            
-            # 綜合風險分數
-            risk_score = strength_score * distance_factor * confidence_factor * urgency_factor * 100
-            risk_scores.append(risk_score)
-            
-            # 收集預警等級
-            warning_levels.append(prediction.get('shock_level', 'INFO'))
+        # 基於距離的風險衰減：20公里外風險降到10%
+        distance_factor = np.maximum(0.1, 1 - distances / 20)
+        
+        # 基於衝擊波強度的風險
+        strength_score = np.fmin(100, strengths) / 100
+        
+        # 基於預計到達時間的緊急度：2小時後緊急度降到20%
+        time_to_arrival = (arrival_seconds - _wall_clock_seconds(datetime.now())) / 3600  # 小時
+        urgency_factor = np.maximum(0.2, 1 - time_to_arrival / 2)
+        
+        # 綜合風險分數（信心度直接作為調整因子）
+        risk_scores = strength_score * distance_factor * confidences * urgency_factor * 100
+        
+        # 收集預警等級
+        warning_levels = [p.get('shock_level', 'INFO') for p in predictions]
         
         # 計算總體風險
-        max_risk_score = max(risk_scores) if risk_scores else 0
-        avg_risk_score = np.mean(risk_scores) if risk_scores else 0
+        max_risk_score = float(risk_scores.max())
+        avg_risk_score = float(risk_scores.mean())
         
         # 總體風險等級
         if max_risk_score >= 80:
@@ -537,9 +1037,9 @@ class LocationBasedShockPredictor:
         else:
             overall_risk = 'MINIMAL'
         
-        # 最高預警等級
-        level_priority = {'mild': 1, 'moderate': 2, 'severe': 3, 'INFO': 0, 'MINOR': 1, 'MODERATE': 2, 'SEVERE': 3, 'CRITICAL': 4}
-        max_level = max(warning_levels, key=lambda x: level_priority.get(x, 0)) if warning_levels else 'INFO'
+        # 最高預警等級（以序數比較，回傳第一個達到最高序數的原始等級字串）
+        level_ranks = np.fromiter((_level_rank(level) for level in warning_levels), dtype=np.int8, count=count)
+        max_level = warning_levels[int(np.argmax(level_ranks))]
         
         return {
             'overall_risk': overall_risk,
@@ -601,8 +1101,8 @@ class LocationBasedShockPredictor:
         
         # 時間建議
         if predictions:
-            earliest_arrival = min(datetime.fromisoformat(p['predicted_arrival']) for p in predictions)
-            time_to_earliest = (earliest_arrival - datetime.now()).total_seconds() / 60
+            earliest_arrival = min(self._arrival_seconds_of(p['predicted_arrival']) for p in predictions)
+            time_to_earliest = (earliest_arrival - _wall_clock_seconds(datetime.now())) / 60
             
             if time_to_earliest > 0:
                 recommendations.append(f"⏱️ 最早衝擊波將在 {int(time_to_earliest)} 分鐘後到達")
@@ -622,74 +1122,134 @@ class LocationBasedShockPredictor:
         
         affected_stations = [p['station_info'] for p in predictions]
         
-        # 分析影響的路段
-        highways = set()
-        directions = set()
+        # 分析影響的路段（已知國道/方向以位元旗標累積，其餘依出現順序另行保留）
+        highway_mask = 0
+        direction_mask = 0
+        other_highways = {}
+        other_directions = {}
         
         for station in affected_stations:
             highway = station['code'][:3]  # 01F or 03F
             direction = station['direction']
-            highways.add(highway)
-            directions.add(direction)
+            
+            bit = HIGHWAY_BITS.get(highway, 0)
+            if bit:
+                highway_mask |= bit
+            else:
+                other_highways[highway] = None
+            
+            bit = DIRECTION_BITS.get(direction, 0)
+            if bit:
+                direction_mask |= bit
+            else:
+                other_directions[direction] = None
         
         analysis = {
             'analysis_available': True,
-            'affected_highways': list(highways),
-            'affected_directions': list(directions),
+            'affected_highways': [h for h, bit in HIGHWAY_BITS.items() if highway_mask & bit] + list(other_highways),
+            'affected_directions': [d for d, bit in DIRECTION_BITS.items() if direction_mask & bit] + list(other_directions),
             'total_affected_stations': len(affected_stations),
             'recommendations': []
         }
         
         # 生成路線建議
-        if '01F' in highways and '03F' in highways:
+        both_highways = HIGHWAY_BITS['01F'] | HIGHWAY_BITS['03F']
+        if (highway_mask & both_highways) == both_highways:
             analysis['recommendations'].append("兩條主要高速公路都受影響，建議使用平面道路")
-        elif '01F' in highways:
+        elif highway_mask & HIGHWAY_BITS['01F']:
             analysis['recommendations'].append("國道1號受影響，建議改用國道3號")
-        elif '03F' in highways:
+        elif highway_mask & HIGHWAY_BITS['03F']:
             analysis['recommendations'].append("國道3號受影響，建議改用國道1號")
         
-        if 'N' in directions and 'S' in directions:
+        both_directions = DIRECTION_BITS['N'] | DIRECTION_BITS['S']
+        if (direction_mask & both_directions) == both_directions:
             analysis['recommendations'].append("雙向車道都有影響，特別注意交通狀況")
         
         return analysis
 
     def _save_location_prediction(self, user_id: str, prediction_result: Dict):
-        """儲存位置預測結果"""
+        """儲存位置預測結果（暫存後批次寫入）"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
-                
-                user_loc = prediction_result['user_location']
-                risk = prediction_result['risk_assessment']
-                nearest = prediction_result['nearest_stations'][0] if prediction_result['nearest_stations'] else None
+            user_loc = prediction_result['user_location']
+            risk = prediction_result['risk_assessment']
+            nearest = prediction_result['nearest_stations'][0] if prediction_result['nearest_stations'] else None
+            
+            row = (
+                user_id,
+                user_loc['latitude'],
+                user_loc['longitude'],
+                nearest['code'] if nearest else None,
+                nearest['distance_km'] if nearest else None,
+                len(prediction_result['relevant_predictions']),
+                risk['max_warning_level'],
+                datetime.now().isoformat()
+            )
+            
+            with self._pred_buffer_lock:
+                self._pred_buffer.append(row)
+                flush_now = (len(self._pred_buffer) >= PREDICTION_FLUSH_ROWS or
+                             time.monotonic() - self._last_pred_flush >= PREDICTION_FLUSH_INTERVAL)
                 
-                cursor.execute('''
-                    INSERT INTO location_predictions 
-                    (user_id, user_latitude, user_longitude, nearest_station, distance_km, 
-                     prediction_count, max_warning_level, created_time)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-                ''', (
-                    user_id,
-                    user_loc['latitude'],
-                    user_loc['longitude'],
-                    nearest['code'] if nearest else None,
-                    nearest['distance_km'] if nearest else None,
-                    len(prediction_result['relevant_predictions']),
-                    risk['max_warning_level'],
-                    datetime.now().isoformat()
-                ))
-                conn.commit()
+                # 尚未達到寫入條件時排程一次延遲寫入，避免零星記錄滯留
+                if not flush_now and self._pred_flush_timer is None:
+                    self._pred_flush_timer = threading.Timer(PREDICTION_FLUSH_INTERVAL, self.flush_pending_writes)
+                    self._pred_flush_timer.daemon = True
+                    self._pred_flush_timer.start()
+            
+            if flush_now:
+                self.flush_pending_writes()
                 
         except Exception as e:
             self.logger.error(f"❌ 儲存預測結果失敗: {e}")
 
+    def flush_pending_writes(self):
+        """將暫存的位置預測記錄以單一交易批次寫入資料庫"""
+        with self._pred_buffer_lock:
+            rows, self._pred_buffer = self._pred_buffer, []
+            self._last_pred_flush = time.monotonic()
+            if self._pred_flush_timer is not None:
+                self._pred_flush_timer.cancel()
+                self._pred_flush_timer = None
+        
+        if not rows:
+            return
+        
+        try:
+            with self._db_lock:
+                self._conn.execute('BEGIN')
+                try:
+                    self._conn.executemany('''
+                        INSERT INTO location_predictions 
+                        (user_id, user_latitude, user_longitude, nearest_station, distance_km, 
+                         prediction_count, max_warning_level, created_time)
+                        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                    ''', rows)
+                    self._conn.execute('COMMIT')
+                except Exception:
+                    self._conn.execute('ROLLBACK')
+                    raise
+                    
+        except Exception as e:
+            self.logger.error(f"❌ 儲存預測結果失敗（{len(rows)} 筆）: {e}")
+
     def analyze_route_with_coordinates(self, origin_lat: float, origin_lng: float, 
-                                     dest_lat: float, dest_lng: float, user_id: str = None) -> Dict:
-        """分析指定起終點的路線"""
+                                     dest_lat: float, dest_lng: float, user_id: str = None,
+                                     origin_address: Optional[str] = None,
+                                     dest_address: Optional[str] = None) -> Dict:
+        """分析指定起終點的路線（已知起終點地址時可直接傳入）"""
         try:
-            # 1. 獲取起點和終點的預測
-            origin_prediction = self.predict_for_coordinates(origin_lat, origin_lng, include_route_analysis=False)
-            dest_prediction = self.predict_for_coordinates(dest_lat, dest_lng, include_route_analysis=False)
+            # 1. 獲取起點和終點的預測（兩者互不相依，並行執行）
+            origin_future = self._executor.submit(self.predict_for_coordinates, origin_lat, origin_lng,
+                                                  include_route_analysis=False, address=origin_address)
+            dest_future = self._executor.submit(self.predict_for_coordinates, dest_lat, dest_lng,
+                                                include_route_analysis=False, address=dest_address)
+            origin_prediction, dest_prediction = origin_future.result(), dest_future.result()
+            
+            # 起終點地址沿用預測時已取得者，每個端點只查詢一次
+            if origin_address is None:
+                origin_address = self._resolved_address(origin_prediction, origin_lat, origin_lng)
+            if dest_address is None:
+                dest_address = self._resolved_address(dest_prediction, dest_lat, dest_lng)
             
             # 2. 路線沿途站點分析（簡化版）
             route_stations = self._find_route_stations(origin_lat, origin_lng, dest_lat, dest_lng)
@@ -721,12 +1281,12 @@ class LocationBasedShockPredictor:
                 'origin': {
                     'latitude': origin_lat,
                     'longitude': origin_lng,
-                    'address': self.reverse_geocode(origin_lat, origin_lng)
+                    'address': origin_address
                 },
                 'destination': {
                     'latitude': dest_lat,
                     'longitude': dest_lng,
-                    'address': self.reverse_geocode(dest_lat, dest_lng)
+                    'address': dest_address
                 },
                 'route_stations': route_stations,
                 'route_predictions': unique_predictions,
@@ -748,35 +1308,38 @@ class LocationBasedShockPredictor:
                 'error': f'路線分析發生錯誤: {str(e)}'
             }
 
+    def _resolved_address(self, prediction: Dict, latitude: float, longitude: float) -> Optional[str]:
+        """取出預測結果中已解析的地址；預測失敗（結果不含地址）時才另行查詢"""
+        address = prediction.get('user_location', {}).get('address')
+        return address if address is not None else self.reverse_geocode(latitude, longitude)
+
     def _find_route_stations(self, origin_lat: float, origin_lng: float, 
                            dest_lat: float, dest_lng: float) -> List[Dict]:
         """找出路線沿途的站點（簡化版）"""
         # 簡化的實作：找出起終點附近的所有站點
         # 在實際應用中，可以使用Google Maps Roads API獲取精確的路線站點
         
-        origin_stations = self.find_nearest_stations(origin_lat, origin_lng, max_count=10)
-        dest_stations = self.find_nearest_stations(dest_lat, dest_lng, max_count=10)
-        
-        # 合併並去重
-        all_stations = origin_stations + dest_stations
-        seen_codes = set()
-        unique_stations = []
+        if not self.station_locations:
+            return []
         
-        for station in all_stations:
-            if station['code'] not in seen_codes:
-                unique_stations.append(station)
-                seen_codes.add(station['code'])
+        origin_idx, origin_dist = self._nearest_station_indices(origin_lat, origin_lng, 10)
+        dest_idx, dest_dist = self._nearest_station_indices(dest_lat, dest_lng, 10)
         
-        # 按距離起點的遠近排序
-        for station in unique_stations:
-            station['distance_from_origin'] = self.calculate_distance(
-                origin_lat, origin_lng,
-                station['latitude'], station['longitude']
-            )
+        # 合併並去重（以站點索引去重，起點附近者優先），最後才建立站點字典
+        all_idx = np.concatenate([origin_idx, dest_idx])
+        all_dist = np.concatenate([origin_dist, dest_dist])
+        _, first = np.unique(all_idx, return_index=True)
+        first.sort()
+        unique_idx, unique_dist = all_idx[first], all_dist[first]
         
-        unique_stations.sort(key=lambda x: x['distance_from_origin'])
+        # 按距離起點的遠近排序（一次向量化計算所有候選站點到起點的距離）
+        from_origin = self._distances_to_stations(origin_lat, origin_lng, unique_idx)
+        order = np.argsort(from_origin, kind='stable')
         
-        return unique_stations
+        return [
+            {**self._stations[i].to_dict(), 'distance_km': float(d), 'distance_from_origin': float(o)}
+            for i, d, o in zip(unique_idx[order], unique_dist[order], from_origin[order])
+        ]
 
     def _assess_route_risk(self, predictions: List[Dict]) -> Dict:
         """評估路線風險"""
@@ -789,21 +1352,14 @@ class LocationBasedShockPredictor:
             }
         
         # 計算路線總風險
-        risk_scores = []
-        severe_count = 0
-        
-        for prediction in predictions:
-            strength = prediction.get('shock_strength', 0)
-            confidence = prediction.get('confidence', 0)
-            
-            risk_score = strength * confidence
-            risk_scores.append(risk_score)
-            
-            if prediction.get('shock_level') in ['severe', 'SEVERE', 'CRITICAL']:
-                severe_count += 1
+        count = len(predictions)
+        strengths = np.fromiter((p.get('shock_strength', 0) for p in predictions), dtype=np.float64, count=count)
+        confidences = np.fromiter((p.get('confidence', 0) for p in predictions), dtype=np.float64, count=count)
+        level_ranks = np.fromiter((_level_rank(p.get('shock_level')) for p in predictions), dtype=np.int8, count=count)
         
-        avg_risk = np.mean(risk_scores) if risk_scores else 0
-        max_risk = max(risk_scores) if risk_scores else 0
+        risk_fn = _route_risk_kernel if count >= ROUTE_RISK_JIT_MIN else _route_risk_python
+        max_risk, avg_risk, severe_count = risk_fn(strengths, confidences, level_ranks, _SEVERE_RANK)
+        max_risk, avg_risk, severe_count = float(max_risk), float(avg_risk), int(severe_count)
         
         # 路線風險等級
         if max_risk >= 70 or severe_count >= 2:
@@ -843,8 +1399,8 @@ class LocationBasedShockPredictor:
         
         # 時間建議
         if predictions:
-            earliest_impact = min(datetime.fromisoformat(p['predicted_arrival']) for p in predictions)
-            time_to_impact = (earliest_impact - datetime.now()).total_seconds() / 60
+            earliest_impact = min(self._arrival_seconds_of(p['predicted_arrival']) for p in predictions)
+            time_to_impact = (earliest_impact - _wall_clock_seconds(datetime.now())) / 60
             
             if time_to_impact > 0:
                 recommendations.append(f"⏰ 建議在 {int(time_to_impact)} 分鐘內完成通行")
@@ -853,23 +1409,20 @@ class LocationBasedShockPredictor:
 
     def _save_route_analysis(self, user_id: str, analysis_result: Dict):
         """儲存路線分析結果"""
+        self._save_route_analyses(user_id, [analysis_result])
+
+    def _save_route_analyses(self, user_id: str, analysis_results: List[Dict]):
+        """以單一交易批次儲存多筆路線分析結果"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
-                
+            rows = []
+            for analysis_result in analysis_results:
                 origin = analysis_result['origin']
                 dest = analysis_result['destination']
                 risk = analysis_result['route_risk']
                 
                 affected_stations = [p['target_station'] for p in analysis_result['route_predictions']]
                 
-                cursor.execute('''
-                    INSERT INTO route_analysis 
-                    (user_id, origin_lat, origin_lng, destination_lat, destination_lng,
-                     route_stations, total_distance_km, estimated_duration_minutes,
-                     affected_stations, warning_summary, created_time)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                ''', (
+                rows.append((
                     user_id,
                     origin['latitude'],
                     origin['longitude'],
@@ -882,11 +1435,36 @@ class LocationBasedShockPredictor:
                     risk['summary'],
                     datetime.now().isoformat()
                 ))
-                conn.commit()
+            
+            if not rows:
+                return
+            
+            with self._db_lock:
+                self._conn.execute('BEGIN')
+                try:
+                    self._conn.executemany('''
+                        INSERT INTO route_analysis 
+                        (user_id, origin_lat, origin_lng, destination_lat, destination_lng,
+                         route_stations, total_distance_km, estimated_duration_minutes,
+                         affected_stations, warning_summary, created_time)
+                        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                    ''', rows)
+                    self._conn.execute('COMMIT')
+                except Exception:
+                    self._conn.execute('ROLLBACK')
+                    raise
                 
         except Exception as e:
             self.logger.error(f"❌ 儲存路線分析失敗: {e}")
 
+    def close(self):
+        """寫入暫存記錄後關閉資料庫連線與 HTTP 連線池"""
+        self.flush_pending_writes()
+        atexit.unregister(self.flush_pending_writes)
+        with self._db_lock:
+            self._conn.close()
+        self.http_session.close()
+
 
 def main():
     """主函數"""
@@ -3,6 +3,7 @@ import numpy as np
 import matplotlib.pyplot as plt
 from datetime import datetime, timedelta
 import warnings
+from collections import Counter, defaultdict
 warnings.filterwarnings('ignore')
 
 # 設定中文字體
@@ -12,6 +13,17 @@ plt.rcParams['axes.unicode_minus'] = False
 # 導入我們已經驗證的震波檢測器
 from ..detection.final_optimized_detector import FinalOptimizedShockDetector
 
+# 震波等級對應的整數等級
+LEVEL_RANK = {'mild': 1, 'moderate': 2, 'severe': 3}
+
+
+def _distance_value(value):
+    """將 float32 距離轉回最短十進位表示的 float（如 37.4 而非 37.400001525878906）
+    
+    dis.csv 的距離至多約 7 位有效數字，float32 的最短表示即可還原，不會帶入捨入雜訊
+    """
+    return float(np.format_float_positional(value, unique=True, trim='-'))
+
 class RealDataShockWavePropagationAnalyzer:
     """
     基於實際資料的震波傳播分析器
@@ -36,12 +48,19 @@ class RealDataShockWavePropagationAnalyzer:
         
         # 建立站點映射
         self.station_info = self._build_station_mapping()
+        self._build_station_arrays()
+        
+        # 建立距離矩陣（站點ID → 矩陣索引）
+        self.dist, self.id_to_idx = self._build_distance_array()
+        
+        # 建立鄰接索引
+        self.adjacency = self._build_adjacency()
         
-        # 建立距離查詢字典
-        self.distance_lookup = self._build_distance_lookup()
+        # (國道, 方向) → 依里程排序的站點序列
+        self._sequences = {}
         
         print(f"成功建立 {len(self.station_info)} 個站點的資訊")
-        print(f"成功建立 {len(self.distance_lookup)} 個站點對的距離資訊")
+        print(f"成功建立 {int(np.count_nonzero(~np.isnan(self.dist)))} 個站點對的距離資訊")
     
     def _build_station_mapping(self):
         """建立站點映射字典"""
@@ -57,6 +76,13 @@ class RealDataShockWavePropagationAnalyzer:
             # 例如：01F-034.0N -> 01F0340N
             clean_code = station_code.replace('-', '').replace('.', '')
             
+            # 從 01F0340N 中提取里程 034.0
+            try:
+                mileage_str = clean_code[3:7]  # 0340
+                mileage = float(mileage_str[:-1] + '.' + mileage_str[-1])
+            except (ValueError, IndexError):
+                mileage = 0
+            
             station_info[clean_code] = {
                 'id': row['ID'],
                 'direction': row['方向'],
@@ -64,29 +90,60 @@ class RealDataShockWavePropagationAnalyzer:
                 'start_ic': row['交流道(起)'],
                 'end_ic': row['交流道(迄)'],
                 'latitude': row['緯度(北緯)'],
-                'longitude': row['經度(東經)']
+                'longitude': row['經度(東經)'],
+                'freeway': clean_code[:3],
+                'mileage': mileage
             }
         
+        # 站點ID → 站點編號的反查表（同一ID保留第一個編號）
+        self.id_to_code = {}
+        for code, info in station_info.items():
+            self.id_to_code.setdefault(info['id'], code)
+        
         return station_info
     
-    def _build_distance_lookup(self):
-        """建立距離查詢字典"""
-        distance_lookup = {}
-        
+    def _build_station_arrays(self):
+        """將常用站點欄位存成平行 NumPy 陣列（station_info 保留供顯示使用）"""
+        infos = list(self.station_info.values())
+        self._codes = np.array(list(self.station_info.keys()))
+        self._id = np.array([info['id'] for info in infos], dtype=np.int32)
+        self._mileage = np.array([info['mileage'] for info in infos], dtype=np.float32)
+        self._freeway = np.array([info['freeway'] for info in infos], dtype='S3')
+        self._direction = np.array([str(info['direction']) for info in infos], dtype='S1')
+        self._lat = np.array([info['latitude'] for info in infos], dtype=np.float64)
+        self._lon = np.array([info['longitude'] for info in infos], dtype=np.float64)
+    
+    def _build_distance_array(self):
+        """建立 float32 距離矩陣與站點ID → 索引的對照表（無距離者為 NaN）"""
         # 距離矩陣的第一行和第一列是站點ID
-        station_ids = self.distance_matrix.iloc[0, :].values
-        
-        for i in range(1, len(station_ids)):
-            for j in range(1, len(station_ids)):
-                if i != j:
-                    station_i = int(station_ids[i])
-                    station_j = int(station_ids[j])
-                    distance = self.distance_matrix.iloc[i, j]
-                    
-                    if not pd.isna(distance) and distance > 0:
-                        distance_lookup[(station_i, station_j)] = distance
+        station_ids = self.distance_matrix.iloc[0, 1:].to_numpy()
+        id_to_idx = {int(station_id): idx for idx, station_id in enumerate(station_ids)}
+        
+        dist = self.distance_matrix.iloc[1:, 1:].to_numpy(dtype=np.float32)
+        dist[~(dist > 0)] = np.nan
+        np.fill_diagonal(dist, np.nan)
         
-        return distance_lookup
+        return dist, id_to_idx
+    
+    def _build_adjacency(self):
+        """建立站點ID → [(相連站點編號, 距離), ...] 的鄰接索引"""
+        adjacency = defaultdict(list)
+        
+        idx_to_id = {idx: station_id for station_id, idx in self.id_to_idx.items()}
+        
+        for i, j in np.argwhere(~np.isnan(self.dist)):
+            id1, id2 = idx_to_id.get(i), idx_to_id.get(j)
+            if id1 is None or id2 is None:
+                continue
+            distance = _distance_value(self.dist[i, j])
+            code1 = self.id_to_code.get(id1)
+            code2 = self.id_to_code.get(id2)
+            if code2 is not None:
+                adjacency[id1].append((code2, distance))
+            if code1 is not None:
+                adjacency[id2].append((code1, distance))
+        
+        return dict(adjacency)
     
     def get_station_distance(self, station1, station2):
         """獲取兩個站點間的距離"""
@@ -98,7 +155,13 @@ class RealDataShockWavePropagationAnalyzer:
             return None
         
         # 查詢距離
-        return self.distance_lookup.get((id1, id2))
+        i = self.id_to_idx.get(id1)
+        j = self.id_to_idx.get(id2)
+        if i is None or j is None:
+            return None
+        
+        distance = self.dist[i, j]
+        return None if np.isnan(distance) else _distance_value(distance)
     
     def get_connected_stations(self, station):
         """獲取與指定站點直接相連的站點"""
@@ -106,42 +169,20 @@ class RealDataShockWavePropagationAnalyzer:
         if station_id is None:
             return []
         
-        connected = []
-        for (id1, id2), distance in self.distance_lookup.items():
-            if id1 == station_id:
-                # 找到對應的站點編號
-                for code, info in self.station_info.items():
-                    if info['id'] == id2:
-                        connected.append((code, distance))
-                        break
-            elif id2 == station_id:
-                # 找到對應的站點編號
-                for code, info in self.station_info.items():
-                    if info['id'] == id1:
-                        connected.append((code, distance))
-                        break
-        
-        return connected
+        return list(self.adjacency.get(station_id, []))
     
     def get_freeway_sequence(self, freeway='01F', direction='N'):
         """獲取特定國道的站點序列"""
-        stations = []
-        
-        for code, info in self.station_info.items():
-            if code.startswith(freeway) and info['direction'] == direction:
-                stations.append(code)
-        
-        # 按照里程排序（從站點編號中提取）
-        def extract_mileage(code):
-            # 從 01F0340N 中提取 034.0
-            try:
-                mileage_str = code[3:7]  # 0340
-                return float(mileage_str[:-1] + '.' + mileage_str[-1])
-            except:
-                return 0
-        
-        stations.sort(key=extract_mileage)
-        return stations
+        key = (freeway, direction)
+        if key not in self._sequences:
+            idx = np.where((self._freeway == freeway.encode()) &
+                           (self._direction == direction.encode()))[0]
+            # 按照里程排序
+            idx = idx[np.argsort(self._mileage[idx], kind='stable')]
+            stations = self._codes[idx].tolist()
+            self._sequences[key] = stations
+        
+        return list(self._sequences[key])
     
     def analyze_real_data_propagation(self, df):
         """
@@ -159,6 +200,12 @@ class RealDataShockWavePropagationAnalyzer:
         
         all_results = {}
         
+        # 震波起始時間只有時分，與原本解析 "HH:MM" 相同以今日日期補齊
+        today = np.datetime64(datetime.now().date(), 'ns')
+        
+        # 所有站點只排序一次、一次批次檢測，各方向再依站點取用
+        shocks_by_station = self.detector.detect_shocks_by_station(df)
+        
         for freeway, direction, name in all_directions:
             print(f"\n=== 分析 {name} ===")
             
@@ -178,29 +225,49 @@ class RealDataShockWavePropagationAnalyzer:
             
             # 1. 為每個站點檢測震波
             station_shocks = {}
+            shock_arrays = {}
             
             print(f"\n  步驟1: {name} 各站點震波檢測")
             for i, station in enumerate(station_sequence):
                 print(f"    分析站點 {station} ({i+1}/{len(station_sequence)})")
                 
-                station_data = df[df['station'] == station].sort_values(['date', 'hour', 'minute'])
-                
-                if len(station_data) > 0:
-                    shocks = self.detector.detect_significant_shocks(station_data)
+                if station in shocks_by_station:
+                    shocks = shocks_by_station[station]
+                    
+                    # 起始時間 HH:MM 換算為今日零時起的分鐘數，存為 datetime64 供比對與預測使用
+                    minutes = np.fromiter(
+                        (int(s['start_time'][:2]) * 60 + int(s['start_time'][3:]) for s in shocks),
+                        dtype=np.int64, count=len(shocks)
+                    )
+                    start_times = today + minutes.astype('timedelta64[m]')
+                    for shock, t64 in zip(shocks, start_times):
+                        shock['_t64'] = t64
+                    
                     station_shocks[station] = shocks
                     print(f"      發現 {len(shocks)} 個震波事件")
                 else:
                     station_shocks[station] = []
                     print(f"      無資料")
+                
+                shock_arrays[station] = self._build_shock_arrays(station_shocks[station])
             
             # 2. 分析震波傳播軌跡
             print(f"\n  步驟2: {name} 震波傳播軌跡分析")
-            propagation_events = self._trace_real_propagation(station_shocks, station_sequence)
+            propagation_events = self._trace_real_propagation(
+                station_shocks, shock_arrays, station_sequence
+            )
             
             # 3. 計算傳播統計
             print(f"\n  步驟3: {name} 傳播統計計算")
             propagation_stats = self._calculate_real_propagation_stats(propagation_events)
             
+            # 序列起點到各站點的累積距離（缺少距離的路段以 0 計）
+            segment_distances = np.array([
+                self.get_station_distance(a, b) or 0.0
+                for a, b in zip(station_sequence, station_sequence[1:])
+            ], dtype=np.float64)
+            cum_dist = np.concatenate(([0.0], np.cumsum(segment_distances)))
+            
             # 儲存該方向的結果
             direction_key = f"{freeway}_{direction}"
             all_results[direction_key] = {
@@ -208,7 +275,8 @@ class RealDataShockWavePropagationAnalyzer:
                 'station_sequence': station_sequence,
                 'station_shocks': station_shocks,
                 'propagation_events': propagation_events,
-                'propagation_stats': propagation_stats
+                'propagation_stats': propagation_stats,
+                'cum_dist': cum_dist
             }
         
         return {
@@ -216,7 +284,17 @@ class RealDataShockWavePropagationAnalyzer:
             'station_info': self.station_info
         }
     
-    def _trace_real_propagation(self, station_shocks, station_sequence):
+    def _build_shock_arrays(self, shocks):
+        """將站點震波的比對欄位抽成 NumPy 陣列（每站只做一次）"""
+        return {
+            't': np.array([s['_t64'] for s in shocks], dtype='datetime64[ns]'),
+            'drop': np.array([s['speed_drop'] for s in shocks], dtype=np.float64),
+            'strength': np.array([s['shock_strength'] for s in shocks], dtype=np.float64),
+            'duration': np.array([s['duration'] for s in shocks], dtype=np.float64),
+            'level': np.array([LEVEL_RANK[s['level']] for s in shocks], dtype=np.int8)
+        }
+    
+    def _trace_real_propagation(self, station_shocks, shock_arrays, station_sequence):
         """基於實際距離追蹤震波傳播"""
         propagation_events = []
         
@@ -242,7 +320,9 @@ class RealDataShockWavePropagationAnalyzer:
             
             # 匹配震波傳播事件
             matches = self._match_real_shock_events(
-                upstream_shocks, downstream_shocks, upstream, downstream, distance
+                upstream_shocks, downstream_shocks,
+                shock_arrays[upstream], shock_arrays[downstream],
+                upstream, downstream, distance
             )
             
             propagation_events.extend(matches)
@@ -250,84 +330,61 @@ class RealDataShockWavePropagationAnalyzer:
         
         return propagation_events
     
-    def _match_real_shock_events(self, upstream_shocks, downstream_shocks, 
+    def _match_real_shock_events(self, upstream_shocks, downstream_shocks,
+                                up_arr, down_arr,
                                 upstream_station, downstream_station, distance):
-        """基於實際資料匹配震波事件"""
-        matches = []
+        """基於實際資料匹配震波事件（上下游震波兩兩比對以廣播運算）"""
+        if not upstream_shocks or not downstream_shocks:
+            return []
         
-        for up_shock in upstream_shocks:
-            up_time = pd.to_datetime(up_shock['start_time'])
-            
-            # 在合理時間窗口內尋找下游震波
-            for down_shock in downstream_shocks:
-                down_time = pd.to_datetime(down_shock['start_time'])
-                
-                # 時間差（分鐘）
-                time_diff = (down_time - up_time).total_seconds() / 60
-                
-                # 震波應該向下游傳播，時間差應為正
-                if 0 < time_diff < 180:  # 3小時內
-                    # 檢查震波特徵相似性
-                    if self._is_similar_shock_real(up_shock, down_shock):
-                        # 計算實際傳播速度
-                        propagation_speed = distance / (time_diff / 60)  # km/h
-                        
-                        # 合理的傳播速度範圍：2-80 km/h
-                        if 2 <= propagation_speed <= 80:
-                            similarity = self._calculate_similarity_real(up_shock, down_shock)
-                            
-                            match = {
-                                'upstream_station': upstream_station,
-                                'downstream_station': downstream_station,
-                                'upstream_shock': up_shock,
-                                'downstream_shock': down_shock,
-                                'real_distance': distance,
-                                'time_diff': time_diff,
-                                'propagation_speed': propagation_speed,
-                                'upstream_time': up_time,
-                                'downstream_time': down_time,
-                                'similarity_score': similarity,
-                                'upstream_info': self.station_info[upstream_station],
-                                'downstream_info': self.station_info[downstream_station]
-                            }
-                            
-                            matches.append(match)
+        # 時間差（分鐘），列為上游、欄為下游
+        time_diff = (down_arr['t'][None, :] - up_arr['t'][:, None]) / np.timedelta64(1, 'm')
         
-        # 去除重複和衝突的匹配
-        return self._filter_best_matches_real(matches)
-    
-    def _is_similar_shock_real(self, shock1, shock2):
-        """判斷兩個震波是否相似（基於實際資料）"""
-        # 速度下降差異
-        speed_diff = abs(shock1['speed_drop'] - shock2['speed_drop'])
+        # 震波應該向下游傳播，時間差應為正，且在3小時內
+        mask = (time_diff > 0) & (time_diff < 180)
         
-        # 等級相似性
-        level_similarity = shock1['level'] == shock2['level']
+        # 震波特徵相似性：速度下降差異 < 20 km/h，且等級相同或強度差異 < 25%
+        drop_diff = np.abs(up_arr['drop'][:, None] - down_arr['drop'][None, :])
+        strength_diff = np.abs(up_arr['strength'][:, None] - down_arr['strength'][None, :])
+        level_diff = np.abs(up_arr['level'][:, None] - down_arr['level'][None, :]).astype(np.float64)
+        mask &= (drop_diff < 20) & ((level_diff == 0) | (strength_diff < 25))
         
-        # 強度相似性
-        strength_diff = abs(shock1['shock_strength'] - shock2['shock_strength'])
-        
-        return (speed_diff < 20 and  # 速度下降差異 < 20 km/h
-                (level_similarity or strength_diff < 25))  # 等級相同或強度差異 < 25%
-    
-    def _calculate_similarity_real(self, shock1, shock2):
-        """計算震波相似度分數（基於實際資料）"""
-        # 速度下降相似度
-        speed_sim = 1 - min(abs(shock1['speed_drop'] - shock2['speed_drop']) / 60, 1)
+        # 實際傳播速度 (km/h)，合理範圍：2-80 km/h
+        with np.errstate(divide='ignore', invalid='ignore'):
+            propagation_speed = distance / (time_diff / 60)
+        mask &= (propagation_speed >= 2) & (propagation_speed <= 80)
         
-        # 強度相似度
-        strength_sim = 1 - min(abs(shock1['shock_strength'] - shock2['shock_strength']) / 100, 1)
+        if not mask.any():
+            return []
         
-        # 等級相似度
-        level_weights = {'mild': 1, 'moderate': 2, 'severe': 3}
-        level_diff = abs(level_weights[shock1['level']] - level_weights[shock2['level']])
-        level_sim = 1 - min(level_diff / 2, 1)
+        # 綜合相似度
+        duration_diff = np.abs(up_arr['duration'][:, None] - down_arr['duration'][None, :])
+        similarity = (
+            (1 - np.minimum(drop_diff / 60, 1)) * 0.3 +
+            (1 - np.minimum(strength_diff / 100, 1)) * 0.25 +
+            (1 - np.minimum(level_diff / 2, 1)) * 0.25 +
+            (1 - np.minimum(duration_diff / 60, 1)) * 0.2
+        )
         
-        # 持續時間相似度
-        duration_sim = 1 - min(abs(shock1['duration'] - shock2['duration']) / 60, 1)
+        matches = []
+        for i, j in np.argwhere(mask):
+            matches.append({
+                'upstream_station': upstream_station,
+                'downstream_station': downstream_station,
+                'upstream_shock': upstream_shocks[i],
+                'downstream_shock': downstream_shocks[j],
+                'real_distance': distance,
+                'time_diff': float(time_diff[i, j]),
+                'propagation_speed': float(propagation_speed[i, j]),
+                'upstream_time': pd.Timestamp(up_arr['t'][i]),
+                'downstream_time': pd.Timestamp(down_arr['t'][j]),
+                'similarity_score': float(similarity[i, j]),
+                'upstream_info': self.station_info[upstream_station],
+                'downstream_info': self.station_info[downstream_station]
+            })
         
-        # 綜合相似度
-        return (speed_sim * 0.3 + strength_sim * 0.25 + level_sim * 0.25 + duration_sim * 0.2)
+        # 去除重複和衝突的匹配
+        return self._filter_best_matches_real(matches)
     
     def _filter_best_matches_real(self, matches):
         """過濾最佳匹配（基於實際資料）"""
@@ -358,18 +415,23 @@ class RealDataShockWavePropagationAnalyzer:
         if not propagation_events:
             return {}
         
-        df = pd.DataFrame(propagation_events)
+        n = len(propagation_events)
+        speeds = np.fromiter((e['propagation_speed'] for e in propagation_events), dtype=np.float64, count=n)
+        time_diffs = np.fromiter((e['time_diff'] for e in propagation_events), dtype=np.float64, count=n)
+        distances = np.fromiter((e['real_distance'] for e in propagation_events), dtype=np.float64, count=n)
+        similarities = np.fromiter((e['similarity_score'] for e in propagation_events), dtype=np.float64, count=n)
+        station_pairs = Counter((e['upstream_station'], e['downstream_station']) for e in propagation_events)
         
         stats = {
-            'total_propagations': len(propagation_events),
-            'avg_propagation_speed': df['propagation_speed'].mean(),
-            'speed_std': df['propagation_speed'].std(),
-            'avg_time_diff': df['time_diff'].mean(),
-            'avg_real_distance': df['real_distance'].mean(),
-            'avg_similarity': df['similarity_score'].mean(),
-            'speed_range': (df['propagation_speed'].min(), df['propagation_speed'].max()),
-            'distance_range': (df['real_distance'].min(), df['real_distance'].max()),
-            'by_station_pair': df.groupby(['upstream_station', 'downstream_station']).size().to_dict()
+            'total_propagations': n,
+            'avg_propagation_speed': float(speeds.mean()),
+            'speed_std': float(speeds.std(ddof=1)) if n > 1 else float('nan'),
+            'avg_time_diff': float(time_diffs.mean()),
+            'avg_real_distance': float(distances.mean()),
+            'avg_similarity': float(similarities.mean()),
+            'speed_range': (float(speeds.min()), float(speeds.max())),
+            'distance_range': (float(distances.min()), float(distances.max())),
+            'by_station_pair': dict(sorted(station_pairs.items()))
         }
         
         return stats
@@ -390,6 +452,8 @@ class RealDataShockWavePropagationAnalyzer:
         
         target_idx = station_sequence.index(target_station)
         
+        cum_dist = direction_results['cum_dist']
+        
         predictions = []
         
         # 檢查所有上游站點的最新震波
@@ -397,16 +461,12 @@ class RealDataShockWavePropagationAnalyzer:
             upstream_station = station_sequence[i]
             upstream_shocks = direction_results['station_shocks'].get(upstream_station, [])
             
+            # 到目標站點的總距離
+            total_distance = float(cum_dist[target_idx] - cum_dist[i])
+            
             # 找到最近的震波事件
             for shock in upstream_shocks[-3:]:  # 檢查最近3個事件
-                shock_time = pd.to_datetime(shock['start_time'])
-                
-                # 計算到目標站點的總距離
-                total_distance = 0
-                for j in range(i, target_idx):
-                    distance = self.get_station_distance(station_sequence[j], station_sequence[j+1])
-                    if distance:
-                        total_distance += distance
+                shock_time = pd.Timestamp(shock['_t64'])
                 
                 if total_distance > 0:
                     # 使用平均傳播速度預測
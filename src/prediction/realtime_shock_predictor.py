@@ -500,8 +500,8 @@ class RealtimeShockPredictor:
             self.logger.info("預測系統已停止")
             self.is_running = False
 
-    def get_latest_predictions(self, max_age_minutes=30):
-        """獲取最新的預測結果"""
+    def get_latest_prediction_file(self, max_age_minutes=30):
+        """取得最新且未過期的預測摘要檔案路徑，無則回傳 None"""
         pattern = os.path.join(self.prediction_dir, "shock_predictions_summary_*.csv")
         files = glob.glob(pattern)
         
@@ -520,12 +520,18 @@ class RealtimeShockPredictor:
                 continue
         
         if not recent_files:
-            return pd.DataFrame()
+            return None
         
-        # 載入最新的檔案
         recent_files.sort(reverse=True)
-        latest_file = recent_files[0][1]
+        return recent_files[0][1]
+
+    def get_latest_predictions(self, max_age_minutes=30):
+        """獲取最新的預測結果"""
+        latest_file = self.get_latest_prediction_file(max_age_minutes)
+        if latest_file is None:
+            return pd.DataFrame()
         
+        # 載入最新的檔案
         try:
             return pd.read_csv(latest_file, encoding='utf-8')
         except:
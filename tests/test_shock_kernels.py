@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+震波掃描核心一致性測試
+以固定輸入確認 numba JIT 核心與 NumPy / 純Python 路徑結果相同，
+並以逐一比對的參考實作檢查兩個去重方法
+"""
+
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src', 'detection'))
+
+import final_optimized_detector as fod  # noqa: E402
+import trafficWave as tw  # noqa: E402
+
+requires_numba = pytest.mark.skipif(not fod.NUMBA_AVAILABLE, reason='需要 numba')
+
+
+def _station_series(seed, n=400):
+    """固定亂數種子產生的單站速度 / 流量 / 時間序列（含間隔與跨日）"""
+    rng = np.random.default_rng(seed)
+    speed = np.clip(80 + np.cumsum(rng.normal(0, 12, n)), 5, 110)
+    flow = rng.uniform(20, 200, n)
+    time_of_day = np.cumsum(rng.choice([5, 5, 5, 10, 25], n)) % 1440
+    return speed, flow, time_of_day.astype(np.int64)
+
+
+def _criteria_arrays():
+    detector = fod.FinalOptimizedShockDetector()
+    _, _, smin, smax, ismin, gmax = detector._compile_criteria()
+    return smin, smax, ismin, gmax
+
+
+def _as_pairs(hits):
+    indices, levels = hits
+    return sorted(zip(np.asarray(indices).tolist(), np.asarray(levels).tolist()))
+
+
+@requires_numba
+@pytest.mark.parametrize('seed', [0, 1, 2])
+def test_scan_shock_pairs_jit_matches_numpy(seed):
+    speed, _, time_of_day = _station_series(seed)
+    criteria = _criteria_arrays()
+
+    expected = _as_pairs(fod._scan_shock_pairs_numpy(speed, time_of_day, *criteria))
+
+    assert expected
+    assert _as_pairs(fod._scan_shock_pairs_jit(speed, time_of_day, *criteria)) == expected
+
+
+def test_scan_thresholds_compare_in_float64():
+    # 35.3-25.3 在 float64 為 9.999999999999996，未達 mild 的 10 km/h 門檻
+    speed = np.array([35.3, 25.3])
+    time_of_day = np.array([0, 5], dtype=np.int64)
+    criteria = _criteria_arrays()
+
+    assert _as_pairs(fod._scan_shock_pairs_numpy(speed, time_of_day, *criteria)) == []
+    if fod.NUMBA_AVAILABLE:
+        assert _as_pairs(fod._scan_shock_pairs_jit(speed, time_of_day, *criteria)) == []
+
+
+def test_result_cache_distinguishes_float64_inputs():
+    # 兩筆速度在 float32 下相同，但只有第二筆達到 mild 門檻，不可共用快取結果
+    detector = fod.FinalOptimizedShockDetector()
+
+    def detect(final_speed):
+        df = pd.DataFrame({'median_speed': [35.3, final_speed], 'flow': [100.0, 100.0],
+                           'hour': [0, 0], 'minute': [0, 5]})
+        return detector._detect_from_arrays(detector._prepare_arrays(df), 'S1')
+
+    assert detect(25.3) == []
+    assert len(detect(25.299999999999)) == 1
+
+
+@requires_numba
+def test_scan_all_stations_jit_matches_per_station_numpy():
+    series = [_station_series(seed, n) for seed, n in [(3, 250), (4, 1), (5, 0), (6, 400)]]
+    speed = np.concatenate([s for s, _, _ in series])
+    time_of_day = np.concatenate([t for _, _, t in series])
+    bounds = np.r_[0, np.cumsum([len(s) for s, _, _ in series])].astype(np.int64)
+    criteria = _criteria_arrays()
+
+    indices, levels, counts = fod._scan_all_stations_jit(speed, time_of_day, bounds, *criteria)
+
+    n_levels = len(criteria[0])
+    for k in range(len(series)):
+        start, end = bounds[k], bounds[k + 1]
+        offset = start * n_levels
+        got = (indices[offset:offset + counts[k]], levels[offset:offset + counts[k]])
+        expected = fod._scan_shock_pairs_numpy(speed[start:end], time_of_day[start:end], *criteria)
+        assert _as_pairs(got) == _as_pairs(expected)
+
+
+@requires_numba
+@pytest.mark.parametrize('seed', [0, 7])
+def test_scan_strict_shocks_jit_matches_python(seed, monkeypatch):
+    speed, flow, _ = _station_series(seed)
+    detector = tw.RefinedTrafficShockWaveDetector()
+    arrs = tw.DetectionArrays(speed=speed, density=detector.calculate_density(flow, speed), flow=flow)
+
+    total_hits = 0
+    for criteria in detector.shock_criteria.values():
+        jit_hits = detector._scan_strict_shocks(arrs, criteria)
+        monkeypatch.setattr(tw, 'NUMBA_AVAILABLE', False)
+        python_hits = detector._scan_strict_shocks(arrs, criteria)
+        monkeypatch.setattr(tw, 'NUMBA_AVAILABLE', True)
+
+        assert jit_hits == python_hits
+        total_hits += len(jit_hits)
+
+    assert total_hits > 0
+
+
+def _relaxed_dedup_reference(shocks):
+    """依速度下降排序後，與所有已保留事件逐一比對重疊"""
+    kept = []
+    for shock in sorted(shocks, key=lambda x: x['speed_drop'], reverse=True):
+        if not any(shock['start_idx'] < k['end_idx'] and k['start_idx'] < shock['end_idx'] for k in kept):
+            kept.append(shock)
+    return kept
+
+
+@pytest.mark.parametrize('seed', [0, 1, 2])
+def test_relaxed_dedup_matches_reference(seed):
+    speed, flow, time_of_day = _station_series(seed)
+    df = pd.DataFrame({
+        'median_speed': speed,
+        'flow': flow,
+        'hour': time_of_day // 60,
+        'minute': time_of_day % 60
+    })
+    detector = fod.FinalOptimizedShockDetector()
+    arrays = detector._prepare_arrays(df)
+    shocks = detector._detect_gap_tolerant_shocks(arrays, detector._compile_criteria())
+
+    assert shocks
+    assert detector._remove_overlapping_shocks_relaxed(shocks) == _relaxed_dedup_reference(shocks)
+
+
+def _overlap_dedup_reference(shocks):
+    """逐一與已保留事件比對，重疊時保留較嚴重者（事件依 start_idx 排序）"""
+    filtered = []
+    for current in shocks:
+        for i, existing in enumerate(filtered):
+            if current['start_idx'] <= existing['end_idx'] and current['end_idx'] >= existing['start_idx']:
+                if current['level_rank'] > existing['level_rank']:
+                    filtered[i] = current
+                break
+        else:
+            filtered.append(current)
+    return filtered
+
+
+@pytest.mark.parametrize('seed', [0, 3, 7])
+def test_interval_sweep_dedup_matches_reference(seed):
+    speed, flow, _ = _station_series(seed)
+    detector = tw.RefinedTrafficShockWaveDetector()
+    arrs = tw.DetectionArrays(speed=speed, density=detector.calculate_density(flow, speed), flow=flow)
+
+    shocks = []
+    for level, criteria in detector.shock_criteria.items():
+        shocks.extend(detector._detect_shocks_strict(arrs, level, criteria))
+    shocks = sorted(shocks, key=lambda x: x['start_idx'])
+
+    assert shocks
+    assert detector._remove_overlapping_events(shocks) == _overlap_dedup_reference(shocks)